@@ -1,100 +1,152 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.schemas import ChatRequest, ChatResponse, FileUploadResponse
-from app.services import rag_service, pageindex_service
-import shutil
-import os
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from app.schemas import ChatRequest, ChatResponse, FileUploadResponse, JobStatusResponse
+from app.services import chat_service, ingest_jobs, llm_client, telemetry, uploads, vector_store
+from app.services.answer_cache import answer_cache
+from app.services.embedding_cache import embedding_cache
+from app.services.single_flight import single_flight
+from app.services.structure_registry import registry
+from app.services.node_index import node_index
+import asyncio
+import json
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
-    print(f"DEBUG: Received chat request - Tool: {request.tool}, Message: {request.message[:50]}...")
+    telemetry.log("chat_received", tool=request.tool, stream=False, message=request.message[:50])
     try:
-        if request.tool == "find_document":
-            print("DEBUG: Using PageIndex Service")
-            answer, sources = await pageindex_service.query(request.message)
-            return ChatResponse(response=answer, sources=sources)
-        else:
-            print(f"DEBUG: Using RAG Service (Tool: {request.tool})")
-            answer, sources = await rag_service.query(request.message)
-            return ChatResponse(response=answer, sources=sources)
+        with telemetry.trace(request.tool):
+            answer, sources = await chat_service.answer(request.tool, request.message)
+        return ChatResponse(response=answer, sources=sources)
     except Exception as e:
-        print(f"DEBUG: Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/upload", response_model=FileUploadResponse)
-async def upload_file(file: UploadFile = File(...)):
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Same as /chat, streamed as Server-Sent Events.
+    Events: start, stage updates (docs_selected / nodes_selected / pages_extracted / retrieved / cache_hit / degraded),
+    token (answer text deltas), sources, error, done.
+    """
+    telemetry.log("chat_received", tool=request.tool, stream=True, message=request.message[:50])
+
+    async def event_stream():
+        # Sent before any work starts so the client sees the first byte immediately
+        yield _sse("start", {"tool": request.tool, "request_id": telemetry.request_id()})
+        with telemetry.trace(request.tool):
+            try:
+                async for event in chat_service.answer_events(request.tool, request.message):
+                    yield _sse(event["event"], event["data"])
+            except Exception as e:
+                telemetry.mark_error(e)
+                yield _sse("error", {"detail": str(e)})
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/health")
+async def health():
     """
-    Upload PDF file and automatically process it with PageIndex.
-    Saves to lib/PageIndex/tests/pdfs and outputs to lib/PageIndex/tests/results.
+    Readiness check: vector store round-trip latency and collection state, LLM configuration,
+    loaded PageIndex structures. Returns 503 when Qdrant is unreachable.
     """
-    import subprocess
-    import asyncio
-    
-    # Validate file type
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported")
-    
-    # Save file to PageIndex tests directory
-    file_location = f"lib/PageIndex/tests/pdfs/{file.filename}"
-    
+    qdrant = await vector_store.health()
+    body = {
+        "status": "ok" if qdrant["status"] == "ok" else "degraded",
+        "vector_store": qdrant,
+        "llm_configured": bool(llm_client.OPENAI_API_KEY),
+        "pageindex_documents": registry.stats()["documents"],
+    }
+    return JSONResponse(body, status_code=200 if qdrant["status"] == "ok" else 503)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text format: request and per-stage latency histograms, LLM calls and
+    tokens, answer cache lookups (per process).
+    """
+    return PlainTextResponse(telemetry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/cache/stats")
+async def answer_cache_stats():
+    """Answer cache hit rate, evictions and latency saved by cache hits; in-flight query coalescing; embedding cache."""
+    return {**answer_cache.stats(), "coalescing": single_flight.stats(), "embeddings": embedding_cache.stats()}
+
+@router.get("/pageindex/registry")
+async def pageindex_registry_stats():
+    """Structure registry counters (hits/misses/reloads) for verifying the request path stays in memory."""
+    return registry.stats()
+
+@router.get("/pageindex/fast_path")
+async def pageindex_fast_path_stats():
+    """Node-vector fast path: lookups, confident proposals, LLM calls saved and shadow-mode agreement with tree search."""
+    return node_index.stats()
+
+# The body is parsed by uploads.receive() as it streams in, so the form is described here for /docs
+_UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object", "required": ["file"],
+    "properties": {"file": {"type": "string", "format": "binary"}},
+}}}}}
+
+@router.post("/upload", response_model=FileUploadResponse, openapi_extra=_UPLOAD_BODY)
+async def upload_file(request: Request):
+    """
+    Upload a PDF and queue it for PageIndex processing.
+    The body is streamed to disk while hashed and size-checked (UPLOAD_MAX_MB), the PDF header
+    and page count are validated, and the file is moved into the content-addressed upload store
+    and linked into lib/PageIndex/tests/pdfs. Returns a job id immediately;
+    poll /api/jobs/{job_id} until the index is written to lib/PageIndex/tests/results.
+    """
+    upload = None
     try:
-        # Ensure directory exists
-        os.makedirs("lib/PageIndex/tests/pdfs", exist_ok=True)
-        
-        # Save uploaded file
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
-        
-        # Automatically trigger PageIndex processing
-        try:
-            # Run the processing script
-            result = subprocess.run(
-                ["python", "scripts/process_pageindex.py"],
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
-            
-            # Check if processing was successful
-            if result.returncode == 0:
-                # Extract document name (without .pdf extension)
-                doc_name = os.path.splitext(file.filename)[0]
-                output_file = f"lib/PageIndex/tests/results/{doc_name}_structure.json"
-                
-                # Verify result file was created
-                if os.path.exists(output_file):
-                    return FileUploadResponse(
-                        filename=file.filename,
-                        status="success",
-                        message=f"File uploaded and processed successfully. Index saved to {output_file}"
-                    )
-                else:
-                    return FileUploadResponse(
-                        filename=file.filename,
-                        status="partial",
-                        message="File uploaded but processing output not found. Check logs."
-                    )
-            else:
-                error_msg = result.stderr if result.stderr else "Unknown processing error"
-                return FileUploadResponse(
-                    filename=file.filename,
-                    status="failed",
-                    message=f"Processing failed: {error_msg[:200]}"
-                )
-                
-        except subprocess.TimeoutExpired:
-            return FileUploadResponse(
-                filename=file.filename,
-                status="failed",
-                message="Processing timeout (exceeded 5 minutes)"
-            )
-        except Exception as proc_error:
+        upload = await uploads.receive(request.stream(), request.headers.get("content-type", ""),
+                                       request.headers.get("content-length"))
+        filename = upload.filename
+        pages = await asyncio.to_thread(uploads.validate_pdf, upload.path)
+
+        # Job lookups may read the shared SQLite state; keep them off the event loop
+        existing = await asyncio.to_thread(ingest_jobs.find_by_hash, upload.content_hash)
+        if existing:
             return FileUploadResponse(
-                filename=file.filename,
-                status="failed",
-                message=f"Processing error: {str(proc_error)}"
+                filename=filename,
+                status=existing["status"],
+                message=f"Identical file already submitted as {existing['filename']}; reusing its processing job.",
+                job_id=existing["job_id"],
             )
-            
+        if await asyncio.to_thread(ingest_jobs.active_for, filename):
+            raise uploads.UploadRejected(409, f"A different {filename} is still being processed; retry when it finishes")
+
+        blob_path = await asyncio.to_thread(uploads.store, upload)
+        file_location = await asyncio.to_thread(uploads.publish, blob_path, filename)
+        job, _ = await asyncio.to_thread(ingest_jobs.submit, file_location, filename, upload.content_hash)
+    except uploads.UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.discard()
+
+    telemetry.log("upload_received", filename=filename, bytes=upload.size, pages=pages, job_id=job["job_id"])
+    return FileUploadResponse(
+        filename=filename,
+        status=job["status"],
+        message="File uploaded. PageIndex processing has been queued.",
+        job_id=job["job_id"],
+    )
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def job_status(job_id: str):
+    """Status and progress of an ingestion job created by /api/upload."""
+    job = await asyncio.to_thread(ingest_jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatusResponse(**{k: v for k, v in job.items() if k != "content_hash"})
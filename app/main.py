@@ -1,11 +1,66 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from app.api import endpoints
+from app.services.structure_registry import registry
+from app.services import llm_client, ingest_jobs, page_store, telemetry, vector_store
+from app.services.doc_index import doc_index
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI(title="PageRAG AI Platform")
+# 匯入約 1.5 秒的 client 函式庫；在背景執行緒預先載入，之後 init_client() 的匯入不再阻塞 event loop
+_WARM_UP_MODULES = ("openai", "qdrant_client")
+
+def _import_clients():
+    for name in _WARM_UP_MODULES:
+        importlib.import_module(name)
+
+async def warm_up():
+    """Load the client libraries and create the shared clients after the server is already accepting requests."""
+    await asyncio.to_thread(_import_clients)
+    # 共用的 AsyncOpenAI client (連線池 + keep-alive)，所有 LLM / embedding 呼叫都走這裡
+    if llm_client.OPENAI_API_KEY:
+        llm_client.init_client()
+    # 共用的 Qdrant client；collection 狀態在背景定期刷新，請求路徑不再額外查詢
+    vector_store.init_client()
+    await vector_store.refresh_state()
+    vector_store.start_refresher()
+    # 文件初選的描述向量在背景建立，結構檔異動後也由背景重建，請求不必等 embedding
+    if llm_client.OPENAI_API_KEY:
+        try:
+            await doc_index.ensure_current()
+        except Exception as e:
+            print(f"Document index warm-up failed (retried in the background): {e}")
+        doc_index.start_refresher()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 啟動時一次載入所有 PageIndex 結構，之後由背景執行緒監看檔案異動
+    registry.refresh()
+    registry.start_watching()
+    # 請求若早於暖機完成，get_client() 會當場建立 client
+    warming = asyncio.create_task(warm_up())
+    yield
+    warming.cancel()
+    doc_index.stop_refresher()
+    ingest_jobs.shutdown()
+    page_store.shutdown_pool()
+    await llm_client.close_client()
+    await vector_store.close_client()
+    registry.stop_watching()
+
+app = FastAPI(title="PageRAG AI Platform", lifespan=lifespan)
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    # 每個請求一個 request id (沿用 X-Request-ID)，寫入 JSON log 並回傳給前端
+    request_id = telemetry.set_request_id(request.headers.get(telemetry.REQUEST_ID_HEADER))
+    response = await call_next(request)
+    response.headers[telemetry.REQUEST_ID_HEADER] = request_id
+    return response
 
 app.include_router(endpoints.router, prefix="/api")
 
@@ -7,8 +7,19 @@ class ChatRequest(BaseModel):
 
 class FileUploadResponse(BaseModel):
     filename: str
-    status: str  # "success", "failed", "partial"
+    status: str  # "queued", "running", "success", "failed"
     message: Optional[str] = None  # Detailed status message
+    job_id: Optional[str] = None  # Poll /api/jobs/{job_id} for processing progress
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    filename: str
+    status: str  # "queued", "running", "success", "failed"
+    progress: float
+    message: Optional[str] = None
+    output_file: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
 
 class ChatResponse(BaseModel):
     response: str
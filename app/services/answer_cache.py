@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import shared_state
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # 秒
+# 問題 embedding 的 cosine 相似度門檻；預設 0 (停用語意快取)，啟用時數字、年份、季度與股票代號也必須相同
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+
+_PUNCTUATION_TAIL = re.compile(r"[\s?？!！。.,，]+$")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_QUARTER = re.compile(r"(?<![a-z])(?:q([1-4])|([1-4])q)(?![a-z])|第([一二三四1-4])季")
+_TICKER = re.compile(r"(?<![A-Za-z])[A-Z]{2,5}(?![A-Za-z])")
+_CHINESE_DIGITS = {"一": "1", "二": "2", "三": "3", "四": "4"}
+
+
+def normalize(message: str) -> str:
+    """Normalization used for exact-match keys (width, case, whitespace, trailing punctuation)."""
+    text = unicodedata.normalize("NFKC", message).lower()
+    text = " ".join(text.split())
+    return _PUNCTUATION_TAIL.sub("", text)
+
+
+def facets(message: str) -> str:
+    """
+    The figures a question is about: numbers (years, amounts), quarters and
+    upper-case tickers. "What was AAPL's Q3 2023 revenue?" and the same
+    question for 2022 embed almost identically, so a semantic hit also
+    requires these to match.
+    """
+    text = unicodedata.normalize("NFKC", message)
+    found = set(_TICKER.findall(text))
+    for m in _QUARTER.finditer(text.lower()):
+        digit = next(g for g in m.groups() if g)
+        found.add("q" + _CHINESE_DIGITS.get(digit, digit))
+    # Quarter digits are already counted above
+    found.update(m.group().replace(",", "") for m in _NUMBER.finditer(_QUARTER.sub(" ", text.lower())))
+    return " ".join(sorted(found))
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache of final answers in front of the RAG and PageIndex services.
+
+    Entries are keyed by (tool, normalized message, index version). Lookups try
+    an exact key first, then the most similar cached question embedding for
+    the same tool and index version whose facets() match. The first get() or
+    put() that sees a new index version for a tool drops that tool's older
+    entries (shared rows included), so rebuilding a structure JSON or the
+    Qdrant collection invalidates its answers.
+
+    With SHARED_STATE_DB set, entries are also written to the shared SQLite
+    database; other workers find them on an exact miss and pull new rows
+    before every semantic lookup, so an answer computed by one worker is a
+    hit in all of them. Counters stay per process.
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        self.saved_latency_s = 0.0
+        # Highest shared-database row id already pulled into this process
+        self._synced_id = 0
+        # Index version of each tool's entries; a change retires the older ones
+        self._versions: Dict[str, str] = {}
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.similarity > 0
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry["created"] > self.ttl
+
+    def _hit(self, key, entry, kind: str):
+        self._entries.move_to_end(key)
+        self.counters[kind] += 1
+        self.saved_latency_s += entry["latency"]
+        return entry["answer"], list(entry["sources"])
+
+    def _add_local(self, key, entry: Dict[str, Any]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _retire(self, tool: str, version: str):
+        """Drop the entries ``tool`` cached under another index version, here and in the shared database."""
+        with self._lock:
+            if self._versions.get(tool) == version:
+                return
+            self._versions[tool] = version
+            stale = [key for key in self._entries if key[0] == tool and key[2] != version]
+            for key in stale:
+                del self._entries[key]
+            self.counters["invalidations"] += len(stale)
+        shared = shared_state.get()
+        if shared is not None:
+            shared.execute("DELETE FROM answers WHERE tool = ? AND version != ?", (tool, version))
+
+    @staticmethod
+    def _from_row(row) -> Tuple[Tuple[str, str, str], Dict[str, Any]]:
+        tool, message, version, answer, sources, created, latency, embedding, facets_ = row
+        return (tool, message, version), {
+            "answer": answer,
+            "sources": json.loads(sources),
+            "created": created,
+            "latency": latency,
+            # Rows written before facets were recorded only serve exact hits
+            "embedding": np.frombuffer(embedding, dtype=np.float32) if embedding and facets_ is not None else None,
+            "facets": facets_,
+        }
+
+    def _sync(self):
+        """Pull entries other workers added to the shared database since the last sync."""
+        shared = shared_state.get()
+        if shared is None:
+            return
+        rows = shared.query(
+            "SELECT id, tool, message, version, answer, sources, created, latency, embedding, facets "
+            "FROM answers WHERE id > ? AND created > ? ORDER BY id",
+            (self._synced_id, time.time() - self.ttl),
+        )
+        with self._lock:
+            for row in rows:
+                self._synced_id = max(self._synced_id, row[0])
+                key, entry = self._from_row(row[1:])
+                self._add_local(key, entry)
+
+    def get(self, tool: str, message: str, version: str) -> Optional[Tuple[str, List[str]]]:
+        self._retire(tool, version)
+        key = (tool, normalize(message), version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry, time.time()):
+                    return self._hit(key, entry, "exact_hits")
+                del self._entries[key]
+                self.counters["expirations"] += 1
+        shared = shared_state.get()
+        if shared is not None:
+            rows = shared.query(
+                "SELECT tool, message, version, answer, sources, created, latency, embedding, facets "
+                "FROM answers WHERE tool = ? AND message = ? AND version = ? AND created > ?",
+                (*key, time.time() - self.ttl),
+            )
+            if rows:
+                _, entry = self._from_row(rows[0])
+                with self._lock:
+                    self._add_local(key, entry)
+                    return self._hit(key, entry, "exact_hits")
+        return None
+
+    def get_semantic(self, tool: str, message: str, version: str,
+                     embedding: Optional[np.ndarray]) -> Optional[Tuple[str, List[str]]]:
+        if embedding is None or not self.semantic_enabled:
+            return None
+        self._sync()
+        wanted = facets(message)
+        now = time.time()
+        with self._lock:
+            keys, vectors = [], []
+            for key, entry in list(self._entries.items()):
+                if key[0] != tool:
+                    continue
+                if key[2] != version:
+                    # synced from a worker that had not seen the new index yet
+                    del self._entries[key]
+                    self.counters["invalidations"] += 1
+                elif self._expired(entry, now):
+                    del self._entries[key]
+                    self.counters["expirations"] += 1
+                elif entry["embedding"] is not None and entry["facets"] == wanted:
+                    keys.append(key)
+                    vectors.append(entry["embedding"])
+            if vectors:
+                scores = np.stack(vectors) @ embedding
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    return self._hit(keys[best], self._entries[keys[best]], "semantic_hits")
+        return None
+
+    def miss(self):
+        with self._lock:
+            self.counters["misses"] += 1
+
+    def put(self, tool: str, message: str, version: str, answer: str, sources: List[str],
+            latency: float, embedding: Optional[np.ndarray] = None):
+        self._retire(tool, version)
+        key = (tool, normalize(message), version)
+        entry = {
+            "answer": answer,
+            "sources": list(sources),
+            "created": time.time(),
+            "latency": latency,
+            "embedding": embedding,
+            "facets": facets(message),
+        }
+        with self._lock:
+            self._add_local(key, entry)
+        shared = shared_state.get()
+        if shared is not None:
+            blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+            shared.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(tool, message, version, answer, sources, created, latency, embedding, facets) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, answer, json.dumps(list(sources), ensure_ascii=False), entry["created"], latency, blob,
+                 entry["facets"]),
+            )
+            # Same bounds as the in-memory cache
+            shared.execute(
+                "DELETE FROM answers WHERE created < ? OR id <= (SELECT MAX(id) FROM answers) - ?",
+                (entry["created"] - self.ttl, self.max_size),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+        shared = shared_state.get()
+        if shared is not None:
+            shared.execute("DELETE FROM answers")
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "similarity_threshold": self.similarity,
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "saved_latency_s": round(self.saved_latency_s, 3),
+        }
+
+
+answer_cache = AnswerCache()
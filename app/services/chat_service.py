@@ -0,0 +1,91 @@
+import time
+import asyncio
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import llm_client, rag_service, pageindex_service, events, telemetry
+from app.services.answer_cache import answer_cache, normalize
+from app.services.single_flight import single_flight
+from app.services.structure_registry import registry
+
+
+def index_version(tool: str) -> str:
+    """Version of the index a tool answers from; cached answers are only valid for the same version."""
+    if tool == "find_document":
+        return registry.fingerprint
+    return rag_service.index_version()
+
+
+async def embed_query(message: str) -> Optional[np.ndarray]:
+    try:
+        with telemetry.span("query_embedding"):
+            return await llm_client.embed_query(message)
+    except Exception as e:
+        print(f"Query embedding failed: {e}")
+        return None
+
+
+async def answer_events(tool: str, message: str) -> AsyncIterator[events.Event]:
+    """
+    Answer ``message`` with the given tool as a stream of events, going through the answer cache.
+    Cache hits yield a "cache_hit" stage followed by the whole answer as one token event.
+    """
+    version = index_version(tool)
+    # With SHARED_STATE_DB the cache reads SQLite, which can wait on another worker's write lock
+    with telemetry.span("cache_lookup"):
+        cached = await asyncio.to_thread(answer_cache.get, tool, message, version)
+    result = "exact"
+    if not cached:
+        embedding = await embed_query(message) if answer_cache.semantic_enabled else None
+        with telemetry.span("cache_lookup"):
+            cached = await asyncio.to_thread(answer_cache.get_semantic, tool, message, version, embedding)
+        result = "semantic" if cached else "miss"
+    telemetry.cache_result(result)
+    if cached:
+        yield events.stage("cache_hit")
+        yield events.token(cached[0])
+        yield events.sources(cached[1])
+        return
+    answer_cache.miss()
+
+    # Identical questions arriving while this one is answered share its pipeline run
+    key = (tool, normalize(message), version)
+    if single_flight.is_coalesced(key):
+        telemetry.coalesced()
+    async for event in single_flight.run(key, lambda: _pipeline_events(tool, message, version, embedding)):
+        yield event
+
+
+async def _pipeline_events(tool: str, message: str, version: str,
+                           embedding: Optional[np.ndarray]) -> AsyncIterator[events.Event]:
+    """Run the tool's query pipeline and cache the answer once it is complete."""
+    started = time.perf_counter()
+    # Both paths reuse the embedding computed for the cache lookup
+    if tool == "find_document":
+        stream = pageindex_service.query_events(message, query_vector=embedding)
+    else:
+        query_vector = embedding.tolist() if embedding is not None else None
+        stream = rag_service.query_events(message, query_vector=query_vector)
+
+    parts: List[str] = []
+    sources: List[str] = []
+    degraded = False
+    async for event in stream:
+        if event["event"] == "token":
+            parts.append(event["data"]["text"])
+        elif event["event"] == "sources":
+            sources = event["data"]
+        elif event["event"] == "degraded":
+            degraded = True
+        yield event
+
+    # Error paths return no sources and fallback paths are marked degraded; cache only grounded answers
+    if sources and not degraded:
+        await asyncio.to_thread(answer_cache.put, tool, message, version, "".join(parts), sources,
+                                time.perf_counter() - started, embedding)
+
+
+async def answer(tool: str, message: str) -> Tuple[str, List[str]]:
+    """Answer ``message`` with the given tool, going through the answer cache."""
+    return await events.collect(answer_events(tool, message))
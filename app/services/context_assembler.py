@@ -0,0 +1,178 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.sparse_index import SparseIndex
+from app.services.tokens import count_tokens, truncate_tokens
+
+# 答案生成階段的上下文 token 上限，以及單一頁面切塊的 token 上限
+PAGEINDEX_CONTEXT_TOKENS = int(os.getenv("PAGEINDEX_CONTEXT_TOKENS", "12000"))
+PAGE_CHUNK_TOKENS = int(os.getenv("PAGE_CHUNK_TOKENS", "800"))
+# 排序時 tree search 節點順序的權重 (越前面的節點越相關)，其餘由 BM25 決定
+NODE_PRIOR_WEIGHT = 0.3
+
+# (doc_name, start_page, end_page) -> page texts, 1-based inclusive
+PageLoader = Callable[[str, int, int], List[str]]
+
+
+def merge_ranges(nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge overlapping or adjacent node page ranges (1-based, inclusive).
+    Each merged range keeps its nodes' titles and the best (lowest) node rank.
+    """
+    ranges = []
+    for rank, node in enumerate(nodes):
+        start, end = node.get("start_index"), node.get("end_index")
+        if start is None or end is None:
+            continue
+        start, end = int(start), int(end)
+        if end < start:
+            start, end = end, start
+        ranges.append({"start": start, "end": end, "titles": [node.get("title") or ""], "rank": rank})
+
+    merged: List[Dict[str, Any]] = []
+    for item in sorted(ranges, key=lambda r: (r["start"], r["end"])):
+        if merged and item["start"] <= merged[-1]["end"] + 1:
+            last = merged[-1]
+            last["end"] = max(last["end"], item["end"])
+            last["titles"] += [t for t in item["titles"] if t not in last["titles"]]
+            last["rank"] = min(last["rank"], item["rank"])
+        else:
+            merged.append(item)
+    return merged
+
+
+def _split_page(text: str, max_tokens: int) -> List[str]:
+    """Split a page on line boundaries into pieces of at most ``max_tokens`` tokens."""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    pieces, current, used = [], [], 0
+    for line in text.splitlines(keepends=True):
+        tokens = count_tokens(line)
+        if tokens > max_tokens:
+            line, tokens = truncate_tokens(line, max_tokens), max_tokens
+        if current and used + tokens > max_tokens:
+            pieces.append("".join(current))
+            current, used = [], 0
+        current.append(line)
+        used += tokens
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def _section_title(titles: List[str], page: int, nodes: List[Dict[str, Any]]) -> str:
+    covering = [
+        n.get("title") or "" for n in nodes
+        if n.get("start_index") is not None and n.get("end_index") is not None
+        and int(n["start_index"]) <= page <= int(n["end_index"])
+    ]
+    return "; ".join(dict.fromkeys(covering or titles))
+
+
+def assemble(message: str, doc_nodes: List[Tuple[str, List[Dict[str, Any]]]], load_pages: PageLoader,
+             budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Build the answer context from the tree search results of one or more documents.
+
+    Page ranges are merged so every page is extracted once, pages are split into
+    chunks of at most PAGE_CHUNK_TOKENS, chunks are ranked by BM25 against the
+    question (plus a prior for the tree search's node order) and added greedily
+    until ``budget`` tokens, starting with the best chunk of every document.
+    The kept chunks are emitted in document/page order.
+    """
+    budget = PAGEINDEX_CONTEXT_TOKENS if budget is None else budget
+    chunks: List[Dict[str, Any]] = []
+    pages_total = 0
+    for doc_name, nodes in doc_nodes:
+        for merged in merge_ranges(nodes):
+            texts = load_pages(doc_name, merged["start"], merged["end"])
+            for offset, page_text in enumerate(texts):
+                if not page_text.strip():
+                    continue
+                page = merged["start"] + offset
+                pages_total += 1
+                for part, piece in enumerate(_split_page(page_text, PAGE_CHUNK_TOKENS)):
+                    chunks.append({
+                        "id": f"{doc_name}:{page}:{part}",
+                        "doc": doc_name,
+                        "page": page,
+                        "part": part,
+                        "text": piece,
+                        "tokens": count_tokens(piece),
+                        "rank": merged["rank"],
+                        "section": _section_title(merged["titles"], page, nodes),
+                    })
+
+    report = {
+        "text": "",
+        "sources": [],
+        "budget": budget,
+        "tokens_total": sum(c["tokens"] for c in chunks),
+        "tokens_used": 0,
+        "tokens_dropped": 0,
+        "pages_total": pages_total,
+        "pages_used": 0,
+        "chunks_total": len(chunks),
+        "chunks_used": 0,
+    }
+    if not chunks:
+        return report
+
+    # Rank chunks against the question
+    bm25 = SparseIndex(path="", sources={"pages": [
+        {"id": c["id"], "index": i, "text": c["text"]} for i, c in enumerate(chunks)
+    ]}).score_ids(message, [c["id"] for c in chunks])
+    max_bm25 = max(bm25.values()) or 1.0
+    for c in chunks:
+        c["score"] = bm25[c["id"]] / max_bm25 + NODE_PRIOR_WEIGHT / (1 + c["rank"])
+    order = np.argsort([-c["score"] for c in chunks], kind="stable")
+
+    # Multi-document fusion: each document's best chunk goes first, so a document
+    # the tree search found relevant is not crowded out by a denser one
+    leaders = {}
+    for i in order:
+        leaders.setdefault(chunks[i]["doc"], i)
+    leader_ids = set(leaders.values())
+    order = [i for i in order if i in leader_ids] + [i for i in order if i not in leader_ids]
+
+    kept, used = [], 0
+    for i in order:
+        chunk = chunks[i]
+        if used + chunk["tokens"] <= budget:
+            kept.append(chunk)
+            used += chunk["tokens"]
+        elif not kept:
+            # The single best chunk is larger than the whole budget: keep its beginning
+            text = truncate_tokens(chunk["text"], budget)
+            kept.append({**chunk, "text": text, "tokens": count_tokens(text)})
+            used += kept[-1]["tokens"]
+
+    # Reading order, one header per run of consecutive pages within the same section
+    doc_order = {doc_name: i for i, (doc_name, _) in enumerate(doc_nodes)}
+    kept.sort(key=lambda c: (doc_order[c["doc"]], c["page"], c["part"]))
+    runs: List[List[Dict[str, Any]]] = []
+    for chunk in kept:
+        last = runs[-1][-1] if runs else None
+        if (last is not None and last["doc"] == chunk["doc"] and last["section"] == chunk["section"]
+                and chunk["page"] - last["page"] <= 1):
+            runs[-1].append(chunk)
+        else:
+            runs.append([chunk])
+    parts = []
+    for run in runs:
+        first, last = run[0], run[-1]
+        parts.append(f"\n--- Document: {first['doc']} | Section: {first['section']} "
+                     f"(Pages {first['page']}-{last['page']}) ---\n")
+        parts.extend(f"{chunk['text']}\n" for chunk in run)
+
+    report.update({
+        "text": "".join(parts),
+        "sources": [f"{doc}.pdf" for doc in dict.fromkeys(c["doc"] for c in kept)],
+        "tokens_used": used,
+        "tokens_dropped": report["tokens_total"] - used,
+        "pages_used": len({(c["doc"], c["page"]) for c in kept}),
+        "chunks_used": len(kept),
+    })
+    return report
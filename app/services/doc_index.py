@@ -0,0 +1,138 @@
+import os
+import asyncio
+import hashlib
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import llm_client, shared_state
+from app.services.structure_registry import registry
+
+# 每份文件送去 embedding 的描述文字上限 (字元)
+DOC_TEXT_MAX_CHARS = int(os.getenv("DOC_TEXT_MAX_CHARS", "4000"))
+EMBED_BATCH_SIZE = 64
+
+
+def _iter_nodes(nodes):
+    for node in nodes or []:
+        if isinstance(node, dict):
+            yield node
+            yield from _iter_nodes(node.get("nodes"))
+
+
+def document_text(doc_name: str, index_data: Any) -> str:
+    """Text that represents a document: its description plus node titles and summaries."""
+    parts = [doc_name]
+    tree = index_data
+    if isinstance(index_data, Mapping):
+        if index_data.get("doc_description"):
+            parts.append(index_data["doc_description"])
+        tree = index_data.get("structure", [])
+    if isinstance(tree, dict):
+        tree = [tree]
+    for node in _iter_nodes(tree):
+        summary = node.get("summary") or node.get("prefix_summary") or ""
+        parts.append(f"{node.get('title', '')}: {summary}" if summary else node.get("title", ""))
+    return "\n".join(p for p in parts if p)[:DOC_TEXT_MAX_CHARS]
+
+
+class DocIndex:
+    """
+    Document-level vector index over the structures in the registry.
+
+    Each document is embedded once from ``document_text()``; the vectors are
+    kept as one normalized float32 matrix so ranking all documents against a
+    query is a single dot product. The matrix is rebuilt when the registry
+    fingerprint changes, re-embedding only documents whose text changed.
+    With SHARED_STATE_DB set, vectors are looked up in and added to the shared
+    database first, so each document is embedded once across all workers.
+    """
+
+    def __init__(self):
+        self._fingerprint: Optional[str] = None
+        self._names: List[str] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        # sha256(document text) -> unit vector
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def _rebuild(self):
+        structures = registry.get_all()
+        names = sorted(structures)
+        texts = {name: document_text(name, structures[name]) for name in names}
+        keys = {name: hashlib.sha256(texts[name].encode("utf-8")).hexdigest() for name in names}
+
+        missing = [name for name in names if keys[name] not in self._vectors]
+        shared = shared_state.get()
+        if shared is not None and missing:
+            wanted = sorted({keys[name] for name in missing})
+            for i in range(0, len(wanted), 500):
+                chunk = wanted[i:i + 500]
+                rows = await asyncio.to_thread(
+                    shared.query,
+                    f"SELECT text_hash, vector FROM doc_vectors WHERE text_hash IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for text_hash, blob in rows:
+                    self._vectors[text_hash] = np.frombuffer(blob, dtype=np.float32)
+            missing = [name for name in missing if keys[name] not in self._vectors]
+
+        for i in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[i:i + EMBED_BATCH_SIZE]
+            vectors, _ = await llm_client.embed_cached([texts[name] for name in batch])
+            for name, vector in zip(batch, vectors):
+                self._vectors[keys[name]] = vector / (np.linalg.norm(vector) or 1.0)
+            if shared is not None:
+                await asyncio.to_thread(
+                    shared.executemany,
+                    "INSERT OR REPLACE INTO doc_vectors (text_hash, vector) VALUES (?, ?)",
+                    [(keys[name], self._vectors[keys[name]].tobytes()) for name in batch],
+                )
+
+        live = {keys[name] for name in names}
+        self._vectors = {k: v for k, v in self._vectors.items() if k in live}
+        self._names = names
+        self._matrix = np.stack([self._vectors[keys[n]] for n in names]) if names else np.zeros((0, 0), np.float32)
+
+    async def ensure_current(self):
+        fingerprint = registry.fingerprint
+        if fingerprint == self._fingerprint:
+            return
+        async with self._lock:
+            if fingerprint != self._fingerprint:
+                await self._rebuild()
+                self._fingerprint = fingerprint
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(registry.watch_interval)
+            try:
+                await self.ensure_current()
+            except Exception as e:
+                print(f"Document index refresh failed: {e}")
+
+    def start_refresher(self):
+        """Re-embed changed documents in the background once the registry reloads them, not on a user request."""
+        if self._refresher is None:
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    def stop_refresher(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def shortlist(self, query_vector: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        """Top-k (doc_name, cosine score) pairs for a unit-length query vector."""
+        await self.ensure_current()
+        if not self._names:
+            return []
+        scores = self._matrix @ query_vector
+        top_k = min(top_k, len(self._names))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._names[i], float(scores[i])) for i in top]
+
+
+doc_index = DocIndex()
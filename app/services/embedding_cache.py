@@ -0,0 +1,263 @@
+import os
+import re
+import mmap
+import struct
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+# 持久化的 embedding 快取：每個模型一個 float32 向量檔 (.f32) 加上 sha256 索引檔 (.idx)
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+# 記憶體 LRU 保留的向量數
+EMBEDDING_CACHE_MEMORY = int(os.getenv("EMBEDDING_CACHE_MEMORY", "10000"))
+# 向量檔大小上限 (MB)；超過後新的向量只留在記憶體
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048"))
+
+_MAGIC = b"EMBC"
+_FORMAT_VERSION = 1
+# magic, version, reserved, vector dimension
+_HEADER = struct.Struct("<4sHHI")
+_DIGEST_SIZE = 32
+
+
+def normalize(text: str) -> str:
+    """Unicode and whitespace normalization for cache keys; case is kept since it changes the embedding."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha256(normalize(text).encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk vectors of one embedding model.
+
+    ``<model>.idx`` is a header followed by one 32-byte sha256 digest per
+    vector; ``<model>.f32`` holds the vectors as consecutive float32 rows in
+    the same order, so the row of a digest is its position in the index.
+    Vectors are written before their digests, under a file lock shared with
+    other processes, and each append starts at the row the index says is
+    next, so a crash leaves at most unreferenced rows or a torn digest, both
+    overwritten by the next append. Reads go through a read-only mmap of the vector file.
+    """
+
+    def __init__(self, directory: str, model: str):
+        name = re.sub(r"[^A-Za-z0-9._-]", "_", model)
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self.data_path = os.path.join(directory, f"{name}.f32")
+        self.lock_path = os.path.join(directory, f"{name}.lock")
+        self.dim = 0
+        self._rows: Dict[bytes, int] = {}
+        # Records in the index; can exceed len(_rows) when two processes stored the same text
+        self._records = 0
+        self._index_bytes = 0
+        self._map: Optional[mmap.mmap] = None
+        self._mapped_rows = 0
+        self._lock = threading.Lock()
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * 4
+
+    def __len__(self) -> int:
+        return self._records
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        with open(self.lock_path, "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync_index(self):
+        """Read digests appended (by this or another process) since the last sync."""
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        if size <= self._index_bytes:
+            return
+        with open(self.index_path, "rb") as f:
+            if self._index_bytes == 0:
+                magic, version, _, dim = _HEADER.unpack(f.read(_HEADER.size))
+                if magic != _MAGIC or version != _FORMAT_VERSION:
+                    raise ValueError(f"Not an embedding cache index: {self.index_path}")
+                self.dim = dim
+                self._index_bytes = _HEADER.size
+            f.seek(self._index_bytes)
+            data = f.read(size - self._index_bytes)
+        # A digest cut short by a crash is ignored until it is rewritten
+        count = len(data) // _DIGEST_SIZE
+        for i in range(count):
+            self._rows.setdefault(data[i * _DIGEST_SIZE:(i + 1) * _DIGEST_SIZE], self._records + i)
+        self._records += count
+        self._index_bytes += count * _DIGEST_SIZE
+
+    def _vector(self, row: int) -> np.ndarray:
+        if row >= self._mapped_rows:
+            # The vector file grew since it was mapped; the old map is left to the GC
+            with open(self.data_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped_rows = len(self._map) // self.row_bytes
+        return np.frombuffer(self._map, dtype=np.float32, count=self.dim, offset=row * self.row_bytes).copy()
+
+    def get(self, digests: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            if any(d not in self._rows for d in digests):
+                self._sync_index()
+            return [self._vector(self._rows[d]) if d in self._rows else None for d in digests]
+
+    def append(self, digests: Sequence[bytes], vectors: Sequence[np.ndarray], max_bytes: float) -> Tuple[int, int]:
+        """Persist vectors not stored yet; returns ``(written, dropped)``, dropped once the file reached ``max_bytes``."""
+        with self._lock, self._file_lock():
+            self._sync_index()
+            if not self.dim:
+                self.dim = len(vectors[0])
+                with open(self.index_path, "wb") as f:
+                    f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, 0, self.dim))
+                self._index_bytes = _HEADER.size
+            new = {}
+            for digest, vector in zip(digests, vectors):
+                if digest not in self._rows and len(vector) == self.dim:
+                    new.setdefault(digest, vector)
+            row = self._records
+            if not new:
+                return 0, 0
+            if (row + len(new)) * self.row_bytes > max_bytes:
+                return 0, len(new)
+            block = np.stack([np.asarray(v, dtype=np.float32) for v in new.values()]).tobytes()
+            with open(self.data_path, "ab") as f:
+                f.truncate(row * self.row_bytes)
+                f.write(block)
+            with open(self.index_path, "ab") as f:
+                # Drop a digest torn by a crash, or every later digest would be misaligned
+                f.truncate(self._index_bytes)
+                f.write(b"".join(new))
+            self._sync_index()
+            return len(new), 0
+
+    def size_bytes(self) -> int:
+        return self._records * self.row_bytes
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model, sha256 of the normalized text): an in-memory
+    LRU in front of one EmbeddingStore per model. Batch lookups return a
+    vector or None per text so callers only send the misses to the API.
+    Shared by the query path (llm_client.embed_query) and ingestion
+    (rag_ingest, doc_index, node_index); the files are shared between
+    processes, counters are per process.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_CACHE_DIR, memory_size: int = EMBEDDING_CACHE_MEMORY,
+                 max_mb: float = EMBEDDING_CACHE_MAX_MB, enabled: bool = EMBEDDING_CACHE):
+        self.directory = directory
+        self.memory_size = memory_size
+        self.max_bytes = max_mb * 1024 * 1024
+        self.enabled = enabled
+        self._memory: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._stores: Dict[str, EmbeddingStore] = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stored": 0,
+            "not_persisted": 0,
+            "errors": 0,
+        }
+
+    def _store(self, model: str) -> EmbeddingStore:
+        store = self._stores.get(model)
+        if store is None:
+            store = self._stores.setdefault(model, EmbeddingStore(self.directory, model))
+        return store
+
+    def _remember(self, key: tuple, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def lookup(self, texts: Sequence[str], model: str) -> List[Optional[np.ndarray]]:
+        """Cached vector (float32) or None for each text."""
+        if not self.enabled:
+            return [None] * len(texts)
+        digests = [text_digest(t) for t in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            for i, digest in enumerate(digests):
+                vector = self._memory.get((model, digest))
+                if vector is not None:
+                    self._memory.move_to_end((model, digest))
+                    found[i] = vector
+                    self.counters["memory_hits"] += 1
+        pending = [i for i, v in enumerate(found) if v is None]
+        if pending:
+            try:
+                from_disk = self._store(model).get([digests[i] for i in pending])
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Embedding cache read failed: {e}")
+                self.counters["errors"] += 1
+                from_disk = [None] * len(pending)
+            with self._lock:
+                for i, vector in zip(pending, from_disk):
+                    if vector is None:
+                        self.counters["misses"] += 1
+                    else:
+                        found[i] = vector
+                        self._remember((model, digests[i]), vector)
+                        self.counters["disk_hits"] += 1
+        return found
+
+    def store(self, texts: Sequence[str], vectors: Sequence[np.ndarray], model: str):
+        if not self.enabled or not texts:
+            return
+        digests = [text_digest(t) for t in texts]
+        vectors = [np.asarray(v, dtype=np.float32) for v in vectors]
+        with self._lock:
+            for digest, vector in zip(digests, vectors):
+                self._remember((model, digest), vector)
+        try:
+            written, dropped = self._store(model).append(digests, vectors, self.max_bytes)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Embedding cache write failed: {e}")
+            self.counters["errors"] += 1
+            return
+        self.counters["stored"] += written
+        self.counters["not_persisted"] += dropped
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "memory_size": self.memory_size,
+            "disk": {model: {"entries": len(s), "dim": s.dim, "bytes": s.size_bytes()}
+                     for model, s in self._stores.items()},
+            "max_mb": self.max_bytes / 1024 / 1024,
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache()
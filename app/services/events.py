@@ -0,0 +1,34 @@
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+# Events yielded by the query pipelines: {"event": <name>, "data": <JSON-serializable>}.
+# "token" events carry answer text, "sources" ends the answer, anything else is a stage update.
+Event = Dict[str, Any]
+
+
+def stage(name: str, **data) -> Event:
+    return {"event": name, "data": data}
+
+
+def token(text: str) -> Event:
+    return {"event": "token", "data": {"text": text}}
+
+
+def degraded(reason: str) -> Event:
+    """Marks an answer produced by a fallback path; it is shown but not cached."""
+    return stage("degraded", reason=reason)
+
+
+def sources(items: List[str]) -> Event:
+    return {"event": "sources", "data": list(items)}
+
+
+async def collect(events: AsyncIterator[Event]) -> Tuple[str, List[str]]:
+    """Drain an event stream into the (answer, sources) tuple the non-streaming API returns."""
+    parts: List[str] = []
+    found: List[str] = []
+    async for event in events:
+        if event["event"] == "token":
+            parts.append(event["data"]["text"])
+        elif event["event"] == "sources":
+            found = event["data"]
+    return "".join(parts), found
@@ -0,0 +1,186 @@
+import os
+import asyncio
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services import sparse_index, vector_store
+from app.services.sparse_index import tokenize, exact_terms
+
+# 檢索深度：dense / sparse 各取幾筆候選，融合後重排，最後放進 prompt 的片段數
+RAG_DENSE_K = int(os.getenv("RAG_DENSE_K", "20"))
+RAG_SPARSE_K = int(os.getenv("RAG_SPARSE_K", "20"))
+RAG_RERANK_K = int(os.getenv("RAG_RERANK_K", "20"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+RAG_RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# 選用：sentence-transformers 的 cross-encoder 模型名稱；未設定時使用內建的 dense + BM25 + 精確詞彙評分
+RAG_RERANK_MODEL = os.getenv("RAG_RERANK_MODEL", "")
+# process_rag.py 的 chunk_overlap；相鄰片段最多重疊這麼多字元
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "200"))
+
+# Built-in reranker weights: cosine similarity, max-normalized BM25, share of exact query terms present
+RERANK_WEIGHTS = (0.5, 0.3, 0.2)
+
+_cross_encoder = None
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = RAG_RRF_K) -> Dict[str, float]:
+    """Reciprocal rank fusion: sum of 1 / (k + rank) over every ranking an id appears in."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def _overlap(left: str, right: str, max_overlap: int) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def dedup_chunks(chunks: List[Dict[str, Any]], max_overlap: int = RAG_CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Drop repeated text and merge consecutive chunks of the same source, so the
+    splitter's overlap is sent once. Keeps the order of each group's best chunk.
+    """
+    seen_text = set()
+    groups: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        if chunk["text"] in seen_text:
+            continue
+        seen_text.add(chunk["text"])
+        for group in groups:
+            if group["source"] == chunk["source"] and (
+                chunk["chunk_index"] == group["last"] + 1 or chunk["chunk_index"] == group["first"] - 1
+            ):
+                group["members"].append(chunk)
+                group["first"] = min(group["first"], chunk["chunk_index"])
+                group["last"] = max(group["last"], chunk["chunk_index"])
+                break
+        else:
+            groups.append({"source": chunk["source"], "first": chunk["chunk_index"],
+                           "last": chunk["chunk_index"], "members": [chunk]})
+
+    merged = []
+    for group in groups:
+        members = sorted(group["members"], key=lambda c: c["chunk_index"])
+        text = members[0]["text"]
+        for member in members[1:]:
+            text += member["text"][_overlap(text, member["text"], max_overlap):]
+        merged.append({**members[0], "text": text,
+                       "chunk_index": group["first"], "chunks": [m["chunk_index"] for m in members]})
+    return merged
+
+
+def _load_cross_encoder():
+    global _cross_encoder
+    if _cross_encoder is None:
+        from sentence_transformers import CrossEncoder
+        _cross_encoder = CrossEncoder(RAG_RERANK_MODEL, device="cpu")
+    return _cross_encoder
+
+
+def rerank(message: str, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Score candidates on CPU and return them best first (``candidate["score"]`` is set)."""
+    if not candidates:
+        return []
+    if RAG_RERANK_MODEL:
+        try:
+            scores = _load_cross_encoder().predict([(message, c["text"]) for c in candidates])
+            for candidate, score in zip(candidates, scores):
+                candidate["score"] = float(score)
+            return sorted(candidates, key=lambda c: -c["score"])
+        except Exception as e:
+            print(f"Cross-encoder rerank unavailable, using built-in scorer: {e}")
+
+    terms = exact_terms(tokenize(message))
+    max_sparse = max(c["sparse"] for c in candidates) or 1.0
+    w_dense, w_sparse, w_exact = RERANK_WEIGHTS
+    for candidate in candidates:
+        exact = 0.0
+        if terms:
+            chunk_terms = set(tokenize(candidate["text"]))
+            exact = sum(1 for t in terms if t in chunk_terms) / len(terms)
+        candidate["score"] = (w_dense * candidate["dense"]
+                              + w_sparse * candidate["sparse"] / max_sparse
+                              + w_exact * exact)
+    return sorted(candidates, key=lambda c: (-c["score"], -c["rrf"]))
+
+
+def _candidate(item_id: str, text: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": item_id,
+        "text": text,
+        "source": metadata.get("source", "Unknown"),
+        "chunk_index": metadata.get("chunk_index", 0),
+        "dense": 0.0,
+        "sparse": 0.0,
+        "rrf": 0.0,
+    }
+
+
+def _sparse_search(message: str):
+    sparse = sparse_index.current()
+    return sparse, sparse.search(message, RAG_SPARSE_K) if len(sparse) else []
+
+
+async def search(message: str, query_vector) -> Dict[str, Any]:
+    """
+    Hybrid retrieval over rag_documents: dense Qdrant search and local BM25 fused
+    with RRF, reranked on CPU, top RAG_TOP_K deduplicated.
+    Returns ``{"chunks": [...], "dense": n, "sparse": n, "candidates": n}``.
+    """
+    client = vector_store.get_client()
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    # BM25 scoring is CPU work in a thread while the dense query waits on Qdrant
+    (sparse, sparse_hits), dense_response = await asyncio.gather(
+        asyncio.to_thread(_sparse_search, message),
+        client.query_points(
+            collection_name=vector_store.COLLECTION_NAME,
+            query=query.tolist(),
+            limit=RAG_DENSE_K,
+        ),
+    )
+    dense_hits = dense_response.points
+
+    candidates: Dict[str, Dict[str, Any]] = {}
+    for hit in dense_hits:
+        payload = hit.payload or {}
+        candidate = _candidate(str(hit.id), payload.get("page_content", ""), payload.get("metadata", {}))
+        candidate["dense"] = float(hit.score)
+        candidates[candidate["id"]] = candidate
+    for chunk, score in sparse_hits:
+        candidate = candidates.setdefault(chunk["id"], _candidate(
+            chunk["id"], chunk["text"], {"source": chunk["source"], "chunk_index": chunk["index"]}))
+        candidate["sparse"] = score
+
+    fused = rrf_fuse([[str(h.id) for h in dense_hits], [c["id"] for c, _ in sparse_hits]])
+    for item_id, score in fused.items():
+        candidates[item_id]["rrf"] = score
+    pool = sorted(candidates.values(), key=lambda c: -c["rrf"])[:RAG_RERANK_K]
+
+    # Features the reranker needs but the other retriever didn't return
+    if len(sparse):
+        bm25 = await asyncio.to_thread(sparse.score_ids, message, [c["id"] for c in pool if not c["sparse"]])
+        for candidate in pool:
+            candidate["sparse"] = candidate["sparse"] or bm25.get(candidate["id"], 0.0)
+    sparse_only = [c["id"] for c in pool if c["id"] not in {str(h.id) for h in dense_hits}]
+    if sparse_only:
+        records = await client.retrieve(
+            collection_name=vector_store.COLLECTION_NAME, ids=sparse_only, with_vectors=True, with_payload=False)
+        for record in records:
+            vector = np.asarray(record.vector, dtype=np.float32)
+            candidates[str(record.id)]["dense"] = float(vector @ query / (np.linalg.norm(vector) or 1.0))
+
+    ranked = await asyncio.to_thread(rerank, message, pool)
+    return {
+        "chunks": dedup_chunks(ranked[:RAG_TOP_K]),
+        "dense": len(dense_hits),
+        "sparse": len(sparse_hits),
+        "candidates": len(pool),
+    }
@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from app.services.rate_limiter import bucket
+from app.services.tokens import count_tokens
+
+if TYPE_CHECKING:
+    # openai is imported where it is used, so process_pageindex.py starts without it
+    import openai
+    from openai.types.chat import ChatCompletion
+
+# process_pageindex.py 同時處理的文件數
+PAGEINDEX_WORKERS = int(os.getenv("PAGEINDEX_WORKERS", "4"))
+# 429 時的最大重試次數 (超過後交給 PageIndex 自己的重試邏輯)
+LLM_RATE_MAX_RETRIES = int(os.getenv("LLM_RATE_MAX_RETRIES", "8"))
+# 每份文件的 LLM 回應紀錄；中斷後重跑時直接重播，文件完成後刪除
+CHECKPOINT_DIR = os.getenv("PAGEINDEX_CHECKPOINT_DIR", "data/checkpoints/pageindex")
+# 回應長度未指定時，預先扣除的 completion token 估計值
+COMPLETION_TOKEN_ESTIMATE = 500
+
+
+class CallJournal:
+    """
+    Append-only JSONL of the chat completions made while indexing one document.
+
+    PageIndex is deterministic given the same PDF and the same model answers,
+    so after a crash the re-run sends the same prompts in the same order; those
+    are answered from the journal and the document continues from the first
+    call that never completed, without spending tokens on the finished part.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.replayed = 0
+        self.recorded = 0
+        self._responses: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn last line from a crash
+                    self._responses.setdefault(entry["key"], {})[entry["n"]] = entry["response"]
+        except FileNotFoundError:
+            pass
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._responses.values())
+
+    @staticmethod
+    def request_key(kwargs: Dict[str, Any]) -> str:
+        request = {k: v for k, v in kwargs.items() if k not in ("timeout", "extra_headers")}
+        payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Tuple[int, Optional["ChatCompletion"]]:
+        """Occurrence number of this request and its recorded response, if any."""
+        with self._lock:
+            n = self._seen.get(key, 0)
+            self._seen[key] = n + 1
+            recorded = self._responses.get(key, {}).get(n)
+            if recorded is not None:
+                from openai.types.chat import ChatCompletion
+
+                self.replayed += 1
+                return n, ChatCompletion.model_validate(recorded)
+        return n, None
+
+    def record(self, key: str, n: int, response: "ChatCompletion"):
+        with self._lock:
+            data = response.model_dump(mode="json")
+            self._responses.setdefault(key, {})[n] = data
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "n": n, "response": data}, ensure_ascii=False) + "\n")
+            self.recorded += 1
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+_journal: Optional[CallJournal] = None
+_stats = {"calls": 0, "rate_limited": 0, "waited_s": 0.0}
+_instrumented = False
+
+
+def journal_path_for(file_path: str, content_hash: Optional[str] = None) -> str:
+    # Keyed by content too, so an edited PDF does not resume from the old version's journal
+    suffix = f".{content_hash[:16]}" if content_hash else ""
+    return os.path.join(CHECKPOINT_DIR, f"{os.path.basename(file_path)}{suffix}.jsonl")
+
+
+def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    prompt = "".join(str(m.get("content", "")) for m in kwargs.get("messages", []) if isinstance(m, dict))
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or COMPLETION_TOKEN_ESTIMATE
+    return count_tokens(prompt) + int(completion)
+
+
+def _retry_after(error: "openai.RateLimitError", attempt: int) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+def _settle(estimated: int, response):
+    usage = getattr(response, "usage", None)
+    bucket.settle(estimated, getattr(usage, "total_tokens", None))
+
+
+def instrument_openai():
+    """
+    Route every chat completion made in this process (i.e. by PageIndex inside a
+    worker) through the shared token bucket, back off on 429s, and record or
+    replay responses through the current document's CallJournal.
+    Used as the process pool initializer.
+    """
+    global _instrumented
+    if _instrumented:
+        return
+    import openai
+    from openai.resources.chat.completions import AsyncCompletions, Completions
+
+    _instrumented = True
+    original_sync, original_async = Completions.create, AsyncCompletions.create
+
+    def create(self, *args, **kwargs):
+        if kwargs.get("stream"):
+            return original_sync(self, *args, **kwargs)
+        journal = _journal
+        key = CallJournal.request_key(kwargs)
+        n, replay = journal.lookup(key) if journal is not None else (0, None)
+        if replay is not None:
+            return replay
+        estimated = _estimate_tokens(kwargs)
+        for attempt in range(LLM_RATE_MAX_RETRIES + 1):
+            _stats["waited_s"] += bucket.acquire(estimated)
+            try:
+                response = original_sync(self, *args, **kwargs)
+                break
+            except openai.RateLimitError as e:
+                if attempt == LLM_RATE_MAX_RETRIES:
+                    raise
+                _stats["rate_limited"] += 1
+                bucket.pause(_retry_after(e, attempt))
+        _stats["calls"] += 1
+        _settle(estimated, response)
+        if journal is not None:
+            journal.record(key, n, response)
+        return response
+
+    async def async_create(self, *args, **kwargs):
+        if kwargs.get("stream"):
+            return await original_async(self, *args, **kwargs)
+        journal = _journal
+        key = CallJournal.request_key(kwargs)
+        n, replay = journal.lookup(key) if journal is not None else (0, None)
+        if replay is not None:
+            return replay
+        estimated = _estimate_tokens(kwargs)
+        for attempt in range(LLM_RATE_MAX_RETRIES + 1):
+            # The bucket blocks on a file lock / sleep; keep the event loop free for sibling calls
+            _stats["waited_s"] += await asyncio.to_thread(bucket.acquire, estimated)
+            try:
+                response = await original_async(self, *args, **kwargs)
+                break
+            except openai.RateLimitError as e:
+                if attempt == LLM_RATE_MAX_RETRIES:
+                    raise
+                _stats["rate_limited"] += 1
+                await asyncio.to_thread(bucket.pause, _retry_after(e, attempt))
+        _stats["calls"] += 1
+        _settle(estimated, response)
+        if journal is not None:
+            journal.record(key, n, response)
+        return response
+
+    Completions.create = create
+    AsyncCompletions.create = async_create
+
+
+def index_document(file_path: str, source: Optional[Dict[str, Any]] = None,
+                   content_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Index one PDF inside a worker process, resuming from its CallJournal if a
+    previous run was interrupted. Returns the output file and call statistics.
+    """
+    global _journal
+    from app.services.indexing import index_pdf
+
+    instrument_openai()
+    _stats.update(calls=0, rate_limited=0, waited_s=0.0)
+    _journal = CallJournal(journal_path_for(file_path, content_hash or (source or {}).get("content_hash")))
+    journaled = len(_journal)
+    started = time.perf_counter()
+    try:
+        output_file = index_pdf(file_path, source=source)
+        _journal.discard()
+        return {
+            "file": os.path.basename(file_path),
+            "output_file": output_file,
+            "elapsed_s": round(time.perf_counter() - started, 1),
+            "llm_calls": _stats["calls"],
+            "replayed": _journal.replayed,
+            "journaled_before": journaled,
+            "rate_limited": _stats["rate_limited"],
+            "rate_wait_s": round(_stats["waited_s"], 1),
+        }
+    finally:
+        _journal = None
+
+
+def spawn_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn: callers may have live threads (registry watcher, event loop)
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=instrument_openai,
+    )
+
+
+def run(pending: List[Tuple[str, Dict[str, Any]]], workers: int = PAGEINDEX_WORKERS) -> Dict[str, Any]:
+    """Index ``(file_path, source)`` pairs concurrently; one document per worker process at a time."""
+    results, failures = [], []
+    if not pending:
+        return {"results": results, "failures": failures}
+    with spawn_pool(min(workers, len(pending))) as pool:
+        futures = {pool.submit(index_document, file_path, source): file_path for file_path, source in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            file_path = futures[future]
+            try:
+                result = future.result()
+                results.append(result)
+                print(f"[{done}/{len(pending)}] ✓ {result['file']} in {result['elapsed_s']}s "
+                      f"({result['llm_calls']} LLM calls, {result['replayed']} replayed from checkpoint, "
+                      f"{result['rate_limited']} rate-limited, waited {result['rate_wait_s']}s)")
+            except Exception as e:
+                failures.append((file_path, str(e)))
+                print(f"[{done}/{len(pending)}] ✗ {os.path.basename(file_path)}: {e} "
+                      f"(checkpoint kept; re-run to resume)")
+    return {"results": results, "failures": failures}
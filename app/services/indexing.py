@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+from typing import Any, Dict, Optional
+
+# Add PageIndex library to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'PageIndex'))
+
+from app.services import page_store, structure_store
+from app.services.manifest import Manifest, PAGEINDEX_MANIFEST, config_fingerprint
+
+PDF_DIR = "lib/PageIndex/tests/pdfs"
+INDEX_DIR = "lib/PageIndex/tests/results"
+# 結構檔格式：json (PageIndex 原始格式) 或 binary (mmap 的 .pidx，可依 node_id 延遲載入子樹)
+PAGEINDEX_STRUCTURE_FORMAT = os.getenv("PAGEINDEX_STRUCTURE_FORMAT", "json")
+
+PAGEINDEX_OPTIONS = dict(
+    toc_check_page_num=20,
+    max_page_num_each_node=10,
+    max_token_num_each_node=12000,
+    if_add_node_id='yes',
+    if_add_node_summary='yes',
+    if_add_doc_description='yes',
+    if_add_node_text='no'
+)
+
+
+def pageindex_model() -> str:
+    return os.getenv("OPENAI_MODEL", "gpt-4o-2024-11-20")  # PageIndex 預設用較強的模型
+
+
+def options_fingerprint() -> str:
+    """Fingerprint of the PageIndex config; a change forces documents to be re-indexed."""
+    return config_fingerprint({"model": pageindex_model(), **PAGEINDEX_OPTIONS})
+
+
+def build_config():
+    """PageIndex options shared by process_pageindex.py and upload ingestion jobs."""
+    # PageIndex is imported here so the API process only loads it inside ingestion workers
+    from pageindex import config
+
+    return config(model=pageindex_model(), **PAGEINDEX_OPTIONS)
+
+
+def structure_path_for(doc_name: str, fmt: Optional[str] = None) -> str:
+    if (fmt or PAGEINDEX_STRUCTURE_FORMAT) == "binary":
+        return os.path.join(INDEX_DIR, f'{doc_name}{structure_store.BINARY_SUFFIX}')
+    return os.path.join(INDEX_DIR, f'{doc_name}_structure.json')
+
+
+def existing_structure(doc_name: str) -> Optional[str]:
+    """The structure file of ``doc_name`` in either format, if one exists."""
+    for fmt in ("json", "binary"):
+        path = structure_path_for(doc_name, fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def index_pdf(file_path: str, opt=None, doc_name: Optional[str] = None,
+              source: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Run PageIndex on a single PDF, save ``<doc_name>_structure.json`` (or ``.pidx``
+    with PAGEINDEX_STRUCTURE_FORMAT=binary) to INDEX_DIR and pre-build its page text store. The result is recorded in the PageIndex
+    manifest (``source`` may carry an already computed content hash/stat).
+    Returns the structure file path.
+    """
+    from pageindex import page_index_main
+
+    opt = opt or build_config()
+    doc_name = doc_name or os.path.splitext(os.path.basename(file_path))[0]
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    if source is None:
+        st = os.stat(file_path)
+        source = {"mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                  "content_hash": page_store.file_sha256(file_path)}
+
+    toc_with_page_number = page_index_main(file_path, opt)
+
+    output_file = structure_path_for(doc_name)
+    if output_file.endswith(structure_store.BINARY_SUFFIX):
+        structure_store.write(output_file, toc_with_page_number)
+    else:
+        # 先寫暫存檔再 rename，避免 registry 讀到寫一半的 JSON
+        tmp_file = f"{output_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(toc_with_page_number, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_file, output_file)
+    # A structure left over in the other format would shadow or outlive this one
+    for fmt in ("json", "binary"):
+        stale = structure_path_for(doc_name, fmt)
+        if stale != output_file and os.path.exists(stale):
+            os.remove(stale)
+
+    # Pre-extract page texts so queries never re-parse the PDF
+    store_file = page_store.build(file_path, source["content_hash"])
+
+    Manifest(PAGEINDEX_MANIFEST).set(os.path.basename(file_path), {
+        **source,
+        "config": options_fingerprint(),
+        "doc_name": doc_name,
+        "artifacts": {"structure": output_file, "page_store": store_file},
+    })
+    return output_file
+
+
+def remove_document(manifest: Manifest, key: str):
+    """Delete the structure and page store of a source PDF that no longer exists."""
+    entry = manifest.get(key) or {}
+    paths = list(entry.get("artifacts", {}).values())
+    if entry.get("doc_name"):
+        # Also a structure converted to the other format by convert_structures.py
+        paths += [structure_path_for(entry["doc_name"], fmt) for fmt in ("json", "binary")]
+    for path in dict.fromkeys(paths):
+        if path and os.path.exists(path):
+            os.remove(path)
+    manifest.remove(key)
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from app.services import index_scheduler, node_index, shared_state
+from app.services.structure_registry import registry
+
+# 同時進行 PageIndex 處理的 worker process 數
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# 多 worker 模式：進行中的工作每隔幾秒更新共用狀態；超過 INGEST_JOB_STALE_S 沒更新 (或負責的 process 已結束) 視為失敗
+INGEST_HEARTBEAT_S = float(os.getenv("INGEST_HEARTBEAT_S", "15"))
+INGEST_JOB_STALE_S = float(os.getenv("INGEST_JOB_STALE_S", "120"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_jobs: Dict[str, Dict[str, Any]] = {}
+_futures: Dict[str, Future] = {}
+_jobs_by_hash: Dict[str, str] = {}
+_lock = threading.Lock()
+_heartbeat: Optional[threading.Thread] = None
+_stopping = threading.Event()
+
+
+def _run_index_job(file_path: str, content_hash: str) -> str:
+    # Runs inside a worker process; shares the OpenAI rate limit with process_pageindex.py
+    output_file = index_scheduler.index_document(file_path, content_hash=content_hash)["output_file"]
+    if node_index.PAGEINDEX_NODE_INDEX:
+        try:
+            node_index.build([os.path.basename(file_path)], os.path.dirname(file_path))
+        except Exception as e:
+            # The document is searchable without them; process_pageindex.py fills them in later
+            print(f"Node embedding of {os.path.basename(file_path)} failed: {e}")
+    return output_file
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = index_scheduler.spawn_pool(INGEST_WORKERS)
+    return _executor
+
+
+def _store(job: Dict[str, Any]):
+    """Write the job to the shared database so every worker can answer status polls for it."""
+    shared = shared_state.get()
+    if shared is not None:
+        job["updated_at"] = time.time()
+        shared.execute(
+            "INSERT OR REPLACE INTO jobs (job_id, content_hash, data) VALUES (?, ?, ?)",
+            (job["job_id"], job["content_hash"], json.dumps(job, ensure_ascii=False)),
+        )
+
+
+def _owner_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # exists but owned by another user, or no signal support
+    return True
+
+
+def _checked(data: str) -> Dict[str, Any]:
+    """
+    A job row from the shared database. A queued or running job of another
+    process whose owner has exited or stopped heart-beating is marked failed,
+    so its content and filename can be uploaded again.
+    """
+    job = json.loads(data)
+    if job["status"] not in ("queued", "running") or job["job_id"] in _jobs:
+        return job
+    owner = job.get("owner_pid")
+    updated_at = job.get("updated_at") or job["created_at"]
+    # Our own pid on a job we do not hold means this worker was restarted under a reused pid
+    if owner != os.getpid() and _owner_alive(owner) and time.time() - updated_at <= INGEST_JOB_STALE_S:
+        return job
+    job.update(status="failed", progress=1.0, finished_at=time.time(),
+               message="Processing was interrupted (its API worker stopped); upload the file again to retry")
+    _store(job)
+    return job
+
+
+def _load(job_id: str) -> Optional[Dict[str, Any]]:
+    shared = shared_state.get()
+    if shared is None:
+        return None
+    rows = shared.query("SELECT data FROM jobs WHERE job_id = ?", (job_id,))
+    return _checked(rows[0][0]) if rows else None
+
+
+def _load_by_hash(content_hash: str) -> Optional[Dict[str, Any]]:
+    """A shared job for this content that has not failed (failed jobs may be retried)."""
+    shared = shared_state.get()
+    if shared is None:
+        return None
+    for (data,) in shared.query("SELECT data FROM jobs WHERE content_hash = ?", (content_hash,)):
+        job = _checked(data)
+        if job["status"] != "failed":
+            return job
+    return None
+
+
+def _refresh_status(job: Dict[str, Any]) -> bool:
+    future = _futures.get(job["job_id"])
+    if job["status"] == "queued" and future is not None and future.running():
+        job.update(status="running", progress=0.5, message="Indexing with PageIndex")
+        return True
+    return False
+
+
+def _heartbeat_loop():
+    """Keep updated_at of this process's unfinished jobs fresh in the shared database."""
+    while not _stopping.wait(INGEST_HEARTBEAT_S):
+        try:
+            with _lock:
+                for job in _jobs.values():
+                    if job["status"] in ("queued", "running"):
+                        _refresh_status(job)
+                        _store(job)
+        except Exception as e:
+            print(f"Ingest job heartbeat failed: {e}")
+
+
+def _start_heartbeat():
+    global _heartbeat
+    if _heartbeat is None and shared_state.get() is not None:
+        _stopping.clear()
+        _heartbeat = threading.Thread(target=_heartbeat_loop, name="ingest-heartbeat", daemon=True)
+        _heartbeat.start()
+
+
+def _on_done(job_id: str, future: Future):
+    with _lock:
+        job = _jobs[job_id]
+        job["finished_at"] = time.time()
+        _futures.pop(job_id, None)
+        error = future.exception()
+        if error is None:
+            job.update(status="success", progress=1.0, output_file=future.result(),
+                       message=f"File processed successfully. Index saved to {future.result()}")
+        else:
+            job.update(status="failed", progress=1.0, message=f"Processing failed: {str(error)[:200]}")
+            # 失敗的工作不再佔用 hash，允許重新上傳重試
+            _jobs_by_hash.pop(job["content_hash"], None)
+        _store(job)
+    if error is None:
+        registry.refresh()
+
+
+def submit(file_path: str, filename: str, content_hash: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Queue ``file_path`` for PageIndex processing. Returns ``(job, coalesced)``;
+    an upload whose content hash matches a queued, running or finished job
+    gets that job back instead of being indexed again.
+    """
+    with _lock:
+        existing = _jobs_by_hash.get(content_hash)
+        if existing:
+            return get(existing), True
+        shared_job = _load_by_hash(content_hash)
+        if shared_job is not None:
+            # Queued or finished by another API worker
+            return shared_job, True
+
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "filename": filename,
+            "content_hash": content_hash,
+            "status": "queued",
+            "progress": 0.0,
+            "message": "Waiting for an ingestion worker",
+            "output_file": None,
+            "created_at": time.time(),
+            "finished_at": None,
+            "owner_pid": os.getpid(),
+        }
+        _jobs[job_id] = job
+        _jobs_by_hash[content_hash] = job_id
+        _store(job)
+        _start_heartbeat()
+        future = _get_executor().submit(_run_index_job, file_path, content_hash)
+        _futures[job_id] = future
+    future.add_done_callback(lambda f: _on_done(job_id, f))
+    return dict(job), False
+
+
+def find_by_hash(content_hash: str) -> Optional[Dict[str, Any]]:
+    """The queued, running or finished job for this content, if any."""
+    job_id = _jobs_by_hash.get(content_hash)
+    return get(job_id) if job_id else _load_by_hash(content_hash)
+
+
+def active_for(filename: str) -> Optional[Dict[str, Any]]:
+    """A queued or running job for a PDF of this name (its file must not be replaced meanwhile)."""
+    with _lock:
+        for job_id, job in _jobs.items():
+            if job["filename"] == filename and job["status"] in ("queued", "running"):
+                return get(job_id)
+    shared = shared_state.get()
+    if shared is not None:
+        rows = shared.query(
+            "SELECT data FROM jobs WHERE json_extract(data, '$.filename') = ? "
+            "AND json_extract(data, '$.status') IN ('queued', 'running')",
+            (filename,),
+        )
+        for (data,) in rows:
+            job = _checked(data)
+            if job["status"] != "failed":
+                return job
+    return None
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    if job is None:
+        # Submitted to another API worker (multi-worker mode)
+        return _load(job_id)
+    if _refresh_status(job):
+        _store(job)
+    return dict(job)
+
+
+def shutdown():
+    global _executor, _heartbeat
+    _stopping.set()
+    _heartbeat = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,193 @@
+import os
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.services.embedding_cache import embedding_cache
+
+if TYPE_CHECKING:
+    # openai + httpx cost ~0.7 s to import; they are loaded by init_client()
+    import httpx
+    from openai import AsyncOpenAI
+
+load_dotenv()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("CHATGPT_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # None = 使用 OpenAI 官方端點
+EMBEDDING_MODEL = "text-embedding-3-small"  # Default model for LangChain's OpenAIEmbeddings
+
+# Connection pool / concurrency tuning
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# 同時進行中的 LLM / embedding 請求上限
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+# Per-task LLM usage accumulator, see track_usage()
+_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("llm_usage", default=None)
+
+_client: Optional["AsyncOpenAI"] = None
+_http_client: Optional["httpx.AsyncClient"] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def init_client() -> "AsyncOpenAI":
+    """Create the shared AsyncOpenAI client. Called once from the app lifespan."""
+    global _client, _http_client, _semaphore
+    if _client is not None:
+        return _client
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY / CHATGPT_API_KEY is not set")
+
+    import httpx
+    from openai import AsyncOpenAI
+
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+    client_kwargs = {
+        "api_key": OPENAI_API_KEY,
+        "http_client": _http_client,
+        "max_retries": LLM_MAX_RETRIES,
+    }
+    if OPENAI_BASE_URL:
+        client_kwargs["base_url"] = OPENAI_BASE_URL
+    _client = AsyncOpenAI(**client_kwargs)
+    _semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _client
+
+
+async def close_client():
+    global _client, _http_client, _semaphore
+    if _client is not None:
+        await _client.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+    _client = _http_client = _semaphore = None
+
+
+def get_client() -> "AsyncOpenAI":
+    # Scripts that call the services without the app lifespan get a lazily created client
+    return _client or init_client()
+
+
+@contextmanager
+def track_usage():
+    """
+    Collect call counts and token usage of every chat() made inside the block
+    (including tasks spawned from it)::
+
+        with llm_client.track_usage() as usage:
+            await pageindex_service.query(...)
+        usage["prompt_tokens"]
+    """
+    usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def usage_snapshot() -> Dict[str, int]:
+    """Copy of the usage collected so far by the enclosing track_usage() block (zeros outside one)."""
+    return dict(_usage.get() or {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+
+
+def _record_usage(response_usage):
+    usage = _usage.get()
+    if usage is None:
+        return
+    usage["calls"] += 1
+    if response_usage:
+        usage["prompt_tokens"] += response_usage.prompt_tokens or 0
+        usage["completion_tokens"] += response_usage.completion_tokens or 0
+
+
+async def chat(model: str, messages: List[dict], temperature: float = 0, timeout: Optional[float] = None, **kwargs):
+    """chat.completions.create through the shared client, bounded by LLM_MAX_CONCURRENCY."""
+    client = get_client()
+    async with _semaphore:
+        response = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            timeout=timeout or LLM_TIMEOUT,
+            **kwargs,
+        )
+    _record_usage(response.usage)
+    return response
+
+
+async def chat_stream(model: str, messages: List[dict], temperature: float = 0,
+                      timeout: Optional[float] = None, **kwargs) -> AsyncIterator[str]:
+    """Streaming chat completion; yields content deltas as they arrive."""
+    client = get_client()
+    response_usage = None
+    async with _semaphore:
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            timeout=timeout or LLM_TIMEOUT,
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                response_usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    _record_usage(response_usage)
+
+
+async def embed(texts: List[str], model: str = EMBEDDING_MODEL, timeout: Optional[float] = None):
+    """embeddings.create through the shared client, bounded by LLM_MAX_CONCURRENCY."""
+    client = get_client()
+    async with _semaphore:
+        return await client.embeddings.create(
+            input=texts,
+            model=model,
+            timeout=timeout or LLM_TIMEOUT,
+        )
+
+
+async def embed_cached(texts: List[str], model: str = EMBEDDING_MODEL,
+                       timeout: Optional[float] = None) -> Tuple[List[np.ndarray], int]:
+    """
+    Float32 embeddings of ``texts`` through the embedding cache: one batch
+    lookup, then a single embeddings request for the distinct texts that
+    missed. Returns the vectors in input order and the tokens spent.
+    """
+    # The cache may read its files or wait on another process's file lock; keep that off the event loop
+    vectors = await asyncio.to_thread(embedding_cache.lookup, texts, model)
+    missing = list(dict.fromkeys(texts[i] for i, v in enumerate(vectors) if v is None))
+    tokens = 0
+    if missing:
+        response = await embed(missing, model=model, timeout=timeout)
+        tokens = response.usage.total_tokens if response.usage else 0
+        fresh = [np.asarray(d.embedding, dtype=np.float32) for d in sorted(response.data, key=lambda d: d.index)]
+        await asyncio.to_thread(embedding_cache.store, missing, fresh, model)
+        by_text = dict(zip(missing, fresh))
+        vectors = [v if v is not None else by_text[t] for t, v in zip(texts, vectors)]
+    return vectors, tokens
+
+
+async def embed_query(text: str) -> np.ndarray:
+    """Unit-length float32 embedding of ``text``, ready for dot-product similarity."""
+    vector = (await embed_cached([text]))[0][0]
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
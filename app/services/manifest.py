@@ -0,0 +1,117 @@
+import os
+import json
+import hashlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+
+from app.services.page_store import file_sha256
+
+# 記錄每個來源檔的 hash、處理設定與產出物，供增量重建索引使用
+MANIFEST_DIR = os.getenv("MANIFEST_DIR", "data/manifests")
+PAGEINDEX_MANIFEST = os.path.join(MANIFEST_DIR, "pageindex_manifest.json")
+RAG_MANIFEST = os.path.join(MANIFEST_DIR, "rag_manifest.json")
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    payload = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class Manifest:
+    """
+    JSON manifest of ``source key -> entry`` for an ingestion pipeline.
+
+    An entry records the source file's content hash and (mtime, size), the
+    fingerprint of the config it was processed with, and the artifacts it
+    produced. ``classify()`` only hashes files whose (mtime, size) moved, so an
+    unchanged corpus is checked with a stat per file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = self._read()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("entries", {})
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        """Record ``entry`` and persist it, merging with writes from other processes."""
+        self.update({key: entry})
+
+    def update(self, entries: Dict[str, Dict[str, Any]]):
+        """Record several entries with one locked read-modify-write of the file."""
+        if not entries:
+            return
+        with self._locked():
+            self.entries = self._read()
+            self.entries.update(entries)
+            self._write()
+
+    def remove(self, key: str):
+        self.remove_many([key])
+
+    def remove_many(self, keys: Iterable[str]):
+        keys = list(keys)
+        if not keys:
+            return
+        with self._locked():
+            self.entries = self._read()
+            for key in keys:
+                self.entries.pop(key, None)
+            self._write()
+
+    def classify(self, key: str, path: str, fingerprint: str) -> Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Compare ``path`` against its manifest entry.
+
+        Returns ``(status, source, refreshed)`` where status is "unchanged",
+        "changed" or "new", and ``source`` holds the content hash and (mtime, size)
+        to store with the new entry. ``refreshed`` is the entry with updated stat
+        info when the file was touched but its content is identical; nothing is
+        written here, callers persist these with one ``update()``.
+        """
+        st = os.stat(path)
+        source = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+        entry = self.entries.get(key)
+        if entry and entry.get("config") == fingerprint \
+                and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size:
+            source["content_hash"] = entry["content_hash"]
+            return "unchanged", source, None
+
+        source["content_hash"] = file_sha256(path)
+        if entry is None:
+            return "new", source, None
+        if entry.get("config") == fingerprint and entry.get("content_hash") == source["content_hash"]:
+            # touched but identical content: only the stat info needs refreshing
+            return "unchanged", source, {**entry, **source}
+        return "changed", source, None
@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import asyncio
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import llm_client, page_store, telemetry, vector_store
+from app.services.manifest import Manifest, PAGEINDEX_MANIFEST, config_fingerprint
+from app.services.rag_ingest import Chunk, IngestStats, ingest
+from app.services.structure_store import BINARY_SUFFIX, StructureFile
+from app.services.tree_search import children, root_nodes
+
+COLLECTION_NAME = "pageindex_nodes"
+VECTOR_SIZE = 1536
+# process_pageindex.py 與上傳處理是否另外建立節點向量 (pageindex_nodes collection)
+PAGEINDEX_NODE_INDEX = os.getenv("PAGEINDEX_NODE_INDEX", "true").lower() in ("1", "true", "yes")
+# 每個節點送去 embedding 的文字上限 (字元)：標題、摘要，再接上節點頁面的開頭
+NODE_TEXT_MAX_CHARS = int(os.getenv("NODE_TEXT_MAX_CHARS", "2000"))
+# 節點向量快速路徑：off、shadow (照常樹搜索並比對結果) 或 on (信心足夠時跳過 LLM 樹搜索)
+PAGEINDEX_FAST_PATH = os.getenv("PAGEINDEX_FAST_PATH", "shadow")
+# 信心門檻：最佳節點的 cosine 分數，以及領先其他不重疊節點的差距
+PAGEINDEX_FAST_PATH_SCORE = float(os.getenv("PAGEINDEX_FAST_PATH_SCORE", "0.6"))
+PAGEINDEX_FAST_PATH_MARGIN = float(os.getenv("PAGEINDEX_FAST_PATH_MARGIN", "0.03"))
+# 快速路徑最多直接送去提取的節點數
+PAGEINDEX_FAST_PATH_NODES = int(os.getenv("PAGEINDEX_FAST_PATH_NODES", "3"))
+FAST_PATH_CANDIDATES = 10
+
+# Anything that changes the node texts or vectors; a change re-embeds every document
+NODE_INDEX_CONFIG = {
+    "embedding_model": llm_client.EMBEDDING_MODEL,
+    "max_chars": NODE_TEXT_MAX_CHARS,
+}
+
+
+def fingerprint() -> str:
+    return config_fingerprint(NODE_INDEX_CONFIG)
+
+
+class NodeChunk(Chunk):
+    """One structure node to embed; the payload locates its page range for extraction."""
+
+    __slots__ = ("doc_name", "node")
+
+    def __init__(self, doc_name: str, index: int, node: Dict[str, Any], text: str):
+        super().__init__(doc_name, index, text)
+        self.doc_name = doc_name
+        self.node = node
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "doc_name": self.doc_name,
+            "node_id": self.node.get("node_id"),
+            "title": self.node.get("title", ""),
+            "start_index": self.node.get("start_index"),
+            "end_index": self.node.get("end_index"),
+        }
+
+
+def load_structure(path: str) -> Any:
+    if path.endswith(BINARY_SUFFIX):
+        return StructureFile(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _iter_tree(nodes: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    for node in nodes:
+        yield node
+        yield from _iter_tree(children(node))
+
+
+def node_text(node: Dict[str, Any], pdf_path: str) -> str:
+    """Title and summary of a node followed by its first pages, cut to NODE_TEXT_MAX_CHARS."""
+    parts = [node.get("title", ""), node.get("summary") or node.get("prefix_summary") or ""]
+    text = "\n".join(p for p in parts if p)
+    start, end = node.get("start_index"), node.get("end_index")
+    page = start
+    try:
+        while page <= end and len(text) < NODE_TEXT_MAX_CHARS:
+            text += "\n" + "".join(page_store.get_pages(pdf_path, page - 1, page))
+            page += 1
+    except Exception as e:
+        print(f"Page text of {os.path.basename(pdf_path)} p.{page} unavailable, embedding title/summary only: {e}")
+    return text[:NODE_TEXT_MAX_CHARS]
+
+
+def document_chunks(doc_name: str, structure: Any, pdf_path: str) -> List[NodeChunk]:
+    """Every node of the tree that has a page range, in pre-order."""
+    chunks = []
+    for i, node in enumerate(_iter_tree(root_nodes(structure))):
+        if not isinstance(node.get("start_index"), int) or not isinstance(node.get("end_index"), int):
+            continue
+        fields = {k: node.get(k) for k in ("node_id", "title", "start_index", "end_index")}
+        chunks.append(NodeChunk(doc_name, i, fields, node_text(node, pdf_path)))
+    return chunks
+
+
+def _doc_filter(doc_names: List[str]):
+    from qdrant_client.http import models
+
+    return models.Filter(must=[models.FieldCondition(key="doc_name", match=models.MatchAny(any=doc_names))])
+
+
+def ensure_collection(client):
+    from qdrant_client.http import models
+
+    if not client.collection_exists(COLLECTION_NAME):
+        print(f"Creating new collection: {COLLECTION_NAME}")
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config=models.VectorParams(size=VECTOR_SIZE, distance=models.Distance.COSINE),
+        )
+        client.create_payload_index(COLLECTION_NAME, "doc_name", models.PayloadSchemaType.KEYWORD)
+
+
+def remove_documents(doc_names: List[str], client=None):
+    """Delete the node vectors of documents that were removed or are about to be re-embedded."""
+    from qdrant_client import QdrantClient
+    from qdrant_client.http import models
+
+    if not doc_names:
+        return
+    client = client or QdrantClient(**vector_store.client_kwargs())
+    if client.collection_exists(COLLECTION_NAME):
+        client.delete(collection_name=COLLECTION_NAME, points_selector=models.FilterSelector(filter=_doc_filter(doc_names)))
+
+
+def build(keys: List[str], pdf_dir: str) -> List[str]:
+    """
+    Embed the nodes of the PageIndex manifest entries ``keys`` (PDF file names)
+    into the ``pageindex_nodes`` collection. Each document's old vectors are
+    replaced; documents that finished are marked with the node index
+    fingerprint in the manifest. Returns the keys that were indexed.
+    """
+    from qdrant_client import QdrantClient
+
+    manifest = Manifest(PAGEINDEX_MANIFEST)
+    docs = []
+    for key in keys:
+        entry = manifest.get(key) or {}
+        structure_path = entry.get("artifacts", {}).get("structure")
+        if not entry.get("doc_name") or not structure_path or not os.path.exists(structure_path):
+            continue
+        docs.append((key, entry["doc_name"], load_structure(structure_path), os.path.join(pdf_dir, key)))
+    if not docs:
+        return []
+
+    client = QdrantClient(**vector_store.client_kwargs())
+    ensure_collection(client)
+    remove_documents([doc_name for _, doc_name, _, _ in docs], client)
+
+    chunks, failed = [], set()
+    for _, doc_name, structure, pdf_path in docs:
+        chunks.extend(document_chunks(doc_name, structure, pdf_path))
+
+    def on_batch_done(batch, error):
+        if error is not None:
+            failed.update(chunk.doc_name for chunk in batch)
+
+    async def run():
+        try:
+            await ingest(chunks, client, COLLECTION_NAME, stats, on_batch_done=on_batch_done)
+        finally:
+            await llm_client.close_client()
+
+    stats = IngestStats()
+    asyncio.run(run())
+
+    indexed = {}
+    for key, doc_name, _, _ in docs:
+        if doc_name in failed:
+            print(f"Node embeddings of {key} failed; they will be retried on the next run")
+            continue
+        indexed[key] = {**(manifest.get(key) or {}), "node_index": fingerprint()}
+    manifest.update(indexed)
+    print(f"Node index: {len(indexed)}/{len(docs)} documents, {stats.summary()}")
+    return list(indexed)
+
+
+def stale_keys(manifest: Manifest) -> List[str]:
+    """Manifest entries whose node vectors are missing or were built with another config."""
+    current = fingerprint()
+    return [key for key, entry in manifest.entries.items() if entry.get("node_index") != current]
+
+
+class Proposal:
+    """Candidate nodes from the vector lookup and whether they are confident enough to skip tree search."""
+
+    def __init__(self, candidates: List[Dict[str, Any]]):
+        self.candidates = candidates
+        self.top_score = candidates[0]["score"] if candidates else 0.0
+        # Best candidate whose pages do not overlap the top one (a parent or child of it is no competition)
+        runner_up = next((c["score"] for c in candidates[1:] if not _overlaps(c, candidates[0])), 0.0)
+        self.margin = self.top_score - runner_up if candidates else 0.0
+        self.confident = bool(candidates) and self.top_score >= PAGEINDEX_FAST_PATH_SCORE \
+            and self.margin >= PAGEINDEX_FAST_PATH_MARGIN
+
+    def doc_nodes(self) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Nodes within the margin of the top score, grouped per document like the tree search output."""
+        picked = [c for c in self.candidates if c["score"] >= self.top_score - PAGEINDEX_FAST_PATH_MARGIN]
+        grouped: Dict[str, List[Dict[str, Any]]] = {}
+        for c in picked[:PAGEINDEX_FAST_PATH_NODES]:
+            grouped.setdefault(c["doc_name"], []).append(
+                {"title": c["title"], "start_index": c["start_index"], "end_index": c["end_index"]})
+        return list(grouped.items())
+
+
+def _overlaps(a: Mapping, b: Mapping) -> bool:
+    return a["start_index"] <= b["end_index"] and b["start_index"] <= a["end_index"]
+
+
+def agreement(proposal: Proposal, doc_nodes: List[Tuple[str, List[Dict[str, Any]]]]) -> bool:
+    """Whether the fast path's pages overlap what the LLM tree search selected (shadow mode accuracy)."""
+    selected = [(doc, n) for doc, nodes in doc_nodes for n in nodes
+                if isinstance(n.get("start_index"), int) and isinstance(n.get("end_index"), int)]
+    for doc, nodes in proposal.doc_nodes():
+        for node in nodes:
+            if any(doc == d and _overlaps(node, n) for d, n in selected):
+                return True
+    return False
+
+
+class NodeIndex:
+    """
+    Query side of the ``pageindex_nodes`` collection: proposes candidate nodes
+    for a query vector within the shortlisted documents. Keeps per-process
+    counters of how often the fast path was taken and, in shadow mode, how
+    often it agreed with the LLM tree search.
+    """
+
+    def __init__(self):
+        self._available: Optional[bool] = None
+        self._checked_at = 0.0
+        # Mean LLM calls a tree search spent per document, to estimate what a fast-path query saved
+        self._tree_calls = 0
+        self._tree_docs = 0
+        self.counters = {
+            "lookups": 0,
+            "confident": 0,
+            "used": 0,
+            "shadow_compared": 0,
+            "shadow_agreed": 0,
+            "llm_calls_saved": 0.0,
+            "errors": 0,
+        }
+
+    @property
+    def mode(self) -> str:
+        return PAGEINDEX_FAST_PATH if PAGEINDEX_FAST_PATH in ("shadow", "on") else "off"
+
+    async def _collection_available(self) -> bool:
+        if self._available is None or time.time() - self._checked_at > vector_store.QDRANT_STATE_TTL:
+            try:
+                self._available = await vector_store.get_client().collection_exists(COLLECTION_NAME)
+            except Exception as e:
+                print(f"Node index check failed: {e}")
+                self._available = False
+            self._checked_at = time.time()
+        return self._available
+
+    async def propose(self, query_vector: Optional[np.ndarray], doc_names: List[str]) -> Optional[Proposal]:
+        if self.mode == "off" or query_vector is None or not doc_names or not await self._collection_available():
+            return None
+        self.counters["lookups"] += 1
+        try:
+            response = await vector_store.get_client().query_points(
+                collection_name=COLLECTION_NAME,
+                query=np.asarray(query_vector, dtype=np.float32).tolist(),
+                query_filter=_doc_filter(doc_names),
+                limit=FAST_PATH_CANDIDATES,
+                with_payload=True,
+            )
+        except Exception as e:
+            print(f"Node index lookup failed: {e}")
+            self.counters["errors"] += 1
+            return None
+        candidates = [{**(p.payload or {}), "score": float(p.score)} for p in response.points
+                      if isinstance((p.payload or {}).get("start_index"), int)]
+        proposal = Proposal(candidates)
+        self.counters["confident"] += proposal.confident
+        return proposal
+
+    def estimated_calls(self, documents: int) -> float:
+        """LLM calls a tree search over ``documents`` documents would have made (running mean)."""
+        return self._tree_calls / self._tree_docs * documents if self._tree_docs else 0.0
+
+    def record_used(self, proposal: Proposal, documents: int):
+        """The fast path answered instead of the tree search (PAGEINDEX_FAST_PATH=on)."""
+        saved = self.estimated_calls(documents)
+        self.counters["used"] += 1
+        self.counters["llm_calls_saved"] += saved
+        telemetry.fast_path("used", score=round(proposal.top_score, 4), margin=round(proposal.margin, 4),
+                            llm_calls_saved=round(saved, 1))
+
+    def record_tree_search(self, proposal: Optional[Proposal], doc_nodes: List[Tuple[str, List[Dict[str, Any]]]],
+                           llm_calls: int, documents: int):
+        """
+        The LLM tree search ran. In shadow mode a confident proposal is compared
+        with its result: ``llm_calls_avoidable`` is what taking the fast path
+        would have saved, ``agreed`` whether it would have found the same pages.
+        """
+        self._tree_calls += llm_calls
+        self._tree_docs += documents
+        if proposal is None:
+            return
+        fields = {"score": round(proposal.top_score, 4), "margin": round(proposal.margin, 4)}
+        if not proposal.confident:
+            telemetry.fast_path("fallback", **fields)
+            return
+        agreed = agreement(proposal, doc_nodes)
+        self.counters["shadow_compared"] += 1
+        self.counters["shadow_agreed"] += agreed
+        telemetry.fast_path("shadow_agree" if agreed else "shadow_disagree", **fields,
+                            llm_calls_avoidable=llm_calls, agreed=agreed)
+
+    def stats(self) -> Dict[str, Any]:
+        compared = self.counters["shadow_compared"]
+        return {
+            "mode": self.mode,
+            "score_threshold": PAGEINDEX_FAST_PATH_SCORE,
+            "margin": PAGEINDEX_FAST_PATH_MARGIN,
+            **self.counters,
+            "shadow_agreement_rate": self.counters["shadow_agreed"] / compared if compared else None,
+            "tree_search_calls_per_doc": self._tree_calls / self._tree_docs if self._tree_docs else None,
+        }
+
+
+node_index = NodeIndex()
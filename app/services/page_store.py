@@ -0,0 +1,256 @@
+import os
+import mmap
+import struct
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+# 每份 PDF 一個 .pages 檔：header + 頁面 offset 表 + UTF-8 文字
+PAGE_STORE_DIR = os.getenv("PAGE_STORE_DIR", "data/page_store")
+STORE_SUFFIX = ".pages"
+# 頁面文字提取的 process 數 (0 = CPU 核心數平分給每個 API worker (WEB_CONCURRENCY)；1 = 不使用 process pool)
+PAGE_EXTRACT_WORKERS = (int(os.getenv("PAGE_EXTRACT_WORKERS", "0"))
+                        or max(1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1")))))
+# 頁數達到此值才分散到 process pool；每個工作提取的頁數
+PAGE_EXTRACT_MIN_PAGES = int(os.getenv("PAGE_EXTRACT_MIN_PAGES", "64"))
+PAGE_EXTRACT_BATCH = int(os.getenv("PAGE_EXTRACT_BATCH", "16"))
+# Open fitz documents kept per extraction worker
+_WORKER_OPEN_DOCS = 8
+
+_MAGIC = b"PGTX"
+_FORMAT_VERSION = 1
+# magic, version, reserved, sha256 of the PDF bytes, page count
+_HEADER = struct.Struct("<4sHH32sI")
+_OFFSET = struct.Struct("<Q")
+
+
+class PageStore:
+    """Read-only, memory-mapped view of one ``.pages`` file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, digest, page_count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a page store file: {path}")
+        self.content_hash = digest.hex()
+        self.page_count = page_count
+        self._offsets_at = _HEADER.size
+        self._data_at = self._offsets_at + _OFFSET.size * (page_count + 1)
+
+    def _offset(self, i: int) -> int:
+        return _OFFSET.unpack_from(self._mm, self._offsets_at + _OFFSET.size * i)[0]
+
+    def get_pages(self, start_idx: int, end_idx: int) -> List[str]:
+        """Texts of pages ``[start_idx, end_idx)`` (0-based), clamped to the document."""
+        start_idx = max(0, start_idx)
+        end_idx = min(self.page_count, end_idx)
+        if start_idx >= end_idx:
+            return []
+        bounds = [self._offset(i) for i in range(start_idx, end_idx + 1)]
+        base = self._data_at
+        return [
+            self._mm[base + bounds[i]: base + bounds[i + 1]].decode("utf-8")
+            for i in range(len(bounds) - 1)
+        ]
+
+    def close(self):
+        self._mm.close()
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def store_path_for(pdf_path: str) -> str:
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(PAGE_STORE_DIR, f"{name}{STORE_SUFFIX}")
+
+
+# Extraction worker state: pdf_path -> ((mtime_ns, size), open fitz document)
+_worker_docs: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _worker_document(pdf_path: str, signature: Tuple[int, int]):
+    """The worker's open handle of ``pdf_path``, reopened when the file changed."""
+    import fitz  # PyMuPDF
+
+    cached = _worker_docs.get(pdf_path)
+    if cached is not None and cached[0] == signature:
+        _worker_docs.move_to_end(pdf_path)
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    doc = fitz.open(pdf_path)
+    _worker_docs[pdf_path] = (signature, doc)
+    while len(_worker_docs) > _WORKER_OPEN_DOCS:
+        _worker_docs.popitem(last=False)[1][1].close()
+    return doc
+
+
+def _extract_span(pdf_path: str, signature: Tuple[int, int], start: int, end: int) -> List[str]:
+    """Texts of pages ``[start, end)``; runs in an extraction worker."""
+    doc = _worker_document(pdf_path, signature)
+    return [doc[i].get_text() for i in range(start, end)]
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Process pool shared by every page store build in this process, created on
+    first use. None when there is a single CPU, or inside a worker process of
+    another pool (index_scheduler), which already runs one document per CPU.
+    """
+    global _pool
+    if PAGE_EXTRACT_WORKERS <= 1 or multiprocessing.parent_process() is not None:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: callers may have live threads (registry watcher, event loop)
+                _pool = ProcessPoolExecutor(max_workers=PAGE_EXTRACT_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _extract_pages(pdf_path: str) -> List[str]:
+    """
+    Text of every page, in page order. Large documents are split into
+    PAGE_EXTRACT_BATCH-page spans extracted in parallel by the pool workers,
+    each reusing its own open handle of the PDF.
+    """
+    # Only page store builds need PyMuPDF; readers of existing .pages files never load it
+    import fitz  # PyMuPDF
+
+    doc = fitz.open(pdf_path)
+    try:
+        pool = _extraction_pool() if doc.page_count >= PAGE_EXTRACT_MIN_PAGES else None
+        if pool is None:
+            return [page.get_text() for page in doc]
+        page_count = doc.page_count
+    finally:
+        doc.close()
+
+    signature = _signature(pdf_path)
+    spans = [(start, min(start + PAGE_EXTRACT_BATCH, page_count))
+             for start in range(0, page_count, PAGE_EXTRACT_BATCH)]
+    try:
+        futures = [pool.submit(_extract_span, pdf_path, signature, start, end) for start, end in spans]
+        pages: List[str] = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
+    except BrokenProcessPool as e:
+        # A worker died (e.g. PyMuPDF crashed on a damaged page); start a fresh pool next time
+        print(f"Page extraction pool failed, extracting {os.path.basename(pdf_path)} in-process: {e}")
+        shutdown_pool()
+        doc = fitz.open(pdf_path)
+        try:
+            return [page.get_text() for page in doc]
+        finally:
+            doc.close()
+
+
+def build(pdf_path: str, content_hash: Optional[str] = None) -> str:
+    """Extract every page of ``pdf_path`` once and write its page store atomically."""
+    content_hash = content_hash or file_sha256(pdf_path)
+    encoded = [text.encode("utf-8") for text in _extract_pages(pdf_path)]
+
+    offsets = [0]
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+
+    out_path = store_path_for(pdf_path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, 0, bytes.fromhex(content_hash), len(encoded)))
+        f.write(b"".join(_OFFSET.pack(o) for o in offsets))
+        f.writelines(encoded)
+    os.replace(tmp_path, out_path)
+    invalidate(pdf_path)
+    return out_path
+
+
+# pdf_path -> ((mtime_ns, size) of the PDF when verified, open store)
+_open_stores: Dict[str, Tuple[Tuple[int, int], PageStore]] = {}
+# Guards the two dicts only; hashing and building happen under the PDF's own lock
+_lock = threading.RLock()
+_path_locks: Dict[str, threading.Lock] = {}
+
+
+def _signature(pdf_path: str) -> Tuple[int, int]:
+    st = os.stat(pdf_path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def open_store(pdf_path: str) -> PageStore:
+    """
+    Return the page store for ``pdf_path``, building it on first touch.
+
+    The PDF's content hash is only recomputed when its mtime/size differ from
+    the last verified state; a hash mismatch rebuilds the store.
+    """
+    signature = _signature(pdf_path)
+    cached = _open_stores.get(pdf_path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    with _lock:
+        path_lock = _path_locks.setdefault(pdf_path, threading.Lock())
+    # One verification / build per PDF at a time; other documents are not held up by it
+    with path_lock:
+        cached = _open_stores.get(pdf_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        content_hash = file_sha256(pdf_path)
+        store_path = store_path_for(pdf_path)
+        store = None
+        if os.path.exists(store_path):
+            try:
+                store = PageStore(store_path)
+            except (OSError, ValueError, struct.error):
+                store = None
+            if store and store.content_hash != content_hash:
+                store.close()
+                store = None
+        if store is None:
+            build(pdf_path, content_hash)
+            store = PageStore(store_path)
+
+        # 舊的 mmap 可能仍被其他請求讀取中，交給 GC 關閉
+        with _lock:
+            _open_stores[pdf_path] = (signature, store)
+        return store
+
+
+def get_pages(pdf_path: str, start_idx: int, end_idx: int) -> List[str]:
+    """Texts of pages ``[start_idx, end_idx)`` (0-based) served from the page store."""
+    return open_store(pdf_path).get_pages(start_idx, end_idx)
+
+
+def invalidate(pdf_path: str):
+    with _lock:
+        _open_stores.pop(pdf_path, None)
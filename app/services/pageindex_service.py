@@ -1,90 +1,81 @@
 import os
 import sys
 import json
-import glob
-from typing import Tuple, List, Dict, Any
+import asyncio
+from collections.abc import Mapping
+from typing import AsyncIterator, Tuple, List, Dict, Any, Optional
 from dotenv import load_dotenv
-import fitz  # PyMuPDF
+import numpy as np
 
 # Add PageIndex library to path for utility functions
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'lib', 'PageIndex'))
 
-from openai import OpenAI
+from app.services import llm_client, events, telemetry
+from app.services.structure_registry import registry
+from app.services import page_store, context_assembler
+from app.services.doc_index import doc_index
+from app.services.node_index import node_index
+from app.services.tree_search import TreeSearcher
 
 load_dotenv()
 
-INDEX_DIR = "lib/PageIndex/tests/results"
 PDF_DIR = "lib/PageIndex/tests/pdfs"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("CHATGPT_API_KEY")
-OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 OPENAI_MODEL = "gpt-4o-mini"
 # OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini") # 改為 gpt-4o-mini 以支援更大 Context
+# 文件初選：最多取幾份文件，以及與最佳分數的容許差距 (cosine)
+PAGEINDEX_TOP_K_DOCS = int(os.getenv("PAGEINDEX_TOP_K_DOCS", "3"))
+PAGEINDEX_DOC_MARGIN = float(os.getenv("PAGEINDEX_DOC_MARGIN", "0.05"))
+# 樹搜索模式："hierarchical" (逐層、限制 token) 或 "single_shot" (整棵樹一次送出)
+PAGEINDEX_TREE_SEARCH = os.getenv("PAGEINDEX_TREE_SEARCH", "hierarchical")
 
-def extract_text_from_pdf(doc_name: str, start_page: int, end_page: int) -> str:
-    """從 PDF 文件的特定頁碼範圍提取文字 (1-based index)。"""
+tree_searcher = TreeSearcher(OPENAI_MODEL)
+
+def load_pages(doc_name: str, start_page: int, end_page: int) -> List[str]:
+    """從 PDF 文件的特定頁碼範圍逐頁提取文字 (1-based index，含 end_page)。"""
     pdf_path = os.path.join(PDF_DIR, f"{doc_name}.pdf")
     if not os.path.exists(pdf_path):
-        return ""
-    
+        return []
+
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        # 配合 search.py 的邏輯：1-based 轉 0-based
-        start_idx = max(0, start_page - 1)
-        end_idx = min(doc.page_count, end_page)
-        
-        for i in range(start_idx, end_idx):
-            text += doc[i].get_text() + "\n"
-        doc.close()
-        return text
+        # 配合 search.py 的邏輯：1-based 轉 0-based；頁面文字由 page store 的 mmap 直接切片
+        return page_store.get_pages(pdf_path, start_page - 1, end_page)
     except Exception as e:
         print(f"提取 PDF 文字時出錯: {e}")
-        return ""
+        return []
 
-async def query(message: str) -> Tuple[str, List[str]]:
+def extract_text_from_pdf(doc_name: str, start_page: int, end_page: int) -> str:
+    """從 PDF 文件的特定頁碼範圍提取文字 (1-based index)。"""
+    return "".join(f"{text}\n" for text in load_pages(doc_name, start_page, end_page))
+
+async def select_documents(indices: Dict[str, Any], query_vector: Optional[np.ndarray]) -> List[str]:
     """
-    完全比照 PageIndex/search.py 的四階段查詢邏輯。
+    文件初選：以 doc_description / 節點摘要的 embedding 做本地向量排序，不再呼叫 LLM。
+    回傳分數與最佳文件相差 PAGEINDEX_DOC_MARGIN 以內的前 PAGEINDEX_TOP_K_DOCS 份文件。
     """
-    if not OPENAI_API_KEY:
-        return "錯誤：找不到 OPENAI_API_KEY 或 CHATGPT_API_KEY。", []
-    
+    if len(indices) == 1:
+        return list(indices.keys())
     try:
-        # 1. 加載文檔結構 (Step 1: Load Structure)
-        index_files = glob.glob(os.path.join(INDEX_DIR, "*_structure.json"))
-        if not index_files:
-            return "找不到索引檔案。請先執行 'python scripts/process_pageindex.py'。", []
-        
-        indices = {}
-        for index_file in index_files:
-            doc_name = os.path.basename(index_file).replace("_structure.json", "")
-            with open(index_file, 'r', encoding='utf-8') as f:
-                indices[doc_name] = json.load(f)
-
-        # 初始化 OpenAI Client
-        client_kwargs = {"api_key": OPENAI_API_KEY}
-        if OPENAI_BASE_URL:
-            client_kwargs["base_url"] = OPENAI_BASE_URL
-        client = OpenAI(**client_kwargs)
+        if query_vector is None:
+            raise ValueError("no query embedding")
+        candidates = await doc_index.shortlist(query_vector, PAGEINDEX_TOP_K_DOCS)
+    except Exception as e:
+        print(f"Document pre-selection failed, using the first {PAGEINDEX_TOP_K_DOCS} documents: {e}")
+        return sorted(indices.keys())[:PAGEINDEX_TOP_K_DOCS]
+    if not candidates:
+        # e.g. document summaries not embedded yet
+        return sorted(indices.keys())[:PAGEINDEX_TOP_K_DOCS]
 
-        # 1.5 文件初選 (如果有多份文件)
-        doc_descriptions = "\n".join([f"- {name}" for name in indices.keys()])
-        doc_selection_prompt = f"從以下文件中挑選最相關的一個：\n{doc_descriptions}\n問題：{message}\n請直接輸出名稱。"
-        
-        res = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "user", "content": doc_selection_prompt}],
-            temperature=0
-        )
-        selected_doc = res.choices[0].message.content.strip()
-        if selected_doc not in indices:
-            selected_doc = list(indices.keys())[0]
-
-        # 2. 樹搜索階段 (Step 2: Tree Search)
-        # 取得該文件的結構
-        index_data = indices[selected_doc]
-        tree_structure = index_data.get('structure', index_data) if isinstance(index_data, dict) else index_data
-
-        search_prompt = f"""
+    best_score = candidates[0][1]
+    selected = [name for name, score in candidates if score >= best_score - PAGEINDEX_DOC_MARGIN]
+    print(f"Document shortlist: {[(name, round(score, 3)) for name, score in candidates]} -> {selected}")
+    return selected
+
+async def single_shot_tree_search(message: str, index_data: Any) -> List[Dict[str, Any]]:
+    """原始的單次樹搜索：把整棵文件樹放進同一個 prompt 讓 LLM 挑節點 (保留供比較與切換)。"""
+    tree_structure = index_data.get('structure', index_data) if isinstance(index_data, Mapping) else index_data
+
+    search_prompt = f"""
         You are given a question and a tree structure of a document.
         Each node contains a title and page range (start_index, end_index).
         Your task is to identify the nodes that are most likely to contain the answer to the question.
@@ -108,33 +99,114 @@ async def query(message: str) -> Tuple[str, List[str]]:
         Directly return the JSON only. 務必使用繁體中文進行思考說明。
         """
 
-        search_res = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "user", "content": search_prompt}],
-            temperature=0
-        )
-        
-        raw_search = search_res.choices[0].message.content.strip()
-        if "```json" in raw_search:
-            raw_search = raw_search.split("```json")[1].split("```")[0]
-        elif "```" in raw_search:
-            raw_search = raw_search.split("```")[1].split("```")[0]
-            
-        search_result = json.loads(raw_search)
-        nodes = search_result.get("relevant_nodes", [])
+    search_res = await llm_client.chat(
+        model=OPENAI_MODEL,
+        messages=[{"role": "user", "content": search_prompt}],
+        temperature=0
+    )
+
+    raw_search = search_res.choices[0].message.content.strip()
+    if "```json" in raw_search:
+        raw_search = raw_search.split("```json")[1].split("```")[0]
+    elif "```" in raw_search:
+        raw_search = raw_search.split("```")[1].split("```")[0]
+
+    search_result = json.loads(raw_search)
+    return search_result.get("relevant_nodes", [])
+
+async def tree_search(message: str, doc_name: str, index_data: Any,
+                      query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    if PAGEINDEX_TREE_SEARCH == "single_shot":
+        return await single_shot_tree_search(message, index_data)
+    return await tree_searcher.search(message, doc_name, index_data, query_vector)
+
+async def query_events(message: str, query_vector=None) -> AsyncIterator[events.Event]:
+    """
+    比照 PageIndex/search.py 的四階段查詢邏輯；文件初選改為本地向量排序，並可同時從多份文件取材。
+    以事件串流回報各階段進度 (docs_selected / nodes_selected / pages_extracted)，
+    接著逐段輸出答案 token，最後輸出 sources。
+    ``query_vector`` may carry an already computed embedding of ``message``.
+    """
+    if not OPENAI_API_KEY:
+        yield events.token("錯誤：找不到 OPENAI_API_KEY 或 CHATGPT_API_KEY。")
+        yield events.sources([])
+        return
+
+    try:
+        # 1. 加載文檔結構 (Step 1: Load Structure)
+        # 結構由 registry 常駐記憶體，檔案異動時才重新讀取
+        indices = registry.get_all()
+        if not indices:
+            yield events.token("找不到索引檔案。請先執行 'python scripts/process_pageindex.py'。")
+            yield events.sources([])
+            return
+
+        if query_vector is None:
+            try:
+                with telemetry.span("query_embedding"):
+                    query_vector = await llm_client.embed_query(message)
+            except Exception as e:
+                print(f"Query embedding failed: {e}")
+        elif not isinstance(query_vector, np.ndarray):
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+
+        # 1.5 文件初選 (如果有多份文件)
+        with telemetry.span("doc_selection"):
+            selected_docs = await select_documents(indices, query_vector)
+        yield events.stage("docs_selected", documents=selected_docs)
+
+        # 1.8 節點向量快速路徑：候選節點夠有把握時 (PAGEINDEX_FAST_PATH=on) 直接提取，不呼叫 LLM 樹搜索
+        with telemetry.span("node_lookup"):
+            proposal = await node_index.propose(query_vector, selected_docs)
+
+        doc_nodes = []
+        if proposal is not None and proposal.confident and node_index.mode == "on":
+            doc_nodes = proposal.doc_nodes()
+            node_index.record_used(proposal, len(selected_docs))
+            for selected_doc, nodes in doc_nodes:
+                yield events.stage("nodes_selected", document=selected_doc, nodes=nodes, fast_path=True)
+        else:
+            calls_before = llm_client.usage_snapshot()["calls"]
+            # 2. 樹搜索階段 (Step 2: Tree Search)
+            # 各候選文件的樹搜索同時進行，總延遲約等於最慢的一份而非逐份相加
+            with telemetry.span("tree_search"):
+                results = await asyncio.gather(*(
+                    tree_search(message, selected_doc, indices[selected_doc], query_vector)
+                    for selected_doc in selected_docs
+                ), return_exceptions=True)
+            failures = [r for r in results if isinstance(r, BaseException)]
+            if failures and len(failures) == len(results):
+                raise failures[0]
+            for selected_doc, nodes in zip(selected_docs, results):
+                if isinstance(nodes, BaseException):
+                    print(f"Tree search failed for {selected_doc}, continuing with the other documents: {nodes}")
+                    yield events.degraded(f"tree search failed for {selected_doc}")
+                    continue
+                yield events.stage("nodes_selected", document=selected_doc, nodes=[
+                    {"title": n.get("title"), "start_index": n.get("start_index"), "end_index": n.get("end_index")}
+                    for n in nodes
+                ])
+                doc_nodes.append((selected_doc, nodes))
+            node_index.record_tree_search(proposal, doc_nodes, llm_client.usage_snapshot()["calls"] - calls_before,
+                                          len(selected_docs))
 
         # 3. 內容提取階段 (Step 3: Content Extraction)
-        context_text = ""
-        for node in nodes:
-            start = node.get("start_index")
-            end = node.get("end_index")
-            title = node.get("title")
-            if start is not None and end is not None:
-                text = extract_text_from_pdf(selected_doc, start, end)
-                context_text += f"\n--- Section: {title} (Pages {start}-{end}) ---\n{text}\n"
+        # 合併重疊頁碼、每頁只提取一次，依問題排序後裁切到 PAGEINDEX_CONTEXT_TOKENS
+        with telemetry.span("page_extraction"):
+            context = await asyncio.to_thread(context_assembler.assemble, message, doc_nodes, load_pages)
+        print(f"Context: {context['tokens_used']} tokens used, {context['tokens_dropped']} dropped "
+              f"({context['pages_used']}/{context['pages_total']} pages, budget {context['budget']})")
+        yield events.stage("pages_extracted", documents=context["sources"],
+                           pages=context["pages_used"], pages_total=context["pages_total"],
+                           tokens_used=context["tokens_used"], tokens_dropped=context["tokens_dropped"])
 
+        context_text = context["text"]
+        sources = context["sources"]
         if not context_text:
-            return "無法從文件中提取相關內容。", [f"{selected_doc}.pdf"]
+            yield events.degraded("no page text extracted")
+            yield events.token("無法從文件中提取相關內容。")
+            yield events.sources([f"{doc}.pdf" for doc in selected_docs])
+            return
 
         # 4. 答案生成階段 (Step 4: Answer Generation)
         answer_prompt = f"""你是一個專業的分析師。請根據以下提供的上下文內容回答問題。
@@ -149,20 +221,29 @@ async def query(message: str) -> Tuple[str, List[str]]:
 1. 必須使用繁體中文。
 2. 根據提供的內容進行精確回答，列出具體數字和金額。
 3. 如果內容中沒有答案，請說不知道。
+4. 若內容來自多份文件，請註明各數據出自哪份文件。
 
 答案："""
 
-        answer_res = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "user", "content": answer_prompt}],
-            temperature=0
-        )
-        
-        return answer_res.choices[0].message.content, [f"{selected_doc}.pdf"]
+        with telemetry.span("answer_generation"):
+            async for delta in llm_client.chat_stream(
+                model=OPENAI_MODEL,
+                messages=[{"role": "user", "content": answer_prompt}],
+                temperature=0
+            ):
+                yield events.token(delta)
+
+        yield events.sources(sources)
 
     except Exception as e:
         print(f"PageIndex Query Error: {e}")
-        return f"查詢出錯：{str(e)}", []
+        telemetry.mark_error(e)
+        yield events.token(f"查詢出錯：{str(e)}")
+        yield events.sources([])
+
+async def query(message: str, query_vector=None) -> Tuple[str, List[str]]:
+    """Non-streaming wrapper around query_events()."""
+    return await events.collect(query_events(message, query_vector))
 
 
 def get_tree_summary(tree: dict) -> str:
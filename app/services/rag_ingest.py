@@ -0,0 +1,160 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services import llm_client
+from app.services.embedding_cache import embedding_cache
+
+# Embedding / upsert tuning for the RAG ingestion pipeline
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+
+# Fixed namespace so the same (source, chunk index, content) always maps to the same point id
+POINT_NAMESPACE = uuid.UUID("6f1c3a52-8f0e-4b8e-9a55-3c1f2d7a9b10")
+
+
+def _retryable() -> tuple:
+    # openai is already loaded by the time an embedding fails; importing it here keeps module import cheap
+    import openai
+
+    return openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id(source: str, chunk_index: int, text: str) -> str:
+    """Deterministic Qdrant point id, so a retried run overwrites instead of duplicating."""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{source}:{chunk_index}:{text_hash(text)}"))
+
+
+class Chunk:
+    __slots__ = ("id", "text", "source", "index")
+
+    def __init__(self, source: str, index: int, text: str):
+        self.source = source
+        self.index = index
+        self.text = text
+        self.id = point_id(source, index, text)
+
+    def payload(self) -> Dict[str, Any]:
+        # Same payload layout LangChain's Qdrant wrapper writes; rag_service reads it
+        return {"page_content": self.text, "metadata": {"source": self.source, "chunk_index": self.index}}
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.chunks = 0
+        self.tokens = 0
+        self.batches = 0
+        self.retries = 0
+        self._cache_hits_before = self._cache_hits()
+
+    @staticmethod
+    def _cache_hits() -> int:
+        return embedding_cache.counters["memory_hits"] + embedding_cache.counters["disk_hits"]
+
+    @property
+    def cached(self) -> int:
+        """Chunks served from the embedding cache instead of the API since these stats started."""
+        return self._cache_hits() - self._cache_hits_before
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> str:
+        elapsed = max(self.elapsed, 1e-9)
+        return (f"{self.chunks} chunks in {elapsed:.1f}s "
+                f"({self.chunks / elapsed:.1f} chunks/s, {self.tokens / elapsed:.0f} embedding tokens/s, "
+                f"{self.batches} batches, {self.retries} retries, {self.cached} from the embedding cache)")
+
+
+def _batched(items: Iterable[Chunk], size: int) -> Iterator[List[Chunk]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _embed_with_retry(texts: List[str], stats: IngestStats) -> Tuple[List[List[float]], int]:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            # Chunks whose text was embedded before (any file, any run) come from the embedding cache
+            vectors, tokens = await llm_client.embed_cached(texts)
+            return [v.tolist() for v in vectors], tokens
+        except _retryable() as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            stats.retries += 1
+            delay = min(60, 2 ** attempt) + random.uniform(0, 1)
+            print(f"Embedding batch failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+
+async def ingest(
+    chunks: Iterable[Chunk],
+    client,
+    collection_name: str,
+    stats: IngestStats,
+    on_batch_done: Optional[Callable[[List[Chunk], Optional[BaseException]], None]] = None,
+):
+    """
+    Stream ``chunks`` through batched embedding and bulk Qdrant upserts.
+
+    Up to EMBED_CONCURRENCY embedding requests are in flight at once, and each
+    embedded batch is upserted in UPSERT_BATCH_SIZE slices on worker threads
+    (at most UPSERT_CONCURRENCY at a time). ``on_batch_done(batch, error)`` is
+    called once per batch so callers can track per-file completion.
+    """
+    from qdrant_client.http import models
+
+    embed_sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    upsert_sem = asyncio.Semaphore(UPSERT_CONCURRENCY)
+
+    async def upsert(points: List["models.PointStruct"]):
+        async with upsert_sem:
+            await asyncio.to_thread(client.upsert, collection_name=collection_name, points=points, wait=True)
+
+    async def handle(batch: List[Chunk]):
+        error = None
+        try:
+            async with embed_sem:
+                vectors, tokens = await _embed_with_retry([c.text for c in batch], stats)
+            points = [
+                models.PointStruct(id=c.id, vector=v, payload=c.payload())
+                for c, v in zip(batch, vectors)
+            ]
+            await asyncio.gather(*(
+                upsert(points[i:i + UPSERT_BATCH_SIZE]) for i in range(0, len(points), UPSERT_BATCH_SIZE)
+            ))
+            stats.chunks += len(batch)
+            stats.tokens += tokens
+            stats.batches += 1
+        except Exception as e:
+            error = e
+            print(f"Batch of {len(batch)} chunks failed: {e}")
+        if on_batch_done:
+            on_batch_done(batch, error)
+
+    # Keep a bounded number of batches in memory while the source is still being read
+    in_flight = set()
+    for batch in _batched(chunks, EMBED_BATCH_SIZE):
+        in_flight.add(asyncio.create_task(handle(batch)))
+        if len(in_flight) >= EMBED_CONCURRENCY * 2:
+            _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+    if in_flight:
+        await asyncio.wait(in_flight)
@@ -1,50 +1,58 @@
 import os
-from openai import OpenAI
-from qdrant_client import QdrantClient
+from typing import AsyncIterator
 from dotenv import load_dotenv
+from app.services import llm_client, events, vector_store, hybrid_search, telemetry
 
 # Load env variables (normally handled by main's load_dotenv, but good to be safe)
 load_dotenv()
 
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # None = 使用 OpenAI 官方端點
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")  # 預設使用 gpt-3.5-turbo
 
-async def query(message: str):
+def index_version() -> str:
+    """Version of the rag_documents collection as seen by this process."""
+    return vector_store.index_version()
+
+
+async def _direct_llm_events(message: str, source: str) -> AsyncIterator[events.Event]:
+    # Not grounded in the knowledge base; the collection may be back on the next request
+    yield events.degraded(source)
+    with telemetry.span("answer_generation"):
+        async for delta in llm_client.chat_stream(
+            model=OPENAI_MODEL,
+            messages=[{"role": "user", "content": message}],
+            temperature=0.7
+        ):
+            yield events.token(delta)
+    yield events.sources([source])
+
+
+async def query_events(message: str, query_vector=None) -> AsyncIterator[events.Event]:
     """
     Query the RAG knowledge base using a simplified direct OpenAI approach.
     This avoids the 'langchain.chains' module error until the environment can be fully fixed.
+    Yields a "retrieved" stage event, then answer tokens as they stream in, then sources.
+    ``query_vector`` may carry an already computed embedding of ``message``.
     """
     if not OPENAI_API_KEY:
-        return "錯誤：找不到 OPENAI_API_KEY。", []
+        yield events.token("錯誤：找不到 OPENAI_API_KEY。")
+        yield events.sources([])
+        return
 
     try:
-        # 1. Initialize OpenAI Client
-        client_kwargs = {"api_key": OPENAI_API_KEY}
-        if OPENAI_BASE_URL:
-            client_kwargs["base_url"] = OPENAI_BASE_URL
-        openai_client = OpenAI(**client_kwargs)
+        # 1. LLM calls go through the shared pooled AsyncOpenAI client (llm_client)
 
         # 2. Check if Qdrant collection exists
-        client = QdrantClient(url=QDRANT_URL)
-        
-        collection_exists = False
-        try:
-            collections = client.get_collections()
-            collection_exists = any(c.name == "rag_documents" for c in collections.collections)
-        except Exception as qe:
-            print(f"Qdrant Check Error: {qe}")
+        # (cached by vector_store; refreshed in the background and after each ingestion run)
+        state = await vector_store.collection_state()
+        collection_exists = state["exists"]
 
         # 3. If no collection, use direct LLM
         if not collection_exists:
             print("No RAG data found, using direct LLM response...")
-            response = openai_client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[{"role": "user", "content": message}],
-                temperature=0.7
-            )
-            return response.choices[0].message.content, ["Direct LLM (No RAG data)"]
+            async for event in _direct_llm_events(message, "Direct LLM (No RAG data)"):
+                yield event
+            return
 
         # 4. Perform Search (Vector Retrieval)
         # We need embeddings for the query
@@ -52,32 +60,31 @@ async def query(message: str):
         # Note: This assumes embeddings are generated by process_rag.py
         
         # We'll use the OpenAI client to get query embeddings
-        embeddings_response = openai_client.embeddings.create(
-            input=[message],
-            model="text-embedding-3-small" # Default model for LangChain's OpenAIEmbeddings
-        )
-        query_vector = embeddings_response.data[0].embedding
+        if query_vector is None:
+            with telemetry.span("query_embedding"):
+                query_vector = await llm_client.embed_query(message)
         
-        # Search in Qdrant (使用較新的 query_points API，因為部分版本 search 已不推薦或不存在)
-        search_response = client.query_points(
-            collection_name="rag_documents",
-            query=query_vector,
-            limit=3
-        )
-        search_results = search_response.points
+        # Hybrid retrieval: dense (Qdrant) + BM25 (local sparse index) -> RRF -> CPU rerank -> dedup
+        try:
+            with telemetry.span("retrieval"):
+                retrieval = await hybrid_search.search(message, query_vector)
+        except Exception:
+            # The collection may have been dropped since the state was cached
+            vector_store.invalidate_state()
+            raise
+        search_results = retrieval["chunks"]
         
         if not search_results:
             # Fallback to direct LLM if no relevant chunks found
-            response = openai_client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[{"role": "user", "content": message}],
-                temperature=0.7
-            )
-            return response.choices[0].message.content, ["Direct LLM (Empty search results)"]
+            async for event in _direct_llm_events(message, "Direct LLM (Empty search results)"):
+                yield event
+            return
             
         # 5. Build Context and Generate Answer
-        context = "\n\n".join([res.payload.get("page_content", "") for res in search_results])
-        sources = list(set([res.payload.get("metadata", {}).get("source", "Unknown") for res in search_results]))
+        context = "\n\n".join([chunk["text"] for chunk in search_results])
+        sources = list(dict.fromkeys(chunk["source"] for chunk in search_results))
+        yield events.stage("retrieved", chunks=len(search_results), sources=sources,
+                           dense=retrieval["dense"], sparse=retrieval["sparse"], candidates=retrieval["candidates"])
         
         system_prompt = (
             "你是一個專門負責回答問題的助理。請根據以下提供的檢索片段來回答使用者的問題。\n"
@@ -87,19 +94,28 @@ async def query(message: str):
             f"\n\n參考內容：\n{context}"
         )
         
-        final_response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            temperature=0
-        )
+        with telemetry.span("answer_generation"):
+            async for delta in llm_client.chat_stream(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                temperature=0
+            ):
+                yield events.token(delta)
         
-        return final_response.choices[0].message.content, sources
+        yield events.sources(sources)
 
     except Exception as e:
         print(f"RAG Error: {e}")
+        telemetry.mark_error(e)
         import traceback
         traceback.print_exc()
-        return f"Error processing request: {str(e)}", []
+        yield events.token(f"Error processing request: {str(e)}")
+        yield events.sources([])
+
+
+async def query(message: str, query_vector=None):
+    """Non-streaming wrapper around query_events(); returns (answer, sources)."""
+    return await events.collect(query_events(message, query_vector))
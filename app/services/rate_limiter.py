@@ -0,0 +1,110 @@
+import os
+import time
+import struct
+import random
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the bucket is only shared between threads of one process
+    fcntl = None
+
+# 所有 PageIndex worker (包含上傳背景處理) 共用的 OpenAI 請求額度
+LLM_REQUESTS_PER_MIN = float(os.getenv("LLM_REQUESTS_PER_MIN", "500"))
+LLM_TOKENS_PER_MIN = float(os.getenv("LLM_TOKENS_PER_MIN", "200000"))
+RATE_LIMIT_STATE = os.getenv("RATE_LIMIT_STATE", "data/manifests/llm_rate_limit.state")
+
+# requests available, tokens available, last refill time, paused until (after a 429)
+_STATE = struct.Struct("<dddd")
+
+
+class TokenBucket:
+    """
+    Requests/min + tokens/min token bucket shared by every process on the host.
+
+    The bucket levels live in a 32-byte state file guarded by ``fcntl.flock``,
+    so the worker processes of process_pageindex.py and of the upload job
+    queue draw from the same budget. A 429 pauses the whole bucket, not just
+    the worker that received it.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_STATE, requests_per_min: float = LLM_REQUESTS_PER_MIN,
+                 tokens_per_min: float = LLM_TOKENS_PER_MIN):
+        self.path = path
+        self.requests_per_min = requests_per_min
+        self.tokens_per_min = tokens_per_min
+        self._thread_lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._thread_lock, open(self.path, "a+b") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read(_STATE.size)
+                if len(raw) == _STATE.size:
+                    state = list(_STATE.unpack(raw))
+                else:
+                    state = [self.requests_per_min, self.tokens_per_min, time.time(), 0.0]
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(_STATE.pack(*state))
+                f.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state, now: float):
+        elapsed = max(0.0, now - state[2])
+        state[0] = min(self.requests_per_min, state[0] + elapsed * self.requests_per_min / 60)
+        state[1] = min(self.tokens_per_min, state[1] + elapsed * self.tokens_per_min / 60)
+        state[2] = now
+
+    def _charged(self, tokens: int) -> float:
+        # A single request larger than the per-minute budget could never fit; it is charged the whole budget
+        return min(tokens, self.tokens_per_min)
+
+    def acquire(self, tokens: int) -> float:
+        """Block until one request and ``tokens`` tokens are available. Returns the time waited."""
+        tokens = self._charged(tokens)
+        waited = 0.0
+        while True:
+            with self._state() as state:
+                now = time.time()
+                self._refill(state, now)
+                wait = state[3] - now
+                if wait <= 0:
+                    missing_requests = 1 - state[0]
+                    missing_tokens = tokens - state[1]
+                    if missing_requests <= 0 and missing_tokens <= 0:
+                        state[0] -= 1
+                        state[1] -= tokens
+                        return waited
+                    wait = max(missing_requests * 60 / self.requests_per_min,
+                               missing_tokens * 60 / self.tokens_per_min)
+            wait = min(wait, 60.0) + random.uniform(0, 0.05)
+            time.sleep(wait)
+            waited += wait
+
+    def settle(self, estimated: int, actual: Optional[int]):
+        """Correct the token level once the response reports its real usage."""
+        # Relative to what acquire() actually took for this estimate
+        charged = self._charged(estimated)
+        if actual is None or actual == charged:
+            return
+        with self._state() as state:
+            state[1] -= actual - charged
+
+    def pause(self, seconds: float):
+        """Stop handing out requests for ``seconds`` (all processes), e.g. after a 429."""
+        with self._state() as state:
+            state[3] = max(state[3], time.time() + seconds)
+            state[0] = min(state[0], 0.0)
+
+
+bucket = TokenBucket()
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import threading
+from typing import Any, Iterable, List, Optional, Sequence
+
+# 多 worker 模式共用的 SQLite 狀態檔 (答案快取、文件向量、上傳工作狀態)；留空則各 process 自行保存於記憶體
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tool TEXT NOT NULL,
+    message TEXT NOT NULL,
+    version TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    created REAL NOT NULL,
+    latency REAL NOT NULL,
+    embedding BLOB,
+    facets TEXT,
+    UNIQUE (tool, message, version)
+);
+CREATE TABLE IF NOT EXISTS doc_vectors (
+    text_hash TEXT PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_hash ON jobs (content_hash);
+"""
+
+
+class SharedState:
+    """
+    SQLite database (WAL mode) shared by every API worker process on the host.
+
+    Holds the state that would otherwise be duplicated per worker and re-warmed
+    by each: answer cache entries, document description vectors and upload job
+    status. Structures and page texts are shared differently, as memory-mapped
+    .pidx / .pages files in the OS page cache. One connection per thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """Add columns introduced after a database file was created."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(answers)")}
+        if "facets" not in columns:
+            try:
+                conn.execute("ALTER TABLE answers ADD COLUMN facets TEXT")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        return self._connect().execute(sql, params)
+
+    def executemany(self, sql: str, rows: Iterable[Sequence[Any]]):
+        conn = self._connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(sql, rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def query(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return self._connect().execute(sql, params).fetchall()
+
+
+_shared: Optional[SharedState] = None
+_lock = threading.Lock()
+
+
+def get() -> Optional[SharedState]:
+    """The shared state database, or None when SHARED_STATE_DB is not set (single-process mode)."""
+    global _shared
+    if not SHARED_STATE_DB:
+        return None
+    if _shared is None:
+        with _lock:
+            if _shared is None:
+                _shared = SharedState(SHARED_STATE_DB)
+    return _shared
@@ -0,0 +1,111 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from app.services import events
+
+# 同時進行中的查詢上限；超過時新的問題直接各自執行，不再合併
+SINGLE_FLIGHT_MAX = int(os.getenv("SINGLE_FLIGHT_MAX", "1000"))
+
+
+class _Flight:
+    """One in-flight pipeline run: the events produced so far, replayed to every subscriber."""
+
+    def __init__(self):
+        self.events: List[events.Event] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: events.Event):
+        self.events.append(event)
+        self._changed.set()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done, self.error = True, error
+        self._changed.set()
+
+    async def subscribe(self) -> AsyncIterator[events.Event]:
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.done:
+                break
+            self._changed.clear()
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical queries into one pipeline run.
+
+    The first request for a key starts the pipeline in its own task; requests
+    for the same key that arrive while it runs subscribe to the same event
+    stream (already produced events are replayed first) instead of calling
+    the LLM again. The run is not tied to any one client, so a disconnecting
+    first requester does not cancel it for the others. At most ``max_size``
+    keys are tracked; beyond that requests run on their own.
+    """
+
+    def __init__(self, max_size: int = SINGLE_FLIGHT_MAX):
+        self.max_size = max_size
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.counters = {
+            "leaders": 0,
+            "coalesced": 0,
+            "overflow": 0,
+            "max_in_flight": 0,
+        }
+
+    async def _pump(self, key: Hashable, flight: _Flight, stream: AsyncIterator[events.Event]):
+        try:
+            async for event in stream:
+                flight.publish(event)
+        except BaseException as e:
+            flight.finish(e)
+            if not isinstance(e, Exception):
+                raise
+        else:
+            flight.finish()
+        finally:
+            self._flights.pop(key, None)
+            self._tasks.pop(key, None)
+
+    def is_coalesced(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def run(self, key: Hashable, factory: Callable[[], AsyncIterator[events.Event]]) -> AsyncIterator[events.Event]:
+        """Events of the pipeline for ``key``: shared with a run already in flight, or from a new one."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.counters["coalesced"] += 1
+        elif len(self._flights) >= self.max_size:
+            self.counters["overflow"] += 1
+            async for event in factory():
+                yield event
+            return
+        else:
+            self.counters["leaders"] += 1
+            flight = self._flights[key] = _Flight()
+            self._tasks[key] = asyncio.create_task(self._pump(key, flight, factory()))
+            self.counters["max_in_flight"] = max(self.counters["max_in_flight"], len(self._flights))
+
+        async for event in flight.subscribe():
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.counters["leaders"] + self.counters["coalesced"]
+        return {
+            "in_flight": len(self._flights),
+            "max_size": self.max_size,
+            **self.counters,
+            "coalesced_rate": self.counters["coalesced"] / requests if requests else 0.0,
+        }
+
+
+single_flight = SingleFlight()
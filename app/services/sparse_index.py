@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# process_rag.py 建立的 BM25 稀疏索引（chunk 原文 + 來源），app 端載入後在記憶體中檢索
+RAG_SPARSE_INDEX = os.getenv("RAG_SPARSE_INDEX", "data/rag_index/sparse_index.json")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# ASCII words, tickers and numbers ("2330", "n3e", "1,234.5" -> "1234.5")
+_ASCII_TOKEN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25 terms without a word segmenter: ASCII words/numbers as whole tokens
+    (so amounts and product codes only match exactly) plus CJK character bigrams.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = [m.group().replace(",", "") for m in _ASCII_TOKEN.finditer(text)]
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def exact_terms(tokens: List[str]) -> List[str]:
+    """Query terms that must match verbatim to be useful: numbers and ASCII codes."""
+    return sorted({t for t in tokens if t.isascii() and (len(t) > 1 or t.isdigit())})
+
+
+class SparseIndex:
+    """
+    BM25 inverted index over the RAG chunks, stored as one JSON file of
+    ``source -> [{"id", "index", "text"}]``. The ids are the Qdrant point ids,
+    so sparse hits can be fused with dense hits by id. Postings are built
+    lazily as numpy arrays so scoring a query term is a vector operation.
+    """
+
+    def __init__(self, path: str = RAG_SPARSE_INDEX, sources: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        self.path = path
+        self.sources: Dict[str, List[Dict[str, Any]]] = sources or {}
+        self._built = False
+
+    @classmethod
+    def load(cls, path: str = RAG_SPARSE_INDEX) -> "SparseIndex":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(path, json.load(f).get("sources", {}))
+        except FileNotFoundError:
+            return cls(path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "sources": self.sources}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def set_source(self, source: str, chunks: List[Dict[str, Any]]):
+        self.sources[source] = chunks
+        self._built = False
+
+    def remove_source(self, source: str):
+        self.sources.pop(source, None)
+        self._built = False
+
+    def _build(self):
+        self._chunks: List[Dict[str, Any]] = []
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        lengths = []
+        for source in sorted(self.sources):
+            for chunk in self.sources[source]:
+                doc = len(self._chunks)
+                self._chunks.append({**chunk, "source": source})
+                counts = Counter(tokenize(chunk["text"]))
+                lengths.append(sum(counts.values()))
+                for term, tf in counts.items():
+                    docs, tfs = postings.setdefault(term, ([], []))
+                    docs.append(doc)
+                    tfs.append(tf)
+        self._by_id = {c["id"]: i for i, c in enumerate(self._chunks)}
+        self._lengths = np.asarray(lengths, dtype=np.float32)
+        avgdl = float(self._lengths.mean()) if lengths else 1.0
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths / (avgdl or 1.0))
+        n = len(self._chunks)
+        self._postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32),
+                   math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5)))
+            for term, (docs, tfs) in postings.items()
+        }
+        self._built = True
+
+    def __len__(self) -> int:
+        return sum(len(chunks) for chunks in self.sources.values())
+
+    def scores(self, query_tokens: List[str]) -> np.ndarray:
+        """BM25 score of every chunk for the given query terms."""
+        if not self._built:
+            self._build()
+        scores = np.zeros(len(self._chunks), dtype=np.float32)
+        for term in set(query_tokens):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs, idf = posting
+            scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + self._norm[docs])
+        return scores
+
+    def search(self, query: str, limit: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Top ``limit`` (chunk, BM25 score) pairs with a positive score."""
+        scores = self.scores(tokenize(query))
+        if not len(scores):
+            return []
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self._chunks[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def score_ids(self, query: str, ids: List[str]) -> Dict[str, float]:
+        """BM25 scores for specific chunk ids (0 for ids not in the index)."""
+        scores = self.scores(tokenize(query))
+        return {i: float(scores[self._by_id[i]]) if i in self._by_id else 0.0 for i in ids}
+
+
+_current: Optional[SparseIndex] = None
+_current_signature = None
+_lock = threading.Lock()
+
+
+def current(path: str = RAG_SPARSE_INDEX) -> SparseIndex:
+    """The on-disk index, reloaded (and its postings rebuilt) only when the file changes."""
+    global _current, _current_signature
+    try:
+        st = os.stat(path)
+        signature = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        signature = None
+    with _lock:
+        if _current is None or signature != _current_signature:
+            index = SparseIndex.load(path)
+            index.scores([])  # build postings now, not on the first query
+            _current, _current_signature = index, signature
+        return _current
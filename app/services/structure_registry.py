@@ -0,0 +1,169 @@
+import os
+import json
+import struct
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.structure_store import BINARY_SUFFIX, StructureFile
+
+INDEX_DIR = "lib/PageIndex/tests/results"
+STRUCTURE_SUFFIX = "_structure.json"
+# 背景輪詢間隔 (秒)，只做 stat，不讀檔
+WATCH_INTERVAL = float(os.getenv("PAGEINDEX_WATCH_INTERVAL", "5"))
+
+
+class StructureRegistry:
+    """
+    Process-wide cache of PageIndex ``*_structure.json`` / ``*_structure.pidx`` files.
+
+    Structures are loaded once and kept in memory; binary ``.pidx`` files are
+    memory-mapped and decoded lazily (see structure_store). When both formats
+    exist for a document the newer file wins. ``refresh()`` stats the
+    index directory and only re-parses files whose (mtime, size) changed, so
+    files added, rewritten or deleted by ``process_pageindex.py`` or
+    ``/api/upload`` are picked up without re-reading the rest. A background
+    watcher calls ``refresh()`` periodically; request handlers only read the
+    in-memory snapshot.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, watch_interval: float = WATCH_INTERVAL):
+        self.index_dir = index_dir
+        self.watch_interval = watch_interval
+        # doc_name -> parsed structure; replaced wholesale on change so readers
+        # always see a consistent snapshot without taking the lock.
+        self._structures: Dict[str, Any] = {}
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.version = 0
+        # Stable across processes: digest of every loaded file's (name, mtime, size)
+        self.fingerprint = ""
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "reloads": 0,
+            "removals": 0,
+            "scans": 0,
+            "errors": 0,
+        }
+
+    def _scan(self) -> Dict[str, Tuple[str, Tuple[int, int]]]:
+        found = {}
+        try:
+            entries = list(os.scandir(self.index_dir))
+        except FileNotFoundError:
+            return found
+        for entry in entries:
+            suffix = next((s for s in (STRUCTURE_SUFFIX, BINARY_SUFFIX) if entry.name.endswith(s)), None)
+            if suffix is None or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            doc_name = entry.name[: -len(suffix)]
+            if doc_name in found and found[doc_name][1][0] >= st.st_mtime_ns:
+                continue
+            found[doc_name] = (entry.path, (st.st_mtime_ns, st.st_size))
+        return found
+
+    def refresh(self) -> bool:
+        """Re-scan the index directory. Returns True if anything changed."""
+        with self._lock:
+            self.counters["scans"] += 1
+            found = self._scan()
+            structures = dict(self._structures)
+            signatures = dict(self._signatures)
+            changed = False
+
+            for doc_name in list(structures):
+                if doc_name not in found:
+                    del structures[doc_name]
+                    signatures.pop(doc_name, None)
+                    self.counters["removals"] += 1
+                    changed = True
+
+            for doc_name, (path, signature) in found.items():
+                if signatures.get(doc_name) == signature:
+                    continue
+                try:
+                    if path.endswith(BINARY_SUFFIX):
+                        # 舊的 mmap 可能仍被其他請求讀取中，交給 GC 關閉
+                        data = StructureFile(path)
+                    else:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            data = json.load(f)
+                except (OSError, ValueError, struct.error) as e:
+                    # 檔案可能正在寫入中，下次掃描再試
+                    print(f"Structure load error ({path}): {e}")
+                    self.counters["errors"] += 1
+                    continue
+                self.counters["reloads" if doc_name in structures else "loads"] += 1
+                structures[doc_name] = data
+                signatures[doc_name] = signature
+                changed = True
+
+            if changed:
+                self._structures = structures
+                self._signatures = signatures
+                self.version += 1
+                self.fingerprint = hashlib.sha256(
+                    repr(sorted(signatures.items())).encode("utf-8")
+                ).hexdigest()[:16]
+            self._loaded = True
+            return changed
+
+    def get_all(self) -> Dict[str, Any]:
+        """Return the current doc_name -> structure snapshot. Treat as read-only."""
+        if not self._loaded:
+            self.counters["misses"] += 1
+            self.refresh()
+        else:
+            self.counters["hits"] += 1
+        return self._structures
+
+    def get(self, doc_name: str) -> Optional[Any]:
+        structures = self._structures
+        if self._loaded and doc_name in structures:
+            self.counters["hits"] += 1
+            return structures[doc_name]
+        self.counters["misses"] += 1
+        self.refresh()
+        return self._structures.get(doc_name)
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Structure watcher error: {e}")
+
+    def start_watching(self):
+        if self._watcher and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="structure-registry-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher:
+            self._watcher.join(timeout=self.watch_interval + 1)
+            self._watcher = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index_dir": self.index_dir,
+            "documents": len(self._structures),
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "watching": bool(self._watcher and self._watcher.is_alive()),
+            **self.counters,
+        }
+
+
+registry = StructureRegistry()
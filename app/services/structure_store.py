@@ -0,0 +1,247 @@
+import os
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# 每份文件一個 .pidx 檔：header + 文件 metadata + 節點表 + node_id 索引 + 各節點的 JSON
+BINARY_SUFFIX = "_structure.pidx"
+
+_MAGIC = b"PIDX"
+_FORMAT_VERSION = 1
+# magic, version, shape, node count, node_id count, metadata length, node_id blob length
+_HEADER = struct.Struct("<4sHHIIII")
+# Nodes are stored in pre-order, so a node's subtree is the record range [i, end)
+_NODE = np.dtype([
+    ("parent", "<i4"),      # -1 for roots
+    ("end", "<u4"),         # one past the last record of the subtree
+    ("children", "<u4"),
+    ("flags", "<u4"),
+    ("offset", "<u8"),      # payload offset within the payload section
+    ("length", "<u4"),
+])
+# Sorted by node_id bytes for binary search
+_ID = np.dtype([("record", "<u4"), ("offset", "<u4"), ("length", "<u4")])
+
+# How the original JSON wrapped the tree
+SHAPE_DOCUMENT = 0  # {"doc_name": ..., "structure": [...]}
+SHAPE_LIST = 1      # [...]
+SHAPE_NODE = 2      # a single root node
+# The node had a "nodes" key (possibly empty) in the original JSON
+_HAS_NODES = 1
+
+
+def _pad(n: int) -> int:
+    return -n % 8
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write(path: str, data: Any) -> str:
+    """Serialize a PageIndex structure (as loaded from ``*_structure.json``) to ``path`` atomically."""
+    if isinstance(data, dict) and "structure" in data:
+        shape, meta, tree = SHAPE_DOCUMENT, {k: v for k, v in data.items() if k != "structure"}, data["structure"]
+    elif isinstance(data, list):
+        shape, meta, tree = SHAPE_LIST, {}, data
+    else:
+        shape, meta, tree = SHAPE_NODE, {}, data
+    if isinstance(tree, dict):
+        tree = [tree]
+
+    records, payloads, ids = [], [], []
+    payload_at = 0
+
+    def visit(node: Dict[str, Any], parent: int):
+        nonlocal payload_at
+        i = len(records)
+        kids = [n for n in node.get("nodes") or [] if isinstance(n, dict)]
+        blob = _dumps({k: v for k, v in node.items() if k != "nodes"})
+        records.append([parent, 0, len(kids), _HAS_NODES if "nodes" in node else 0, payload_at, len(blob)])
+        # Comma-separated, so any pre-order range (a subtree) decodes with one json.loads
+        payloads.append(blob + b",")
+        payload_at += len(blob) + 1
+        if node.get("node_id") is not None:
+            ids.append((str(node["node_id"]).encode("utf-8"), i))
+        for kid in kids:
+            visit(kid, i)
+        records[i][1] = len(records)
+
+    for root in tree or []:
+        if isinstance(root, dict):
+            visit(root, -1)
+
+    ids.sort()
+    id_blob = b"".join(key for key, _ in ids)
+    id_table = np.zeros(len(ids), dtype=_ID)
+    at = 0
+    for j, (key, record) in enumerate(ids):
+        id_table[j] = (record, at, len(key))
+        at += len(key)
+    node_table = np.array([tuple(r) for r in records], dtype=_NODE)
+    meta_blob = _dumps(meta)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _FORMAT_VERSION, shape, len(records), len(ids), len(meta_blob), len(id_blob)))
+        for section in (meta_blob, node_table.tobytes(), id_table.tobytes(), id_blob):
+            f.write(section)
+            f.write(b"\0" * _pad(len(section)))
+        f.writelines(payloads)
+    os.replace(tmp_path, path)
+    return path
+
+
+def convert(json_path: str, out_path: Optional[str] = None) -> str:
+    """Write the binary equivalent of a ``*_structure.json`` file next to it."""
+    if out_path is None:
+        base = json_path[:-len(".json")] if json_path.endswith(".json") else json_path
+        out_path = f"{base}.pidx"
+    with open(json_path, "r", encoding="utf-8") as f:
+        return write(out_path, json.load(f))
+
+
+class StructureNode(dict):
+    """One node's own fields (no ``"nodes"``); its children are read from the file on demand."""
+
+    def __init__(self, source: "StructureFile", record: int, fields: Dict[str, Any]):
+        super().__init__(fields)
+        self.source = source
+        self.record = record
+        self.child_count = int(source._nodes[record]["children"])
+
+    def children(self) -> List["StructureNode"]:
+        return self.source.children(self.record)
+
+
+class StructureFile(Mapping):
+    """
+    Read-only, memory-mapped view of one ``.pidx`` structure file.
+
+    Opening it parses only the header and the document metadata; the node
+    table and node_id index are numpy views over the mapping. Single nodes,
+    children and subtrees are decoded on demand, so a tree search that visits
+    a few levels never parses the rest of the document. As a mapping it looks
+    like the original JSON document (``"structure"`` decodes the whole tree).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, shape, node_count, id_count, meta_len, id_blob_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a structure file: {path}")
+        self.shape = shape
+        self.node_count = node_count
+        at = _HEADER.size
+        self.meta: Dict[str, Any] = json.loads(self._mm[at:at + meta_len])
+        at += meta_len + _pad(meta_len)
+        self._nodes = np.frombuffer(self._mm, dtype=_NODE, count=node_count, offset=at)
+        at += _NODE.itemsize * node_count + _pad(_NODE.itemsize * node_count)
+        self._ids = np.frombuffer(self._mm, dtype=_ID, count=id_count, offset=at)
+        at += _ID.itemsize * id_count + _pad(_ID.itemsize * id_count)
+        self._id_blob_at = at
+        at += id_blob_len + _pad(id_blob_len)
+        self._payload_at = at
+
+    # Mapping interface: the original document shape
+    def __getitem__(self, key: str) -> Any:
+        if key == "structure":
+            return self.load_tree()
+        return self.meta[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self.meta
+        yield "structure"
+
+    def __len__(self) -> int:
+        return len(self.meta) + 1
+
+    def _fields(self, i: int) -> Dict[str, Any]:
+        start = self._payload_at + int(self._nodes[i]["offset"])
+        return json.loads(self._mm[start:start + int(self._nodes[i]["length"])])
+
+    def node(self, i: int) -> StructureNode:
+        return StructureNode(self, i, self._fields(i))
+
+    def _child_records(self, first: int, end: int) -> List[int]:
+        records, i = [], first
+        while i < end:
+            records.append(i)
+            i = int(self._nodes[i]["end"])
+        return records
+
+    def roots(self) -> List[StructureNode]:
+        return [self.node(i) for i in self._child_records(0, self.node_count)]
+
+    def children(self, i: int) -> List[StructureNode]:
+        if not self._nodes[i]["children"]:
+            return []
+        return [self.node(j) for j in self._child_records(i + 1, int(self._nodes[i]["end"]))]
+
+    def find(self, node_id: str) -> Optional[int]:
+        """Record index of ``node_id`` (binary search over the sorted node_id index)."""
+        key = str(node_id).encode("utf-8")
+        lo, hi = 0, len(self._ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._ids[mid]
+            start = self._id_blob_at + int(entry["offset"])
+            probe = self._mm[start:start + int(entry["length"])]
+            if probe == key:
+                return int(entry["record"])
+            if probe < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def _build(self, start: int, end: int) -> List[Dict[str, Any]]:
+        if start >= end:
+            return []
+        table = self._nodes[start:end]
+        first = self._payload_at + int(table["offset"][0])
+        last = self._payload_at + int(table["offset"][-1]) + int(table["length"][-1])
+        fields = json.loads(b"[" + self._mm[first:last] + b"]")
+        roots = []
+        for i, node, parent, flags in zip(range(start, end), fields, table["parent"].tolist(),
+                                          table["flags"].tolist()):
+            if flags & _HAS_NODES:
+                node["nodes"] = []
+            if parent < start:
+                roots.append(node)
+            else:
+                fields[parent - start]["nodes"].append(node)
+        return roots
+
+    def subtree(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """The node with ``node_id`` and all its descendants as plain nested dicts."""
+        i = self.find(node_id)
+        if i is None:
+            return None
+        return self._build(i, int(self._nodes[i]["end"]))[0]
+
+    def load_tree(self) -> Any:
+        """The whole tree, shaped like the original JSON's ``structure``."""
+        tree = self._build(0, self.node_count)
+        if self.shape == SHAPE_NODE and len(tree) == 1:
+            return tree[0]
+        return tree
+
+    def to_json_data(self) -> Any:
+        """The original JSON document."""
+        if self.shape == SHAPE_DOCUMENT:
+            return {**self.meta, "structure": self.load_tree()}
+        return self.load_tree()
+
+    def close(self):
+        # numpy views keep the buffer exported; dropping them lets the mapping close
+        self._nodes = self._ids = None
+        self._mm.close()
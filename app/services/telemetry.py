@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.services import llm_client
+
+# 每個請求結束時輸出一行 JSON log (request id、各階段耗時、token 用量、快取命中)
+TELEMETRY_JSON_LOGS = os.getenv("TELEMETRY_JSON_LOGS", "true").lower() in ("1", "true", "yes")
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Seconds; covers a cached answer (ms) up to a slow multi-document PageIndex query
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _label_text(self.labels, key, 'le="%s"' % le)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total:.6f}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {count}")
+        return lines
+
+
+request_seconds = Histogram("pagerag_request_seconds", "End-to-end chat request latency.", ("tool", "status"))
+stage_seconds = Histogram("pagerag_stage_seconds", "Wall time per pipeline stage.", ("tool", "stage"))
+llm_tokens = Counter("pagerag_llm_tokens_total", "LLM tokens used by chat requests.", ("tool", "kind"))
+llm_calls = Counter("pagerag_llm_calls_total", "LLM chat completions made by chat requests.", ("tool",))
+cache_lookups = Counter("pagerag_answer_cache_lookups_total", "Answer cache lookups by result.", ("tool", "result"))
+coalesced_requests = Counter("pagerag_coalesced_requests_total",
+                             "Requests answered by joining an identical query already in flight.", ("tool",))
+fast_path_queries = Counter("pagerag_fast_path_queries_total",
+                            "PageIndex node-vector fast path outcomes (used / fallback / shadow_agree / shadow_disagree).",
+                            ("tool", "result"))
+fast_path_calls_saved = Counter("pagerag_fast_path_llm_calls_saved_total",
+                                "Tree-search LLM calls skipped by the fast path (estimated from the running mean).",
+                                ("tool",))
+METRICS = [request_seconds, stage_seconds, llm_tokens, llm_calls, cache_lookups, coalesced_requests,
+           fast_path_queries, fast_path_calls_saved]
+
+
+class Trace:
+    """Per-request record: stage timings, LLM usage, cache result and status."""
+
+    def __init__(self, request_id: str, tool: str):
+        self.request_id = request_id
+        self.tool = tool
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.usage: Dict[str, int] = {}
+        self.cache: Optional[str] = None
+        self.coalesced = False
+        self.fast_path: Optional[Dict[str, Any]] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+
+
+def set_request_id(value: Optional[str] = None) -> str:
+    """Bind the request id (an incoming X-Request-ID, or a new one) to the current context."""
+    request_id = (value or "").strip()[:64] or uuid.uuid4().hex
+    _request_id.set(request_id)
+    return request_id
+
+
+def request_id() -> str:
+    return _request_id.get() or "-"
+
+
+def log(event: str, **fields):
+    """One structured JSON log line, tagged with the current request id."""
+    if not TELEMETRY_JSON_LOGS:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "request_id": request_id(), **fields}
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+
+
+def _reset(var: ContextVar, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # A streaming response closed from another context; the context is discarded anyway
+        pass
+
+
+@contextmanager
+def trace(tool: str) -> Iterator[Trace]:
+    """
+    Trace one chat request: stages timed with span() and LLM usage inside the
+    block are collected, exported to the metrics and logged as one JSON line.
+    """
+    current = Trace(request_id(), tool)
+    token = _trace.set(current)
+    try:
+        with llm_client.track_usage() as usage:
+            try:
+                yield current
+            except BaseException as e:
+                current.status, current.error = "error", current.error or str(e)[:200]
+                raise
+            finally:
+                current.usage = dict(usage)
+    finally:
+        _reset(_trace, token)
+        elapsed = time.perf_counter() - current.started
+        request_seconds.observe(elapsed, tool=tool, status=current.status)
+        llm_calls.inc(current.usage.get("calls", 0), tool=tool)
+        llm_tokens.inc(current.usage.get("prompt_tokens", 0), tool=tool, kind="prompt")
+        llm_tokens.inc(current.usage.get("completion_tokens", 0), tool=tool, kind="completion")
+        log("chat_request", tool=tool, status=current.status, error=current.error,
+            duration_ms=round(elapsed * 1000, 1),
+            stages_ms={k: round(v * 1000, 1) for k, v in current.stages.items()},
+            cache=current.cache, coalesced=current.coalesced, fast_path=current.fast_path, llm=current.usage)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage of the current trace (repeated stages add up)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        current = _trace.get()
+        tool = current.tool if current else ""
+        if current:
+            current.stages[stage] = current.stages.get(stage, 0.0) + elapsed
+        stage_seconds.observe(elapsed, tool=tool, stage=stage)
+
+
+def cache_result(result: str):
+    """Record the answer cache outcome (exact / semantic / miss) of the current request."""
+    current = _trace.get()
+    if current:
+        current.cache = result
+    cache_lookups.inc(tool=current.tool if current else "", result=result)
+
+
+def coalesced():
+    """Record that the current request joined an identical in-flight query."""
+    current = _trace.get()
+    if current:
+        current.coalesced = True
+    coalesced_requests.inc(tool=current.tool if current else "")
+
+
+def fast_path(result: str, **fields):
+    """Record the PageIndex fast path outcome of the current request (LLM calls saved, shadow agreement)."""
+    current = _trace.get()
+    tool = current.tool if current else ""
+    if current:
+        current.fast_path = {"result": result, **fields}
+    fast_path_queries.inc(tool=tool, result=result)
+    if fields.get("llm_calls_saved"):
+        fast_path_calls_saved.inc(fields["llm_calls_saved"], tool=tool)
+
+
+def mark_error(error: str):
+    """Flag the current request as failed when a service answers with an error message instead of raising."""
+    current = _trace.get()
+    if current:
+        current.status, current.error = "error", str(error)[:200]
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
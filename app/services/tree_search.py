@@ -0,0 +1,188 @@
+import os
+import json
+from collections.abc import Mapping
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.services import llm_client
+from app.services.structure_registry import registry
+from app.services.structure_store import StructureFile, StructureNode
+from app.services.tokens import count_tokens
+
+# 每一層送給 LLM 的候選節點 prompt token 上限
+TREE_SEARCH_TOKEN_BUDGET = int(os.getenv("TREE_SEARCH_TOKEN_BUDGET", "3000"))
+# 每一層先以 embedding 相似度保留的候選節點數
+TREE_SEARCH_BEAM = int(os.getenv("TREE_SEARCH_BEAM", "12"))
+TREE_SEARCH_MAX_DEPTH = int(os.getenv("TREE_SEARCH_MAX_DEPTH", "4"))
+TREE_SEARCH_SUMMARY_CHARS = int(os.getenv("TREE_SEARCH_SUMMARY_CHARS", "300"))
+
+
+def root_nodes(index_data: Any) -> List[Dict[str, Any]]:
+    if isinstance(index_data, StructureFile):
+        # Binary structures: decode only the top level
+        return index_data.roots()
+    tree = index_data.get('structure', index_data) if isinstance(index_data, Mapping) else index_data
+    if isinstance(tree, dict):
+        tree = [tree]
+    return [n for n in tree or [] if isinstance(n, dict)]
+
+
+def children(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    if isinstance(node, StructureNode):
+        return node.children()
+    return [n for n in node.get("nodes") or [] if isinstance(n, dict)]
+
+
+def node_key(node: Dict[str, Any], path: str) -> str:
+    # PageIndex writes node_id when if_add_node_id='yes'; fall back to the tree path
+    return str(node.get("node_id") or path)
+
+
+def node_summary(node: Dict[str, Any]) -> str:
+    return (node.get("summary") or node.get("prefix_summary") or "")[:TREE_SEARCH_SUMMARY_CHARS]
+
+
+def compact_node(key: str, node: Dict[str, Any]) -> str:
+    """Single-line JSON with only the fields the search needs."""
+    item = {
+        "id": key,
+        "title": node.get("title", ""),
+        "pages": [node.get("start_index"), node.get("end_index")],
+    }
+    summary = node_summary(node)
+    if summary:
+        item["summary"] = summary
+    count = node.child_count if isinstance(node, StructureNode) else len(children(node))
+    if count:
+        item["children"] = count
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+
+
+def _parse_json(raw: str) -> Dict[str, Any]:
+    raw = raw.strip()
+    if "```json" in raw:
+        raw = raw.split("```json")[1].split("```")[0]
+    elif "```" in raw:
+        raw = raw.split("```")[1].split("```")[0]
+    return json.loads(raw)
+
+
+class TreeSearcher:
+    """
+    Level-by-level PageIndex tree search under a prompt token budget.
+
+    Each level's candidate nodes are first ranked locally by the cosine
+    similarity of their title + summary embedding to the question; the best
+    TREE_SEARCH_BEAM that fit in TREE_SEARCH_TOKEN_BUDGET are sent to the LLM as
+    compact JSON lines. The LLM either selects a node (read its pages) or
+    expands it (descend into its children on the next level).
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        # (doc_name, node key) -> (summary text, unit vector)
+        self._vectors: Dict[Tuple[str, str], Tuple[str, np.ndarray]] = {}
+        # Registry fingerprint the vectors were last pruned against
+        self._fingerprint: Optional[str] = None
+
+    def _prune(self):
+        """Forget the node vectors of documents the registry no longer holds."""
+        fingerprint = registry.fingerprint
+        if fingerprint == self._fingerprint:
+            return
+        live = registry.get_all()
+        self._vectors = {key: value for key, value in self._vectors.items() if key[0] in live}
+        self._fingerprint = fingerprint
+
+    async def _node_vectors(self, doc_name: str, nodes: List[Tuple[str, Dict[str, Any]]]) -> np.ndarray:
+        self._prune()
+        texts = [f"{node.get('title', '')}\n{node_summary(node)}" for _, node in nodes]
+        missing = [
+            i for i, (key, _) in enumerate(nodes)
+            if self._vectors.get((doc_name, key), ("", None))[0] != texts[i]
+        ]
+        if missing:
+            vectors, _ = await llm_client.embed_cached([texts[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                self._vectors[(doc_name, nodes[i][0])] = (texts[i], vector / (np.linalg.norm(vector) or 1.0))
+        return np.stack([self._vectors[(doc_name, key)][1] for key, _ in nodes])
+
+    async def _rank(self, doc_name: str, frontier, query_vector) -> List[Tuple[str, Dict[str, Any]]]:
+        if query_vector is None or len(frontier) <= 1:
+            return frontier
+        try:
+            scores = await self._node_vectors(doc_name, frontier) @ query_vector
+        except Exception as e:
+            print(f"Node scoring failed, keeping document order: {e}")
+            return frontier
+        return [frontier[i] for i in np.argsort(-scores, kind="stable")]
+
+    def _fit_budget(self, ranked) -> List[Tuple[str, Dict[str, Any], str]]:
+        candidates, used = [], 0
+        for key, node in ranked[:TREE_SEARCH_BEAM]:
+            line = compact_node(key, node)
+            tokens = count_tokens(line)
+            if candidates and used + tokens > TREE_SEARCH_TOKEN_BUDGET:
+                break
+            candidates.append((key, node, line))
+            used += tokens
+        return candidates
+
+    async def _ask(self, message: str, candidates) -> Tuple[List[str], List[str]]:
+        listing = "\n".join(line for _, _, line in candidates)
+        prompt = f"""You are searching a document tree for the sections that answer a question.
+Question: {message}
+
+Candidate nodes (one JSON object per line; "pages" is the page range, "children" the number of sub-sections):
+{listing}
+
+Return JSON only: {{"select": [ids whose pages should be read], "expand": [ids with children to look inside]}}.
+Select a node when its whole page range is relevant; expand it when only part of it is. Use [] when nothing fits."""
+        res = await llm_client.chat(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0
+        )
+        result = _parse_json(res.choices[0].message.content)
+        return [str(i) for i in result.get("select", [])], [str(i) for i in result.get("expand", [])]
+
+    async def search(self, message: str, doc_name: str, index_data: Any,
+                     query_vector: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """Return relevant nodes as ``{"title", "start_index", "end_index", "node_id"}`` dicts."""
+        frontier = [(node_key(n, str(i)), n) for i, n in enumerate(root_nodes(index_data))]
+        selected: List[Tuple[str, Dict[str, Any]]] = []
+        last_expanded: List[Tuple[str, Dict[str, Any]]] = []
+
+        for _ in range(TREE_SEARCH_MAX_DEPTH):
+            if not frontier:
+                break
+            candidates = self._fit_budget(await self._rank(doc_name, frontier, query_vector))
+            by_key = {key: node for key, node, _ in candidates}
+            select_ids, expand_ids = await self._ask(message, candidates)
+
+            selected.extend((key, by_key[key]) for key in select_ids if key in by_key)
+            expanded = [(key, by_key[key]) for key in expand_ids if key in by_key and key not in select_ids]
+            frontier = []
+            for key, node in expanded:
+                kids = children(node)
+                if kids:
+                    frontier.extend((node_key(c, f"{key}.{j}"), c) for j, c in enumerate(kids))
+                else:
+                    selected.append((key, node))
+            if expanded:
+                last_expanded = expanded
+
+        # Ran out of depth (or the LLM only expanded): read the deepest expanded sections
+        if not selected:
+            selected = last_expanded
+
+        return [
+            {
+                "node_id": key,
+                "title": node.get("title"),
+                "start_index": node.get("start_index"),
+                "end_index": node.get("end_index"),
+            }
+            for key, node in selected
+        ]
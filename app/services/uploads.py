@@ -0,0 +1,202 @@
+import os
+import uuid
+import shutil
+import hashlib
+from typing import AsyncIterator, Optional
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.services.indexing import PDF_DIR
+
+# 上傳 PDF 的大小上限 (MB) 與頁數上限
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "200"))
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "2000"))
+# 依內容 sha256 命名的上傳檔存放目錄；PDF_DIR 中的檔案是指向這裡的 hard link
+UPLOAD_STORE_DIR = os.getenv("UPLOAD_STORE_DIR", "data/uploads")
+# The PDF header may be preceded by junk bytes; readers look within the first KB
+_HEADER_WINDOW = 1024
+
+
+class UploadRejected(Exception):
+    """An upload that is refused; ``status_code`` is the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamedUpload:
+    """The ``file`` part of a multipart upload, written to a temp file in UPLOAD_STORE_DIR while hashing."""
+
+    def __init__(self, max_bytes: int):
+        os.makedirs(UPLOAD_STORE_DIR, exist_ok=True)
+        self.path = os.path.join(UPLOAD_STORE_DIR, f".{uuid.uuid4().hex}.part")
+        self.filename: Optional[str] = None
+        self.size = 0
+        self.max_bytes = max_bytes
+        self._sha256 = hashlib.sha256()
+        self._file = None
+
+    @property
+    def content_hash(self) -> str:
+        return self._sha256.hexdigest()
+
+    def begin(self, filename: str):
+        if self._file is not None or self.filename is not None:
+            raise UploadRejected(400, "Only one file per upload")
+        self.filename = filename
+        self._file = open(self.path, "wb")
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, f"File exceeds the {UPLOAD_MAX_MB:g} MB upload limit")
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def end(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.end()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+async def receive(stream: AsyncIterator[bytes], content_type: str, content_length: Optional[str] = None,
+                  field: str = "file") -> StreamedUpload:
+    """
+    Parse a multipart/form-data body chunk by chunk as it arrives and write
+    the ``field`` part straight to disk. Nothing is buffered beyond one
+    network chunk; the file name is checked when the part headers arrive and
+    the size limit while receiving, so a bad or oversized upload is cut off
+    without being stored first. ``upload.filename`` is the sanitized name.
+    """
+    max_bytes = int(UPLOAD_MAX_MB * 1024 * 1024)
+    mime, options = parse_options_header(content_type)
+    if mime != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadRejected(400, "Expected a multipart/form-data upload")
+    # The body also carries part headers and the boundary, hence the slack
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + 64 * 1024:
+        raise UploadRejected(413, f"File exceeds the {UPLOAD_MAX_MB:g} MB upload limit")
+
+    upload = StreamedUpload(max_bytes)
+    part = {"headers": {}, "field": b"", "value": b""}
+
+    def on_part_begin():
+        part["headers"] = {}
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["target"] = disposition.get(b"name") == field.encode() and b"filename" in disposition
+        if part["target"]:
+            # Reject a bad name before any of the file's bytes are written
+            upload.begin(safe_filename(disposition[b"filename"].decode("utf-8", "replace")))
+
+    def on_part_data(data, start, end):
+        if part.get("target"):
+            upload.write(data[start:end])
+
+    def on_part_end():
+        if part.get("target"):
+            upload.end()
+            part["target"] = False
+
+    parser = MultipartParser(options[b"boundary"], callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+        parser.finalize()
+    except UploadRejected:
+        upload.discard()
+        raise
+    except Exception as e:
+        upload.discard()
+        raise UploadRejected(400, f"Malformed upload: {e}")
+    if upload.filename is None:
+        upload.discard()
+        raise UploadRejected(400, f"No '{field}' file in the upload")
+    return upload
+
+
+def safe_filename(filename: str) -> str:
+    """Base name only; rejects names that are not PDFs or would be hidden files."""
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    if not name.lower().endswith(".pdf") or name.startswith(".") or len(name) > 255:
+        raise UploadRejected(400, "Only PDF files are supported")
+    return name
+
+
+def validate_pdf(path: str) -> int:
+    """
+    Check the ``%PDF-`` header and open the file with PyMuPDF, which reads the
+    trailer and page tree but no page content. Returns the page count.
+    """
+    with open(path, "rb") as f:
+        if b"%PDF-" not in f.read(_HEADER_WINDOW):
+            raise UploadRejected(400, "Not a PDF file (missing %PDF- header)")
+
+    import fitz  # PyMuPDF
+
+    try:
+        doc = fitz.open(path, filetype="pdf")
+    except Exception as e:
+        raise UploadRejected(400, f"Unreadable PDF: {e}")
+    try:
+        if doc.needs_pass:
+            raise UploadRejected(400, "Password-protected PDFs are not supported")
+        pages = doc.page_count
+    finally:
+        doc.close()
+    if pages == 0:
+        raise UploadRejected(400, "PDF has no pages")
+    if pages > UPLOAD_MAX_PAGES:
+        raise UploadRejected(413, f"PDF has {pages} pages; the limit is {UPLOAD_MAX_PAGES}")
+    return pages
+
+
+def store(upload: StreamedUpload) -> str:
+    """Move the upload into the content-addressed store (``<sha256>.pdf``); identical content is kept once."""
+    blob_path = os.path.join(UPLOAD_STORE_DIR, f"{upload.content_hash}.pdf")
+    if os.path.exists(blob_path):
+        upload.discard()
+    else:
+        os.replace(upload.path, blob_path)
+    return blob_path
+
+
+def publish(blob_path: str, filename: str) -> str:
+    """
+    Make the stored blob visible as ``PDF_DIR/<filename>`` with one atomic
+    rename (a hard link, or a copy across file systems). Readers that already
+    opened a previous file under that name keep reading the old content.
+    """
+    os.makedirs(PDF_DIR, exist_ok=True)
+    target = os.path.join(PDF_DIR, filename)
+    tmp = os.path.join(PDF_DIR, f".{filename}.{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(blob_path, tmp)
+    except OSError:
+        shutil.copyfile(blob_path, tmp)
+    os.replace(tmp, target)
+    return target
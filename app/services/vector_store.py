@@ -0,0 +1,182 @@
+import os
+import time
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.services.manifest import RAG_MANIFEST
+
+if TYPE_CHECKING:
+    # qdrant_client (~0.8 s to import) is loaded by init_client()
+    from qdrant_client import AsyncQdrantClient
+
+load_dotenv()
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# 設定後改用 qdrant-client 內建的本機模式 (目錄路徑或 ":memory:")，不需 Qdrant 服務；同一路徑一次只能一個 process 開啟
+QDRANT_PATH = os.getenv("QDRANT_PATH") or None
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY") or None
+# gRPC 傳輸（Qdrant 預設 gRPC port 為 6334）
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))
+# collection 狀態的背景刷新間隔 (秒)
+QDRANT_STATE_TTL = float(os.getenv("QDRANT_STATE_TTL", "30"))
+COLLECTION_NAME = "rag_documents"
+
+_client: Optional["AsyncQdrantClient"] = None
+_state: Optional[Dict[str, Any]] = None
+_state_lock: Optional[asyncio.Lock] = None
+_refresher: Optional[asyncio.Task] = None
+
+
+def client_kwargs() -> Dict[str, Any]:
+    """Connection settings shared by the app client and the ingestion scripts' sync client."""
+    if QDRANT_PATH:
+        return {"location": ":memory:"} if QDRANT_PATH == ":memory:" else {"path": QDRANT_PATH}
+    return {
+        "url": QDRANT_URL,
+        "api_key": QDRANT_API_KEY,
+        "prefer_grpc": QDRANT_PREFER_GRPC,
+        "grpc_port": QDRANT_GRPC_PORT,
+        "timeout": QDRANT_TIMEOUT,
+    }
+
+
+def index_version() -> str:
+    """
+    Version of the rag_documents collection as seen by this process.
+    process_rag.py rewrites its manifest after every change to the collection.
+    """
+    try:
+        st = os.stat(RAG_MANIFEST)
+    except FileNotFoundError:
+        return "empty"
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def init_client() -> "AsyncQdrantClient":
+    """Create the shared AsyncQdrantClient. Called once from the app lifespan."""
+    global _client, _state_lock
+    if _client is None:
+        from qdrant_client import AsyncQdrantClient
+
+        # Version check is a blocking round trip at construction; /api/health reports reachability instead
+        _client = AsyncQdrantClient(**client_kwargs(), check_compatibility=False)
+        _state_lock = asyncio.Lock()
+    return _client
+
+
+async def close_client():
+    global _client, _state, _state_lock
+    stop_refresher()
+    if _client is not None:
+        await _client.close()
+    _client = _state = _state_lock = None
+
+
+def get_client() -> "AsyncQdrantClient":
+    # Scripts that call the services without the app lifespan get a lazily created client
+    return _client or init_client()
+
+
+async def _load_state() -> Dict[str, Any]:
+    version = index_version()
+    state = {
+        "exists": False,
+        "points_count": None,
+        "vector_size": None,
+        "distance": None,
+        "index_version": version,
+        "checked_at": time.time(),
+        "error": None,
+    }
+    client = get_client()
+    try:
+        if await client.collection_exists(COLLECTION_NAME):
+            info = await client.get_collection(COLLECTION_NAME)
+            vectors = info.config.params.vectors
+            state["exists"] = True
+            state["points_count"] = info.points_count
+            if hasattr(vectors, "size"):
+                state["vector_size"] = vectors.size
+                state["distance"] = str(vectors.distance.value if hasattr(vectors.distance, "value") else vectors.distance)
+    except Exception as e:
+        print(f"Qdrant Check Error: {e}")
+        state["error"] = str(e)
+    return state
+
+
+async def refresh_state() -> Dict[str, Any]:
+    global _state
+    get_client()
+    async with _state_lock:
+        _state = await _load_state()
+    return _state
+
+
+async def collection_state() -> Dict[str, Any]:
+    """
+    Cached existence/schema of the rag_documents collection.
+    Reloaded only when missing, older than QDRANT_STATE_TTL, or when the RAG manifest
+    changed (process_rag.py finished an ingestion run); otherwise no network round trip.
+    """
+    state = _state
+    if (
+        state is None
+        or state["index_version"] != index_version()
+        or time.time() - state["checked_at"] > QDRANT_STATE_TTL
+    ):
+        state = await refresh_state()
+    return state
+
+
+def invalidate_state():
+    """Force the next collection_state() to ask Qdrant again (e.g. after a query on a vanished collection)."""
+    global _state
+    _state = None
+
+
+async def _refresh_loop():
+    while True:
+        await asyncio.sleep(QDRANT_STATE_TTL)
+        try:
+            await refresh_state()
+        except Exception as e:
+            print(f"Qdrant state refresh failed: {e}")
+
+
+def start_refresher():
+    """Refresh the collection state in the background so requests never pay for the check."""
+    global _refresher
+    if _refresher is None:
+        _refresher = asyncio.get_running_loop().create_task(_refresh_loop())
+
+
+def stop_refresher():
+    global _refresher
+    if _refresher is not None:
+        _refresher.cancel()
+        _refresher = None
+
+
+async def health() -> Dict[str, Any]:
+    """Round-trip latency to Qdrant plus the (freshly reloaded) collection state."""
+    client = get_client()
+    started = time.perf_counter()
+    try:
+        await client.get_collections()
+        latency_ms = (time.perf_counter() - started) * 1000
+        status, error = "ok", None
+    except Exception as e:
+        latency_ms = (time.perf_counter() - started) * 1000
+        status, error = "unavailable", str(e)
+    return {
+        "status": status,
+        "url": QDRANT_PATH or QDRANT_URL,
+        "transport": "local" if QDRANT_PATH else ("grpc" if QDRANT_PREFER_GRPC else "http"),
+        "latency_ms": round(latency_ms, 2),
+        "error": error,
+        "collection": await refresh_state() if status == "ok" else _state,
+    }
@@ -57,7 +57,8 @@ document.addEventListener('DOMContentLoaded', () => {
         const loadingId = addLoadingMessage();
 
         try {
-            const response = await fetch('/api/chat', {
+            // Answer is streamed as Server-Sent Events: stage updates, then tokens, then sources
+            const response = await fetch('/api/chat/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
@@ -68,24 +69,75 @@ document.addEventListener('DOMContentLoaded', () => {
                 })
             });
 
-            const data = await response.json();
-
-            // Remove loading
-            removeMessage(loadingId);
-
-            // AI Response UI
-            if (response.ok) {
-                addMessage(data.response, 'ai', data.sources);
-            } else {
+            if (!response.ok) {
+                const data = await response.json();
+                removeMessage(loadingId);
                 addMessage(`Error: ${data.detail || 'Unknown error'}`, 'ai');
+                return;
             }
 
+            let answerId = null;
+            let answerText = '';
+            await readEventStream(response, (event, data) => {
+                if (event === 'token') {
+                    if (!answerId) {
+                        removeMessage(loadingId);
+                        answerId = addMessage('', 'ai');
+                    }
+                    answerText += data.text;
+                    updateMessage(answerId, answerText);
+                } else if (event === 'sources') {
+                    if (!answerId) {
+                        removeMessage(loadingId);
+                        answerId = addMessage('', 'ai');
+                    }
+                    updateMessage(answerId, answerText, data);
+                } else if (event === 'error') {
+                    removeMessage(loadingId);
+                    addMessage(`Error: ${data.detail || 'Unknown error'}`, 'ai');
+                } else if (STAGE_LABELS[event]) {
+                    setLoadingText(loadingId, STAGE_LABELS[event](data));
+                }
+            });
+            removeMessage(loadingId);
+
         } catch (error) {
             removeMessage(loadingId);
             addMessage(`Network Error: ${error.message}`, 'ai');
         }
     }
 
+    const STAGE_LABELS = {
+        cache_hit: () => 'Found a cached answer...',
+        docs_selected: (d) => `Searching ${d.documents.join(', ')}...`,
+        nodes_selected: (d) => `Reading ${d.nodes.length} section(s) of ${d.document}...`,
+        pages_extracted: (d) => `Read ${d.pages} page(s) (${d.tokens_used} tokens). Writing the answer...`,
+        retrieved: (d) => `Found ${d.chunks} relevant passage(s). Writing the answer...`,
+    };
+
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                onEvent(event, data ? JSON.parse(data) : {});
+            }
+        }
+    }
+
     sendBtn.addEventListener('click', sendMessage);
     userInput.addEventListener('keydown', (e) => {
         if (e.key === 'Enter' && !e.shiftKey) {
@@ -116,14 +168,16 @@ document.addEventListener('DOMContentLoaded', () => {
             removeMessage(uploadMsgId);
 
             if (response.ok) {
-                // Show status based on processing result
-                if (data.status === 'success') {
-                    addMessage(`✅ ${data.message || 'File uploaded and processed successfully!'}`, 'system');
+                // Processing runs in the background; poll the job until it finishes
+                const processingMsgId = addMessage(`⏳ ${data.message || 'File uploaded. Processing...'}`, 'system');
+                const job = await waitForJob(data.job_id);
+                removeMessage(processingMsgId);
+
+                if (job.status === 'success') {
+                    addMessage(`✅ ${job.message || 'File uploaded and processed successfully!'}`, 'system');
                     addMessage('💡 You can now switch to "Find Documents" mode to search this file.', 'system');
-                } else if (data.status === 'partial') {
-                    addMessage(`⚠️ ${data.message || 'File uploaded but processing incomplete.'}`, 'system');
-                } else if (data.status === 'failed') {
-                    addMessage(`❌ ${data.message || 'Processing failed.'}`, 'system');
+                } else {
+                    addMessage(`❌ ${job.message || 'Processing failed.'}`, 'system');
                 }
             } else {
                 addMessage(`❌ Upload failed: ${data.detail}`, 'system');
@@ -137,6 +191,20 @@ document.addEventListener('DOMContentLoaded', () => {
         e.target.value = '';
     });
 
+    async function waitForJob(jobId) {
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) {
+                return { status: 'failed', message: job.detail || 'Job not found' };
+            }
+            if (job.status === 'success' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    }
+
     // UI Helpers
     function addMessage(text, sender, sources = []) {
         const div = document.createElement('div');
@@ -186,6 +254,27 @@ document.addEventListener('DOMContentLoaded', () => {
         return div.id = 'loading-' + Date.now();
     }
 
+    function updateMessage(id, text, sources = []) {
+        const el = document.getElementById(id);
+        if (!el) return;
+        el.querySelector('.content p').innerHTML = text.replace(/\n/g, '<br>');
+        if (sources && sources.length > 0) {
+            let sourcesEl = el.querySelector('.sources');
+            if (!sourcesEl) {
+                sourcesEl = document.createElement('div');
+                sourcesEl.className = 'sources';
+                el.querySelector('.content').appendChild(sourcesEl);
+            }
+            sourcesEl.innerHTML = `<small>Sources: ${sources.join(', ')}</small>`;
+        }
+        messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
+    function setLoadingText(id, text) {
+        const el = document.getElementById(id);
+        if (el) el.querySelector('.content p').textContent = text;
+    }
+
     function removeMessage(id) {
         const el = document.getElementById(id);
         if (el) el.remove();
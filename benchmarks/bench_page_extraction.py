@@ -0,0 +1,87 @@
+"""
+Page text extraction for a page store build (app/services/page_store.py):
+one in-process pass over the PDF versus PAGE_EXTRACT_BATCH-page spans fanned
+out over the extraction process pool.
+
+A synthetic PDF is generated with benchmarks/corpus.py unless ``--pdf`` is
+given. ``pool_cold`` includes starting the workers and opening the PDF in
+each; ``pool_warm`` is a later build with the pool and handles reused, which
+is what a long-running API process sees. Every run is checked against the
+serial output.
+
+    python benchmarks/bench_page_extraction.py --pages 400 --workers 4 --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services import page_store
+from benchmarks.corpus import write_pdf
+
+
+def timed(pdf_path: str):
+    started = time.perf_counter()
+    pages = page_store._extract_pages(pdf_path)
+    return (time.perf_counter() - started) * 1000, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=400, help="pages of the synthetic PDF")
+    parser.add_argument("--pdf", help="benchmark an existing PDF instead")
+    parser.add_argument("--workers", type=int, default=page_store.PAGE_EXTRACT_WORKERS)
+    parser.add_argument("--batch", type=int, default=page_store.PAGE_EXTRACT_BATCH)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json-out")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(tmp, "bench.pdf")
+            write_pdf(pdf_path, args.pages)
+
+        page_store.PAGE_EXTRACT_WORKERS = 1
+        serial = []
+        for _ in range(args.repeat):
+            ms, expected = timed(pdf_path)
+            serial.append(ms)
+        print(f"{len(expected)} pages, {args.workers} workers, {args.batch} pages per span\n")
+
+        page_store.PAGE_EXTRACT_WORKERS = args.workers
+        page_store.PAGE_EXTRACT_BATCH = args.batch
+        page_store.PAGE_EXTRACT_MIN_PAGES = 1
+        cold, pages = timed(pdf_path)
+        assert pages == expected, "pool output differs from the serial pass"
+        warm = []
+        for _ in range(args.repeat):
+            ms, pages = timed(pdf_path)
+            assert pages == expected, "pool output differs from the serial pass"
+            warm.append(ms)
+        page_store.shutdown_pool()
+
+    median = lambda values: sorted(values)[len(values) // 2]
+    results = {
+        "pages": len(expected),
+        "workers": args.workers,
+        "serial_ms": round(median(serial), 1),
+        "pool_cold_ms": round(cold, 1),
+        "pool_warm_ms": round(median(warm), 1),
+    }
+    for case in ("serial_ms", "pool_cold_ms", "pool_warm_ms"):
+        print(f"{case[:-3]:<10} {results[case]:9.1f} ms  ({results['pages'] / results[case] * 1000:7.0f} pages/s)")
+    print(f"\nwarm speedup {results['serial_ms'] / results['pool_warm_ms']:.2f}x "
+          f"(os.cpu_count() = {os.cpu_count()})")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Cold-start import time of the API process and the ingestion scripts.
+
+Each target is imported in a fresh interpreter with ``python -X importtime``;
+the cumulative time of the top-level module is the median over ``--repeat``
+runs. A target fails when it goes over its budget or when it imports one of
+the heavy libraries that must only be loaded on first use (openai,
+qdrant_client, fitz, langchain*), so the script can guard against regressions
+in CI::
+
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --budget-ms app.main=600 --json-out startup.json
+
+Budgets default to STARTUP_BUDGET_MS (per target) and can be overridden with
+``--budget-ms TARGET=MS``. Exits 1 if any target fails.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Cold-start budgets (ms) with headroom for slower machines; measured ~0.5 s / ~0.18 s / ~0.17 s
+STARTUP_BUDGET_MS = {
+    "app.main": 1000,
+    "scripts.process_pageindex": 500,
+    "scripts.process_rag": 500,
+}
+# Libraries that the services and scripts load lazily; importing one at startup is a regression
+LAZY_MODULES = ("openai", "qdrant_client", "fitz", "langchain_text_splitters", "langchain_community", "langchain_core")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def parse_importtime(stderr: str):
+    """``(module, self_us, cumulative_us, depth)`` for each line of ``-X importtime`` output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure(target: str):
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                         capture_output=True, text=True, cwd=ROOT)
+    if out.returncode != 0:
+        raise RuntimeError(f"import {target} failed:\n{out.stderr[-2000:]}")
+    rows = parse_importtime(out.stderr)
+    end = max(i for i, (module, _, _, depth) in enumerate(rows) if module == target and depth == 0)
+    # Children are listed before their parent; site/.pth imports at interpreter start are not part of the target
+    start = max([i + 1 for i, row in enumerate(rows[:end]) if row[3] == 0] or [0])
+    return rows[end][2] / 1000, rows[start:end]
+
+
+def run_target(target: str, repeat: int, top: int):
+    runs = [measure(target) for _ in range(repeat)]
+    runs.sort(key=lambda r: r[0])
+    median_ms, rows = runs[len(runs) // 2]
+    loaded = {module.split(".")[0] for module, *_ in rows}
+    # Direct imports of the target by cumulative time
+    heaviest = sorted(((m, cum / 1000) for m, _, cum, depth in rows if depth == 1),
+                      key=lambda r: -r[1])[:top]
+    return {
+        "median_ms": round(median_ms, 1),
+        "min_ms": round(runs[0][0], 1),
+        "max_ms": round(runs[-1][0], 1),
+        "eager_heavy_imports": sorted(m for m in LAZY_MODULES if m in loaded),
+        "heaviest": [{"module": m, "ms": round(ms, 1)} for m, ms in heaviest],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=list(STARTUP_BUDGET_MS), help="modules to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="heaviest imports to list per target")
+    parser.add_argument("--budget-ms", action="append", default=[], metavar="TARGET=MS")
+    parser.add_argument("--json-out")
+    args = parser.parse_args()
+
+    budgets = dict(STARTUP_BUDGET_MS)
+    for item in args.budget_ms:
+        target, _, ms = item.partition("=")
+        budgets[target] = float(ms)
+
+    results, failed = {}, []
+    for target in args.targets:
+        result = run_target(target, args.repeat, args.top)
+        budget = budgets.get(target)
+        result["budget_ms"] = budget
+        problems = []
+        if budget is not None and result["median_ms"] > budget:
+            problems.append(f"over budget ({budget:g} ms)")
+        if result["eager_heavy_imports"]:
+            problems.append(f"imports {', '.join(result['eager_heavy_imports'])} at startup")
+        result["ok"] = not problems
+        results[target] = result
+
+        status = "ok" if not problems else "FAIL: " + "; ".join(problems)
+        print(f"{target:<28} {result['median_ms']:8.1f} ms  (min {result['min_ms']:.1f}, "
+              f"max {result['max_ms']:.1f})  {status}")
+        for row in result["heaviest"]:
+            print(f"    {row['module']:<40} {row['ms']:8.1f} ms")
+        if problems:
+            failed.append(target)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        print(f"\nStartup regression in: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compare loading a PageIndex structure from ``*_structure.json`` with the binary
+``.pidx`` format (app/services/structure_store.py).
+
+A synthetic tree is written in both formats; every measurement runs in a fresh
+interpreter so the RSS numbers are not shared between cases:
+
+  json_load      json.load of the whole file (what the registry did before)
+  pidx_open      open + document metadata + top-level nodes (what a tree search touches first)
+  pidx_subtree   open + one subtree looked up by node_id
+  pidx_full      open + decode the whole tree (single-shot search / doc_index)
+
+    python benchmarks/bench_structure_format.py --pages 20000 --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+CASES = ["json_load", "pidx_open", "pidx_subtree", "pidx_full"]
+
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(case: str, path: str, node_id: str):
+    """Run one case in this (fresh) process and print its timing and RSS growth as JSON."""
+    from app.services import structure_store
+
+    before = rss_kb()
+    started = time.perf_counter()
+    if case == "json_load":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        data = structure_store.StructureFile(path)
+        if case == "pidx_open":
+            data.roots()
+        elif case == "pidx_subtree":
+            assert data.subtree(node_id) is not None
+        else:
+            data.load_tree()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"ms": elapsed * 1000, "rss_kb": rss_kb() - before}))
+
+
+def run_case(case: str, path: str, node_id: str, repeat: int):
+    rows = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", case, path, node_id],
+                             capture_output=True, text=True, check=True, cwd=ROOT)
+        rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    ms = sorted(r["ms"] for r in rows)
+    rss = sorted(r["rss_kb"] for r in rows)
+    return {"median_ms": ms[len(ms) // 2], "median_rss_mb": rss[len(rss) // 2] / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20000, help="pages of the synthetic document")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--structure", help="benchmark an existing *_structure.json instead")
+    parser.add_argument("--json-out")
+    parser.add_argument("--child", nargs=3, metavar=("CASE", "PATH", "NODE_ID"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    from app.services import structure_store
+    from benchmarks.corpus import synthetic_structure
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.structure:
+            with open(args.structure, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        else:
+            data, _ = synthetic_structure(args.pages)
+        json_path = os.path.join(tmp, "doc_structure.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        pidx_path = structure_store.convert(json_path)
+
+        stored = structure_store.StructureFile(pidx_path)
+        assert stored.to_json_data() == data, "round trip mismatch"
+        ids = [stored.node(i).get("node_id") for i in range(stored.node_count)]
+        node_id = random.Random(0).choice([i for i in ids if i is not None] or [""])
+        print(f"{stored.node_count} nodes; JSON {os.path.getsize(json_path) / 1e6:.2f} MB, "
+              f".pidx {os.path.getsize(pidx_path) / 1e6:.2f} MB; subtree node_id={node_id}\n")
+        stored.close()
+
+        results = {}
+        for case in CASES:
+            if case == "pidx_subtree" and not node_id:
+                continue
+            path = json_path if case == "json_load" else pidx_path
+            results[case] = run_case(case, path, node_id, args.repeat)
+            print(f"{case:<14} {results[case]['median_ms']:9.2f} ms  {results[case]['median_rss_mb']:8.2f} MB RSS")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Offline end-to-end benchmark suite: both ingestion scripts and both query
+paths against local stand-ins, on generated corpora.
+
+  * OpenAI      benchmarks/stub_openai.py (fixed latency, canned answers)
+  * Qdrant      qdrant-client local mode (QDRANT_PATH) instead of a server
+  * PageIndex   a deterministic stand-in package that reads the PDF, makes a few
+                stub LLM calls and returns the synthetic tree the PDF was generated
+                from (the real library needs a model that follows its prompts)
+
+Everything runs in a temporary workspace (symlinks to app/, scripts/,
+benchmarks/) so the repo's data directories are not touched. Phases:
+
+  ingest_rag        scripts/process_rag.py over generated .txt sources
+  ingest_pageindex  scripts/process_pageindex.py over generated PDFs
+  query_chat        /api/chat, tool=chat (hybrid retrieval + answer)
+  query_document    /api/chat, tool=find_document (doc selection, tree search, pages, answer)
+
+Each phase reports wall time, throughput and peak RSS (largest single
+process); query phases also report p50/p95/p99 latency and the mean time per
+pipeline stage from /api/metrics. Results are written as JSON tagged with the
+git commit, so runs can be compared across commits:
+
+    python benchmarks/bench_suite.py --preset small
+    python benchmarks/bench_suite.py --preset medium --out benchmarks/results/after.json
+    python benchmarks/bench_suite.py --compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import pick, write_pdf, write_text_corpus
+from benchmarks.load_test_chat import start_server, wait_ready
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+PRESETS = {
+    "small": {"rag_files": 10, "rag_chars": 20_000, "pdfs": 2, "pdf_pages": 50, "requests": 40, "concurrency": 8},
+    "medium": {"rag_files": 50, "rag_chars": 50_000, "pdfs": 5, "pdf_pages": 200, "requests": 200, "concurrency": 16},
+    "large": {"rag_files": 200, "rag_chars": 100_000, "pdfs": 10, "pdf_pages": 1000, "requests": 500, "concurrency": 32},
+}
+
+# Metrics shown by --compare: (phase, key, higher is better)
+COMPARED = [
+    ("ingest_rag", "wall_s", False), ("ingest_rag", "chunks_per_s", True), ("ingest_rag", "peak_rss_mb", False),
+    ("ingest_pageindex", "wall_s", False), ("ingest_pageindex", "pages_per_s", True),
+    ("ingest_pageindex", "peak_rss_mb", False),
+    ("query_chat", "req_per_s", True), ("query_chat", "p50_ms", False), ("query_chat", "p95_ms", False),
+    ("query_chat", "p99_ms", False),
+    ("query_document", "req_per_s", True), ("query_document", "p50_ms", False),
+    ("query_document", "p95_ms", False), ("query_document", "p99_ms", False),
+    ("server", "peak_rss_mb", False),
+]
+
+PAGEINDEX_STANDIN = '''"""Deterministic PageIndex stand-in, written by benchmarks/bench_suite.py into its temporary workspace."""
+import os
+from types import SimpleNamespace
+
+import fitz
+import openai
+
+from benchmarks.corpus import doc_seed, synthetic_structure
+
+CALLS_PER_DOC = int(os.getenv("BENCH_PAGEINDEX_CALLS", "4"))
+
+
+def config(**kwargs):
+    return SimpleNamespace(**kwargs)
+
+
+def page_index_main(pdf_path, opt=None):
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    doc = fitz.open(pdf_path)
+    pages = [page.get_text() for page in doc]
+    doc.close()
+    client = openai.OpenAI()
+    step = max(1, -(-len(pages) // CALLS_PER_DOC))
+    for start in range(0, len(pages), step):
+        text = "".join(pages[start:start + step])[:8000]
+        client.chat.completions.create(model=getattr(opt, "model", "stub"), temperature=0,
+                                       messages=[{"role": "user", "content": "Detect the sections:\\n" + text}])
+    structure, _ = synthetic_structure(len(pages), seed=doc_seed(name))
+    structure["doc_name"] = name
+    return structure
+'''
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args) -> str:
+        out = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip()
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown",
+            "subject": git("log", "-1", "--format=%s"),
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def run_measured(args: List[str], cwd: str, env: Dict[str, str], quiet: bool) -> Dict[str, Any]:
+    """Run a child to completion; wall time and peak RSS of it and its (waited) descendants."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=cwd, env=env,
+                            stdout=subprocess.DEVNULL if quiet else None, stderr=subprocess.DEVNULL if quiet else None)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "wall_s": round(time.perf_counter() - started, 3),
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "exit_code": proc.returncode,
+    }
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def prepare_workspace(workspace: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    for name in ("app", "scripts", "benchmarks"):
+        os.symlink(os.path.join(ROOT, name), os.path.join(workspace, name))
+    package = os.path.join(workspace, "lib", "PageIndex", "pageindex")
+    os.makedirs(package)
+    with open(os.path.join(package, "__init__.py"), "w", encoding="utf-8") as f:
+        f.write(PAGEINDEX_STANDIN)
+
+    codes = write_text_corpus(os.path.join(workspace, "data", "rag_source"), params["rag_files"], params["rag_chars"])
+    pdf_dir = os.path.join(workspace, "lib", "PageIndex", "tests", "pdfs")
+    os.makedirs(pdf_dir)
+    leaves = []
+    for d in range(params["pdfs"]):
+        name = f"report_{d:02d}"
+        leaves += [(name, leaf) for leaf in write_pdf(os.path.join(pdf_dir, f"{name}.pdf"), params["pdf_pages"])]
+    return {"rag_codes": codes, "leaves": leaves}
+
+
+def metric_sums(text: str, name: str) -> Dict[tuple, Dict[str, float]]:
+    """Parse ``<name>_sum`` / ``<name>_count`` series of the Prometheus text into {labels: {sum, count}}."""
+    series: Dict[tuple, Dict[str, float]] = {}
+    for line in text.splitlines():
+        for suffix in ("_sum", "_count"):
+            prefix = f"{name}{suffix}{{"
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit("} ", 1)
+                key = tuple(part.split("=", 1)[1].strip('"') for part in labels.split(","))
+                series.setdefault(key, {})[suffix[1:]] = float(value)
+    return series
+
+
+async def run_queries(url: str, tool: str, questions: List[str], concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=300) as client:
+        async def one(question: str):
+            nonlocal errors
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    res = await client.post(url, json={"tool": tool, "message": question})
+                    ok = res.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - t0)
+                errors += not ok
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in questions))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(questions),
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_s": round(elapsed, 3),
+        "req_per_s": round(len(questions) / elapsed, 2),
+        **{f"p{int(q * 100)}_ms": round(percentile(latencies, q) * 1000, 1) for q in (0.5, 0.95, 0.99)},
+    }
+
+
+def run_suite(args) -> Dict[str, Any]:
+    params = {**PRESETS[args.preset]}
+    for key in ("requests", "concurrency"):
+        if getattr(args, key):
+            params[key] = getattr(args, key)
+    workspace = tempfile.mkdtemp(prefix="pagerag-bench-")
+    results: Dict[str, Any] = {
+        "meta": {
+            **git_revision(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "preset": args.preset,
+            "params": params,
+            "stub_latency_s": args.latency,
+            "structure_format": args.structure_format,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+    }
+    quiet = not args.verbose
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+        "QDRANT_PATH": os.path.join(workspace, "qdrant"),
+        # Local-mode Qdrant keeps one SQLite connection; concurrent upsert threads collide on its transactions
+        "UPSERT_CONCURRENCY": "1",
+        "PAGEINDEX_STRUCTURE_FORMAT": args.structure_format,
+        # The stub answers instantly enough that the real rate limits would be the bottleneck
+        "LLM_REQUESTS_PER_MIN": "1000000",
+        "LLM_TOKENS_PER_MIN": "1000000000",
+        "TELEMETRY_JSON_LOGS": "false",
+        # The stand-in package; app/services/indexing.py resolves lib/PageIndex through the app/ symlink
+        "PYTHONPATH": os.pathsep.join([workspace, os.path.join(workspace, "lib", "PageIndex")]),
+    }
+    stub = start_server("benchmarks.stub_openai:app", args.stub_port, {"STUB_LATENCY": str(args.latency)}, quiet)
+    api = None
+    try:
+        print(f"Generating corpus in {workspace} ...")
+        corpus = prepare_workspace(workspace, params)
+        wait_ready(f"http://127.0.0.1:{args.stub_port}/docs")
+
+        rag = run_measured([sys.executable, "scripts/process_rag.py"], workspace, env, quiet)
+        sparse_path = os.path.join(workspace, "data", "rag_index", "sparse_index.json")
+        with open(sparse_path, "r", encoding="utf-8") as f:
+            sources = json.load(f)["sources"]
+        chunks = sum(len(v) for v in sources.values())
+        rag.update(files=params["rag_files"], indexed=len(sources), chunks=chunks, chunks_per_s=round(chunks / rag["wall_s"], 1))
+        results["ingest_rag"] = rag
+        print(f"ingest_rag        {rag}")
+
+        pageindex = run_measured([sys.executable, "scripts/process_pageindex.py"], workspace, env, quiet)
+        pages = params["pdfs"] * params["pdf_pages"]
+        indexed = len(os.listdir(os.path.join(workspace, "lib", "PageIndex", "tests", "results")))
+        pageindex.update(documents=params["pdfs"], indexed=indexed, pages=pages,
+                         pages_per_s=round(pages / pageindex["wall_s"], 1))
+        results["ingest_pageindex"] = pageindex
+        print(f"ingest_pageindex  {pageindex}")
+        if rag["exit_code"] or pageindex["exit_code"] or len(sources) < params["rag_files"] or indexed < params["pdfs"]:
+            raise RuntimeError("Ingestion failed; re-run with --verbose to see the scripts' output")
+
+        # The local Qdrant directory is single-process: the API opens it after ingestion finished
+        api = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(args.app_port), "--log-level", "warning"],
+            cwd=workspace, env=env,
+            stdout=subprocess.DEVNULL if quiet else None, stderr=subprocess.DEVNULL if quiet else None,
+        )
+        wait_ready(f"http://127.0.0.1:{args.app_port}/docs", timeout=60)
+        url = f"http://127.0.0.1:{args.app_port}/api/chat"
+        n = params["requests"]
+        chat_questions = [f"What was the figure for unit {code}?" for code in pick(corpus["rag_codes"], n)]
+        doc_questions = [f"What were the revenue and margin of segment {leaf['title'][5:]} in {name}?"
+                         for name, leaf in pick(corpus["leaves"], n)]
+        # Warm-up (first embedding of every document, page store builds) is not part of the numbers
+        asyncio.run(run_queries(url, "chat", ["warm-up question"], 1))
+        asyncio.run(run_queries(url, "find_document", ["warm-up question"], 1))
+
+        for phase, tool, questions in (("query_chat", "chat", chat_questions),
+                                       ("query_document", "find_document", doc_questions)):
+            results[phase] = asyncio.run(run_queries(url, tool, questions, params["concurrency"]))
+            print(f"{phase:<17} {results[phase]}")
+
+        metrics = httpx.get(f"http://127.0.0.1:{args.app_port}/api/metrics", timeout=10).text
+        stages = {}
+        for (tool, stage), s in sorted(metric_sums(metrics, "pagerag_stage_seconds").items()):
+            if s.get("count"):
+                stages.setdefault(tool, {})[stage] = round(s["sum"] / s["count"] * 1000, 2)
+        results["stages_mean_ms"] = stages
+        results["server"] = {"peak_rss_mb": process_rss_mb(api.pid)}
+        print(f"server            {results['server']}")
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait(timeout=30)
+        stub.terminate()
+        if args.keep:
+            print(f"Workspace kept at {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+
+def compare(base_path: str, new_path: str):
+    with open(base_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    for label, run in (("base", base), ("new", new)):
+        meta = run["meta"]
+        print(f"{label:<5} {meta['commit']}{' (dirty)' if meta.get('dirty') else ''} {meta['preset']} "
+              f"{meta['timestamp']}  {meta.get('subject', '')}")
+    if base["meta"]["params"] != new["meta"]["params"] or base["meta"]["stub_latency_s"] != new["meta"]["stub_latency_s"]:
+        print("warning: the runs used different parameters; deltas are not comparable")
+    print(f"\n{'metric':<34} {'base':>10} {'new':>10} {'change':>8}")
+    for phase, key, higher_better in COMPARED:
+        old, cur = base.get(phase, {}).get(key), new.get(phase, {}).get(key)
+        if old is None or cur is None:
+            continue
+        change = (cur - old) / old * 100 if old else 0.0
+        worse = change < 0 if higher_better else change > 0
+        flag = " !" if worse and abs(change) >= 10 else ""
+        print(f"{phase + '.' + key:<34} {old:>10.2f} {cur:>10.2f} {change:>+7.1f}%{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--requests", type=int, help="queries per query phase (default: from the preset)")
+    parser.add_argument("--concurrency", type=int, help="concurrent queries (default: from the preset)")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--structure-format", choices=["json", "binary"], default="json")
+    parser.add_argument("--stub-port", type=int, default=9110)
+    parser.add_argument("--app-port", type=int, default=9111)
+    parser.add_argument("--out", help="result JSON (default: benchmarks/results/<commit>-<preset>.json)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary workspace")
+    parser.add_argument("--verbose", action="store_true", help="show child process output")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_suite(args)
+    out = args.out or os.path.join(RESULTS_DIR, f"{results['meta']['commit']}-{args.preset}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
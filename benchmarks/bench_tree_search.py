@@ -0,0 +1,126 @@
+"""
+Compare the hierarchical, budgeted tree search with the original single-shot
+prompt (whole tree serialized with indent=2).
+
+For each question it records prompt tokens (from the API's usage field), LLM
+calls, wall-clock latency and whether any returned node's page range covers
+one of the expected pages.
+
+Questions come from a JSON file of ``{"doc": ..., "question": ..., "pages": [...]}``
+entries answered against the structures in lib/PageIndex/tests/results, or
+from a generated synthetic tree (``--synthetic-pages``). Hit accuracy is only
+meaningful against a real model; against benchmarks/stub_openai.py the
+numbers measure prompt size and call overhead.
+
+    python benchmarks/bench_tree_search.py --synthetic-pages 500 --questions-count 20
+    python benchmarks/bench_tree_search.py --questions my_questions.json --json-out results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.services import llm_client, pageindex_service
+from app.services.structure_registry import registry
+from benchmarks.corpus import synthetic_structure
+
+
+def covers(nodes, pages) -> bool:
+    for node in nodes:
+        start, end = node.get("start_index"), node.get("end_index")
+        if start is None or end is None:
+            continue
+        if any(int(start) <= p <= int(end) for p in pages):
+            return True
+    return False
+
+
+async def run_one(approach: str, item, index_data, query_vector):
+    with llm_client.track_usage() as usage:
+        started = time.perf_counter()
+        error = None
+        try:
+            if approach == "single_shot":
+                nodes = await pageindex_service.single_shot_tree_search(item["question"], index_data)
+            else:
+                nodes = await pageindex_service.tree_searcher.search(item["question"], item["doc"], index_data, query_vector)
+        except Exception as e:
+            nodes, error = [], str(e)
+        latency = time.perf_counter() - started
+    return {
+        "latency_s": latency,
+        "prompt_tokens": usage["prompt_tokens"],
+        "llm_calls": usage["calls"],
+        "hit": covers(nodes, item["pages"]),
+        "error": error,
+    }
+
+
+def summarize(rows):
+    latencies = sorted(r["latency_s"] for r in rows)
+    n = len(rows)
+    return {
+        "queries": n,
+        "mean_prompt_tokens": sum(r["prompt_tokens"] for r in rows) / n,
+        "mean_llm_calls": sum(r["llm_calls"] for r in rows) / n,
+        "p50_latency_s": latencies[n // 2],
+        "p95_latency_s": latencies[min(n - 1, int(n * 0.95))],
+        "hit_accuracy": sum(r["hit"] for r in rows) / n,
+        "errors": sum(1 for r in rows if r["error"]),
+    }
+
+
+async def main_async(args):
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        structures = registry.get_all()
+    else:
+        structure, leaves = synthetic_structure(args.synthetic_pages)
+        structures = {"synthetic": structure}
+        picks = random.Random(1).sample(leaves, min(args.questions_count, len(leaves)))
+        items = [
+            {"doc": "synthetic", "question": f"What were the revenue figures for segment {leaf['title'][5:]}?",
+             "pages": list(range(leaf["start_index"], leaf["end_index"] + 1))}
+            for leaf in picks
+        ]
+
+    results = {}
+    try:
+        for approach in ("single_shot", "hierarchical"):
+            rows = []
+            for item in items:
+                # The query embedding is shared with document pre-selection, so it is not timed here
+                query_vector = await llm_client.embed_query(item["question"])
+                rows.append(await run_one(approach, item, structures[item["doc"]], query_vector))
+            results[approach] = summarize(rows)
+    finally:
+        await llm_client.close_client()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="JSON file with doc/question/pages entries")
+    parser.add_argument("--synthetic-pages", type=int, default=500)
+    parser.add_argument("--questions-count", type=int, default=20)
+    parser.add_argument("--json-out", help="write the summary as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(f"{'approach':<13} {'prompt tok':>10} {'calls':>6} {'p50 s':>7} {'p95 s':>7} {'hit acc':>8} {'errors':>6}")
+    for approach, r in results.items():
+        print(f"{approach:<13} {r['mean_prompt_tokens']:>10.0f} {r['mean_llm_calls']:>6.2f} "
+              f"{r['p50_latency_s']:>7.2f} {r['p95_latency_s']:>7.2f} {r['hit_accuracy']:>8.2f} {r['errors']:>6}")
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
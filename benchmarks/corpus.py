@@ -0,0 +1,131 @@
+"""
+Deterministic synthetic corpora for the benchmarks: PageIndex-like structure
+trees, PDFs whose pages match those trees, and plain-text RAG sources.
+Everything is derived from a seed, so two runs (or two commits) index and
+query exactly the same data.
+"""
+import os
+import random
+import hashlib
+from typing import Any, Dict, List
+
+WORDS = (
+    "revenue margin capex guidance segment outlook inventory backlog dividend liquidity "
+    "customer contract pricing supply demand region quarter forecast headcount investment "
+    "risk compliance audit subsidiary acquisition financing interest currency growth cost"
+).split()
+
+
+def doc_seed(name: str) -> int:
+    """Seed derived from a document name, shared by the PDF generator and the PageIndex stand-in."""
+    return int(hashlib.sha256(name.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def synthetic_structure(total_pages: int, seed: int = 0):
+    """Chapters -> sections -> leaves, each leaf covering a few pages and carrying a unique code."""
+    rng = random.Random(seed)
+    leaves = []
+    chapters = []
+    page = 1
+    chapter_count = max(1, total_pages // 50)
+    for c in range(chapter_count):
+        sections = []
+        for s in range(5):
+            nodes = []
+            for n in range(5):
+                if page > total_pages:
+                    break
+                end = min(total_pages, page + rng.randint(0, 2))
+                code = f"K-{c:02d}{s}{n}"
+                node = {
+                    "title": f"Item {code}",
+                    "node_id": f"{c:02d}{s}{n}",
+                    "start_index": page,
+                    "end_index": end,
+                    "summary": f"Figures and commentary for segment {code}, including revenue, margin and capex for the period.",
+                }
+                nodes.append(node)
+                leaves.append(node)
+                page = end + 1
+            if nodes:
+                sections.append({
+                    "title": f"Section {c}.{s}",
+                    "node_id": f"{c:02d}{s}",
+                    "start_index": nodes[0]["start_index"],
+                    "end_index": nodes[-1]["end_index"],
+                    "summary": "Segments " + ", ".join(n["title"][5:] for n in nodes),
+                    "nodes": nodes,
+                })
+        if sections:
+            chapters.append({
+                "title": f"Chapter {c}",
+                "node_id": f"{c:02d}",
+                "start_index": sections[0]["start_index"],
+                "end_index": sections[-1]["end_index"],
+                "summary": f"Business review part {c}",
+                "nodes": sections,
+            })
+    return {"doc_name": "synthetic", "doc_description": "Synthetic annual report", "structure": chapters}, leaves
+
+
+def filler(rng: random.Random, words: int) -> str:
+    line, lines = [], []
+    for _ in range(words):
+        line.append(rng.choice(WORDS))
+        if len(line) == 12:
+            lines.append(" ".join(line))
+            line = []
+    if line:
+        lines.append(" ".join(line))
+    return "\n".join(lines)
+
+
+def write_pdf(path: str, pages: int) -> List[Dict[str, Any]]:
+    """
+    Write a ``pages``-page PDF whose text follows synthetic_structure() for its
+    name; returns the leaves (with their codes and page ranges).
+    """
+    import fitz  # PyMuPDF
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    structure, leaves = synthetic_structure(pages, seed=doc_seed(name))
+    covering = {}
+    for leaf in leaves:
+        for page in range(leaf["start_index"], leaf["end_index"] + 1):
+            covering[page] = leaf
+    rng = random.Random(doc_seed(name))
+    doc = fitz.open()
+    for page in range(1, pages + 1):
+        leaf = covering.get(page)
+        header = f"{name} page {page}"
+        if leaf:
+            code = leaf["title"][5:]
+            header += (f"\n{leaf['title']}\nSegment {code} revenue was {rng.randint(100, 999)} million, "
+                       f"margin {rng.randint(5, 40)}%, capex {rng.randint(10, 99)} million.")
+        doc.new_page().insert_text((40, 50), f"{header}\n{filler(rng, 250)}", fontsize=8)
+    doc.save(path)
+    doc.close()
+    return leaves
+
+
+def write_text_corpus(directory: str, files: int, chars: int, seed: int = 0) -> List[str]:
+    """Write ``files`` .txt sources of about ``chars`` characters each; returns the fact codes they contain."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    codes = []
+    for f in range(files):
+        parts, size = [], 0
+        while size < chars:
+            code = f"R-{f:03d}{len(parts):04d}"
+            codes.append(code)
+            paragraph = (f"Fact {code}: the {rng.choice(WORDS)} figure for unit {code} was "
+                         f"{rng.randint(100, 999)} thousand.\n{filler(rng, 120)}\n")
+            parts.append(paragraph)
+            size += len(paragraph)
+        with open(os.path.join(directory, f"doc_{f:03d}.txt"), "w", encoding="utf-8") as fh:
+            fh.write("\n".join(parts))
+    return codes
+
+
+def pick(items: List[Any], count: int, seed: int = 1) -> List[Any]:
+    return random.Random(seed).sample(items, min(count, len(items)))
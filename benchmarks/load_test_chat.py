@@ -0,0 +1,147 @@
+"""
+Concurrent /api/chat load test against a local OpenAI stub.
+
+Starts benchmarks/stub_openai.py and the API server as subprocesses, then fires
+batches of /api/chat requests at increasing concurrency and prints throughput.
+With a non-blocking LLM pipeline, req/s should grow roughly linearly with
+concurrency (up to LLM_MAX_CONCURRENCY) instead of staying flat at 1/latency.
+
+With --stream the requests go to /api/chat/stream and the table also reports
+time to first byte and time to the first answer token (p50).
+
+    python benchmarks/load_test_chat.py --concurrency 1 4 16 64 --latency 0.5
+    python benchmarks/load_test_chat.py --stream --tool find_document
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def start_server(module: str, port: int, env: dict, quiet: bool = True) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", module, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL if quiet else None,
+        stderr=subprocess.DEVNULL if quiet else None,
+    )
+
+
+def wait_ready(url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def post_stream(client: httpx.AsyncClient, url: str, payload: dict, t0: float):
+    """POST to the SSE endpoint; returns (status, time to first byte, time to first token event)."""
+    ttfb = first_token = None
+    async with client.stream("POST", url, json=payload) as res:
+        async for line in res.aiter_lines():
+            if ttfb is None:
+                ttfb = time.perf_counter() - t0
+            if first_token is None and line == "event: token":
+                first_token = time.perf_counter() - t0
+    return res.status_code, ttfb, first_token
+
+
+async def run_level(url: str, tool: str, concurrency: int, total: int, stream: bool = False) -> dict:
+    latencies = []
+    ttfbs = []
+    first_tokens = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=120) as client:
+        async def one(i: int):
+            nonlocal errors
+            async with semaphore:
+                payload = {"message": f"load test question {concurrency}-{i}", "tool": tool}
+                t0 = time.perf_counter()
+                if stream:
+                    status, ttfb, first_token = await post_stream(client, url, payload, t0)
+                    if ttfb is not None:
+                        ttfbs.append(ttfb)
+                    if first_token is not None:
+                        first_tokens.append(first_token)
+                else:
+                    status = (await client.post(url, json=payload)).status_code
+                latencies.append(time.perf_counter() - t0)
+                if status != 200:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    ttfbs.sort()
+    first_tokens.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "req_per_s": total / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "max_s": latencies[-1],
+        "ttfb_p50_s": ttfbs[len(ttfbs) // 2] if ttfbs else None,
+        "first_token_p50_s": first_tokens[len(first_tokens) // 2] if first_tokens else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument("--tool", default="chat", choices=["chat", "find_document"])
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--app-port", type=int, default=9101)
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream and report TTFB")
+    parser.add_argument("--verbose", action="store_true", help="show server output")
+    args = parser.parse_args()
+
+    stub = start_server("benchmarks.stub_openai:app", args.stub_port, {"STUB_LATENCY": str(args.latency)}, not args.verbose)
+    api = start_server("app.main:app", args.app_port, {
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.stub_port}/v1",
+        # Unreachable Qdrant -> the chat tool answers with a single direct LLM call
+        "QDRANT_URL": "http://127.0.0.1:1",
+    }, not args.verbose)
+    try:
+        wait_ready(f"http://127.0.0.1:{args.stub_port}/docs")
+        wait_ready(f"http://127.0.0.1:{args.app_port}/docs")
+        url = f"http://127.0.0.1:{args.app_port}/api/chat" + ("/stream" if args.stream else "")
+
+        print(f"stub latency {args.latency}s, {args.requests} requests per level, tool={args.tool}, stream={args.stream}")
+        header = f"{'concurrency':>11} {'req/s':>8} {'p50 s':>7} {'max s':>7} {'errors':>6}"
+        if args.stream:
+            header += f" {'ttfb p50':>9} {'1st tok p50':>11}"
+        print(header)
+        for level in args.concurrency:
+            r = asyncio.run(run_level(url, args.tool, level, args.requests, args.stream))
+            row = f"{r['concurrency']:>11} {r['req_per_s']:>8.2f} {r['p50_s']:>7.2f} {r['max_s']:>7.2f} {r['errors']:>6}"
+            if args.stream:
+                row += f" {r['ttfb_p50_s'] or 0:>9.3f} {r['first_token_p50_s'] or 0:>11.3f}"
+            print(row)
+    finally:
+        api.terminate()
+        stub.terminate()
+        api.wait()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Minimal OpenAI-compatible stub server for load tests and benchmarks.
+
+Serves /v1/chat/completions and /v1/embeddings with a fixed artificial latency
+(STUB_LATENCY seconds) and deterministic canned responses, so throughput
+measurements reflect the app rather than the upstream API. ``stream=True``
+chat requests are answered as SSE chunks, STUB_TOKEN_LATENCY seconds apart.
+STUB_429_RATE (0-1) answers that share of chat requests with a 429 to
+exercise rate-limit backoff.
+
+    uvicorn benchmarks.stub_openai:app --port 9100
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import random
+import hashlib
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY", "0.5"))
+STUB_TOKEN_LATENCY = float(os.getenv("STUB_TOKEN_LATENCY", "0.02"))
+STUB_429_RATE = float(os.getenv("STUB_429_RATE", "0"))
+EMBEDDING_DIM = 1536
+
+app = FastAPI(title="OpenAI stub")
+
+
+def fake_embedding(text: str) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+def canned_answer(prompt: str) -> str:
+    # Hierarchical tree search: select the first (highest ranked) candidate
+    if '"select"' in prompt:
+        first = re.search(r'\{"id":"([^"]+)"', prompt)
+        return json.dumps({"select": [first.group(1)] if first else [], "expand": []})
+    # PageIndex tree search expects a JSON object with relevant_nodes
+    if "relevant_nodes" in prompt:
+        return json.dumps({
+            "thinking": "stub",
+            "relevant_nodes": [{"title": "Stub section", "start_index": 1, "end_index": 2}],
+        })
+    return "這是測試用的固定回覆。"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(STUB_LATENCY)
+    if STUB_429_RATE and random.random() < STUB_429_RATE:
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={"retry-after-ms": "200"},
+        )
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    content = canned_answer(prompt)
+    usage = {
+        "prompt_tokens": len(prompt) // 4,
+        "completion_tokens": len(content) // 4,
+        "total_tokens": (len(prompt) + len(content)) // 4,
+    }
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(body, content, usage), media_type="text/event-stream")
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": usage,
+    }
+
+
+async def stream_chunks(body, content: str, usage: dict):
+    def chunk(choices: list, **extra) -> str:
+        payload = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def delta(content_delta: dict, finish_reason=None) -> str:
+        return chunk([{"index": 0, "delta": content_delta, "finish_reason": finish_reason}])
+
+    yield delta({"role": "assistant", "content": ""})
+    for i in range(0, len(content), 4):
+        await asyncio.sleep(STUB_TOKEN_LATENCY)
+        yield delta({"content": content[i:i + 4]})
+    yield delta({}, finish_reason="stop")
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield chunk([], usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await asyncio.sleep(STUB_LATENCY)
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    tokens = sum(len(t) // 4 for t in inputs)
+    return {
+        "object": "list",
+        "model": body.get("model", "stub"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(t)}
+            for i, t in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
@@ -0,0 +1,43 @@
+"""
+gunicorn settings for the multi-worker deployment (docker/Dockerfile).
+
+Each worker is a separate uvicorn process. State that would otherwise be
+warmed up per worker is shared instead:
+
+  - answer cache, document vectors, upload job status: SQLite at SHARED_STATE_DB
+  - structures: binary .pidx files, memory-mapped (converted once at start-up)
+  - page texts: .pages files, memory-mapped
+  - OpenAI rate limit for indexing: the file-based token bucket (app/services/rate_limiter.py)
+"""
+import os
+import glob
+import multiprocessing
+
+# worker 數；預設為 CPU 核心數，最多 4 個
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = WEB_CONCURRENCY
+worker_class = "uvicorn.workers.UvicornWorker"
+# Long SSE answers and multi-document PageIndex queries
+timeout = 300
+graceful_timeout = 30
+# Each worker imports the app itself: nothing (clients, pools, threads) is forked half-initialized
+preload_app = False
+accesslog = "-"
+
+
+def on_starting(server):
+    """Convert JSON structures that have no up-to-date .pidx so every worker maps the same files."""
+    from app.services import structure_store
+    from app.services.indexing import INDEX_DIR
+
+    for json_path in sorted(glob.glob(os.path.join(INDEX_DIR, "*_structure.json"))):
+        pidx_path = json_path[: -len("_structure.json")] + structure_store.BINARY_SUFFIX
+        if os.path.exists(pidx_path) and os.path.getmtime(pidx_path) >= os.path.getmtime(json_path):
+            continue
+        try:
+            structure_store.convert(json_path)
+            server.log.info("Converted %s to %s", json_path, pidx_path)
+        except Exception as e:
+            server.log.warning("Could not convert %s: %s", json_path, e)
@@ -0,0 +1,57 @@
+import os
+import sys
+import glob
+import json
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services import structure_store
+from app.services.indexing import INDEX_DIR
+
+
+def convert_structures(index_dir: str = INDEX_DIR, remove_json: bool = False):
+    """
+    Convert every ``*_structure.json`` in ``index_dir`` to the binary ``.pidx``
+    format. Each file is read back and compared with its JSON before the JSON is
+    (optionally) removed; the registry prefers whichever file is newer.
+    """
+    json_paths = sorted(glob.glob(os.path.join(index_dir, "*_structure.json")))
+    if not json_paths:
+        print(f"No structure files found in {index_dir}")
+        return
+
+    converted = failed = 0
+    for json_path in json_paths:
+        try:
+            out_path = structure_store.convert(json_path)
+            with open(json_path, "r", encoding="utf-8") as f:
+                original = json.load(f)
+            stored = structure_store.StructureFile(out_path)
+            try:
+                if stored.to_json_data() != original:
+                    raise ValueError("round trip does not match the JSON file")
+                nodes = stored.node_count
+            finally:
+                stored.close()
+        except (OSError, ValueError) as e:
+            print(f"  ✗ {os.path.basename(json_path)}: {e}")
+            failed += 1
+            continue
+        before, after = os.path.getsize(json_path), os.path.getsize(out_path)
+        print(f"  ✓ {os.path.basename(json_path)} -> {os.path.basename(out_path)} "
+              f"({nodes} nodes, {before / 1024:.0f} KB -> {after / 1024:.0f} KB)")
+        if remove_json:
+            os.remove(json_path)
+        converted += 1
+
+    print(f"\n{converted} converted, {failed} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert PageIndex *_structure.json files to the binary .pidx format")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--remove-json", action="store_true", help="delete each JSON file after a verified conversion")
+    args = parser.parse_args()
+    convert_structures(args.index_dir, args.remove_json)
@@ -1,75 +1,107 @@
 import os
 import sys
 import glob
-import json
+import argparse
 from dotenv import load_dotenv
 
-# Add PageIndex library to path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lib', 'PageIndex'))
+# Add project root to path (PageIndex itself is added by app.services.indexing)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-# Import PageIndex core functions
-from pageindex import page_index_main, config
+from app.services import index_scheduler, node_index
+from app.services.indexing import remove_document, options_fingerprint, existing_structure, PDF_DIR, INDEX_DIR
+from app.services.manifest import Manifest, PAGEINDEX_MANIFEST
 
 # Load environment variables
 load_dotenv()
 
-DATA_DIR = "lib/PageIndex/tests/pdfs"
-INDEX_DIR = "lib/PageIndex/tests/results"
+DATA_DIR = PDF_DIR
 
-def process_pageindex():
+def process_pageindex(workers: int = index_scheduler.PAGEINDEX_WORKERS):
     """
     Process PDF files using PageIndex to create hierarchical tree indices.
+    Only new or changed files are indexed; files removed from DATA_DIR have
+    their structures and page stores deleted (tracked in the PageIndex manifest).
+    Up to ``workers`` documents are indexed at once, sharing one OpenAI rate limit;
+    an interrupted document resumes from its LLM call checkpoint on the next run.
     """
     print("Starting PageIndex processing...")
-    
+
     # Create output directory
     if not os.path.exists(INDEX_DIR):
         os.makedirs(INDEX_DIR)
 
     # Find all PDF files
     file_paths = glob.glob(os.path.join(DATA_DIR, "*.pdf"))
-    
+    manifest = Manifest(PAGEINDEX_MANIFEST)
+
+    # Drop structures and page stores of PDFs that were removed from the source directory
+    current = {os.path.basename(p) for p in file_paths}
+    removed = [key for key in manifest.entries if key not in current]
+    removed_docs = [manifest.get(key).get("doc_name") for key in removed]
+    for key in removed:
+        print(f"Removing index of deleted file: {key}")
+        remove_document(manifest, key)
+    if node_index.PAGEINDEX_NODE_INDEX and removed:
+        try:
+            node_index.remove_documents([d for d in removed_docs if d])
+        except Exception as e:
+            print(f"Could not remove node embeddings of deleted files: {e}")
+
     if not file_paths:
         print(f"No PDF files found in {DATA_DIR}")
         print("Please place PDF files in lib/PageIndex/tests/pdfs/ or upload via the web interface")
         return
 
-    # Configure PageIndex options
-    model = os.getenv("OPENAI_MODEL", "gpt-4o-2024-11-20")  # PageIndex 預設用較強的模型
-    opt = config(
-        model=model,
-        toc_check_page_num=20,
-        max_page_num_each_node=10,
-        max_token_num_each_node=12000,
-        if_add_node_id='yes',
-        if_add_node_summary='yes',
-        if_add_doc_description='yes',
-        if_add_node_text='no'
-    )
-
-    # Process each PDF
+    # Only new or changed PDFs (or a changed PageIndex config) are re-indexed
+    fingerprint = options_fingerprint()
+    pending = []
+    refreshed = {}
     for file_path in file_paths:
-        print(f"\nProcessing {os.path.basename(file_path)}...")
-        try:
-            # Run PageIndex
-            toc_with_page_number = page_index_main(file_path, opt)
-            
-            # Save the tree structure
-            pdf_name = os.path.splitext(os.path.basename(file_path))[0]
-            output_file = os.path.join(INDEX_DIR, f'{pdf_name}_structure.json')
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(toc_with_page_number, f, indent=2, ensure_ascii=False)
-            
-            print(f"✓ Successfully indexed: {pdf_name}")
-            print(f"  Index saved to: {output_file}")
-            
-        except Exception as e:
-            print(f"✗ Error processing {file_path}: {e}")
-            import traceback
-            traceback.print_exc()
+        key = os.path.basename(file_path)
+        status, source, entry = manifest.classify(key, file_path, fingerprint)
+        if entry:
+            refreshed[key] = entry
+        doc_name = os.path.splitext(key)[0]
+        if status == "unchanged" and existing_structure(doc_name):
+            continue
+        pending.append((file_path, source))
+    manifest.update(refreshed)
+
+    skipped = len(file_paths) - len(pending)
+    print(f"{len(pending)} to index, {skipped} unchanged, {len(removed)} removed")
+    if pending:
+        index_pending(pending, workers)
+    if node_index.PAGEINDEX_NODE_INDEX:
+        update_node_index()
 
     print("\nPageIndex processing complete.")
 
+def index_pending(pending, workers: int):
+    resuming = [p for p, source in pending
+                if os.path.exists(index_scheduler.journal_path_for(p, source["content_hash"]))]
+    if resuming:
+        print(f"Resuming {len(resuming)} interrupted document(s) from checkpoints")
+
+    # Index documents concurrently; each worker process runs PageIndex on one PDF at a time
+    print(f"Indexing with {min(workers, len(pending))} worker(s)...")
+    outcome = index_scheduler.run(pending, workers)
+    print(f"\n{len(outcome['results'])} indexed, {len(outcome['failures'])} failed")
+    for file_path, error in outcome["failures"]:
+        print(f"  ✗ {os.path.basename(file_path)}: {error}")
+
+def update_node_index():
+    """Embed the nodes of documents indexed since the node index was last built (fast-path lookups)."""
+    stale = node_index.stale_keys(Manifest(PAGEINDEX_MANIFEST))
+    if not stale:
+        return
+    print(f"Embedding structure nodes of {len(stale)} document(s)...")
+    try:
+        node_index.build(stale, DATA_DIR)
+    except Exception as e:
+        print(f"Node embedding failed (tree search still works; retried on the next run): {e}")
+
 if __name__ == "__main__":
-    process_pageindex()
+    parser = argparse.ArgumentParser(description="Build PageIndex structures for the PDFs in " + DATA_DIR)
+    parser.add_argument("--workers", type=int, default=index_scheduler.PAGEINDEX_WORKERS,
+                        help="documents indexed concurrently (default: PAGEINDEX_WORKERS)")
+    process_pageindex(parser.parse_args().workers)
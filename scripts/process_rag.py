@@ -1,19 +1,76 @@
 import os
+import sys
 import glob
-from langchain_community.document_loaders import TextLoader, UnstructuredFileLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import Qdrant
-from qdrant_client import QdrantClient
+import time
+import asyncio
 from dotenv import load_dotenv
 
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.services.manifest import Manifest, RAG_MANIFEST, config_fingerprint
+from app.services import llm_client, vector_store
+from app.services.hybrid_search import RAG_CHUNK_OVERLAP
+from app.services.sparse_index import SparseIndex
+from app.services.rag_ingest import Chunk, IngestStats, ingest
+
 # Load environment variables
 load_dotenv()
 
 DATA_DIR = "data/rag_source"
-QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+COLLECTION_NAME = vector_store.COLLECTION_NAME
+# Seconds between manifest writes while indexing; an interrupted run re-indexes at most this much
+MANIFEST_FLUSH_S = 5.0
+
+# Anything that changes the produced chunks/vectors; a change re-indexes every file
+RAG_CONFIG = {
+    "chunk_size": 1000,
+    "chunk_overlap": RAG_CHUNK_OVERLAP,
+    "embedding_model": llm_client.EMBEDDING_MODEL,
+}
+
+def iter_chunks(pending, text_splitter, files, finalize):
+    """Load and split pending files lazily, registering each file's expected chunks."""
+    for file_path, source in pending:
+        key = os.path.basename(file_path)
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+            continue
+        chunks = [Chunk(key, i, t) for i, t in enumerate(text_splitter.split_text(text))]
+        files[key] = {
+            "source": source,
+            "remaining": len(chunks),
+            "point_ids": [c.id for c in chunks],
+            "sparse": [{"id": c.id, "index": c.index, "text": c.text} for c in chunks],
+            "failed": False,
+        }
+        if not chunks:
+            finalize(key)
+        yield from chunks
+
+def backfill_sparse(client, sparse, keys):
+    """Rebuild BM25 entries for already embedded files from the Qdrant payloads (no re-embedding)."""
+    found = {key: [] for key in keys}
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=COLLECTION_NAME, limit=1000, offset=offset, with_payload=True)
+        for point in points:
+            metadata = point.payload.get("metadata", {})
+            if metadata.get("source") in found:
+                found[metadata["source"]].append({
+                    "id": str(point.id),
+                    "index": metadata.get("chunk_index", 0),
+                    "text": point.payload.get("page_content", ""),
+                })
+        if offset is None:
+            break
+    for key, chunks in found.items():
+        sparse.set_source(key, sorted(chunks, key=lambda c: c["index"]))
+    print(f"Backfilled the sparse index for {len(found)} files")
 
 def process_rag():
     if not OPENAI_API_KEY:
@@ -21,80 +78,143 @@ def process_rag():
         return
 
     print("Starting RAG processing...")
-    
-    # 1. Load Documents
-    documents = []
+
+    # 1. Find source files
     # simple glob for txt files, can be expanded
     file_paths = glob.glob(os.path.join(DATA_DIR, "*"))
-    
-    if not file_paths:
-        print(f"No files found in {DATA_DIR}")
-        return
-
+    supported = []
     for file_path in file_paths:
-        try:
-            # Using Unstructured for versatility if available, else TextLoader
-            if file_path.endswith(".txt"):
-                loader = TextLoader(file_path)
-            else:
-                # Fallback or specific loaders can be added here
-                print(f"Skipping unsupported file type: {file_path}")
-                continue
-                
-            docs = loader.load()
-            # Add metadata if needed
-            for doc in docs:
-                doc.metadata["source"] = os.path.basename(file_path)
-            documents.extend(docs)
-            print(f"Loaded {len(docs)} documents from {file_path}")
-        except Exception as e:
-            print(f"Error loading {file_path}: {e}")
+        if file_path.endswith(".txt"):
+            supported.append(file_path)
+        else:
+            # Fallback or specific loaders can be added here
+            print(f"Skipping unsupported file type: {file_path}")
 
-    if not documents:
-        print("No valid documents to process.")
-        return
+    # 2. Compare against the manifest: only new/changed files get embedded
+    manifest = Manifest(RAG_MANIFEST)
+    fingerprint = config_fingerprint(RAG_CONFIG)
+    current = {os.path.basename(p) for p in supported}
+    removed = [key for key in manifest.entries if key not in current]
+    pending = []
+    refreshed = {}
+    for file_path in supported:
+        key = os.path.basename(file_path)
+        status, source, entry = manifest.classify(key, file_path, fingerprint)
+        if entry:
+            refreshed[key] = entry
+        if status != "unchanged":
+            pending.append((file_path, source))
+    manifest.update(refreshed)
 
-    # 2. Split Text
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200
-    )
-    texts = text_splitter.split_documents(documents)
-    print(f"Split into {len(texts)} chunks.")
-
-    # 3. Embed and Store in Qdrant
-    embeddings_kwargs = {"openai_api_key": OPENAI_API_KEY}
-    if OPENAI_BASE_URL:
-        embeddings_kwargs["openai_api_base"] = OPENAI_BASE_URL
-    embeddings = OpenAIEmbeddings(**embeddings_kwargs)
-    
     try:
+        from qdrant_client import QdrantClient
         from qdrant_client.http import models
-        # 1. Initialize the native Qdrant client
-        client = QdrantClient(url=QDRANT_URL)
-        
-        # 2. Check and Create collection if it doesn't exist
-        # If it EXISTS, we DO NOT recreate it, effectively making this an "Append" operation
-        if not client.collection_exists("rag_documents"):
-            print("Creating new collection: rag_documents")
+        # Initialize the native Qdrant client (same URL / gRPC settings as the app)
+        client = QdrantClient(**vector_store.client_kwargs())
+        # BM25 index used by the hybrid retriever; kept in step with the collection
+        sparse = SparseIndex.load()
+
+        # Create the collection if it doesn't exist. A missing collection means the
+        # manifest is stale (e.g. Qdrant was reset), so every file is re-indexed.
+        if not client.collection_exists(COLLECTION_NAME):
+            print(f"Creating new collection: {COLLECTION_NAME}")
             client.create_collection(
-                collection_name="rag_documents",
+                collection_name=COLLECTION_NAME,
                 vectors_config=models.VectorParams(size=1536, distance=models.Distance.COSINE),
             )
-        else:
-            print("Collection 'rag_documents' already exists. Adding new data...")
-        
-        # 3. Initialize the LangChain Qdrant wrapper
-        qdrant = Qdrant(
-            client=client,
-            collection_name="rag_documents",
-            embeddings=embeddings
+            manifest.remove_many(list(manifest.entries))
+            sparse = SparseIndex(sparse.path)
+            removed = []
+            pending = [(p, manifest.classify(os.path.basename(p), p, fingerprint)[1]) for p in supported]
+
+        print(f"{len(pending)} to index, {len(supported) - len(pending)} unchanged, {len(removed)} removed")
+
+        # 3. Delete points of files that no longer exist
+        for key in removed:
+            point_ids = manifest.get(key).get("point_ids", [])
+            if point_ids:
+                client.delete(collection_name=COLLECTION_NAME, points_selector=models.PointIdsList(points=point_ids))
+            sparse.remove_source(key)
+            print(f"Removed {len(point_ids)} chunks of deleted file {key}")
+        manifest.remove_many(removed)
+
+        # Files indexed before the sparse index existed (or whose entry got lost)
+        pending_keys = {os.path.basename(p) for p, _ in pending}
+        missing_sparse = [key for key in manifest.entries if key not in sparse.sources and key not in pending_keys]
+        if missing_sparse:
+            backfill_sparse(client, sparse, missing_sparse)
+        if removed or missing_sparse or not os.path.exists(sparse.path):
+            sparse.save()
+
+        if not pending:
+            print("No new or changed documents to process.")
+            return
+
+        # 4. Stream load -> split -> batch embed -> bulk upsert.
+        # Point ids derive from (source, chunk index, content hash), so re-running after
+        # a failure overwrites the same points instead of duplicating them.
+        # The splitter (langchain) is only imported when there is something to split
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=RAG_CONFIG["chunk_size"],
+            chunk_overlap=RAG_CONFIG["chunk_overlap"]
         )
-        
-        # 4. Add the documents (Incremental)
-        qdrant.add_documents(texts)
-        
-        print(f"Successfully indexed {len(texts)} chunks to Qdrant. Total documents processed in this batch: {len(file_paths)}")
+        files = {}
+        indexed_files = []
+        # Finished files are written to the manifest in batches (one file rewrite per flush, not per file)
+        finished = {}
+        last_flush = time.monotonic()
+
+        def flush_manifest():
+            nonlocal last_flush
+            manifest.update(finished)
+            finished.clear()
+            last_flush = time.monotonic()
+
+        def finalize(key):
+            state = files[key]
+            if state["failed"]:
+                print(f"Failed to index {key}; it will be retried on the next run")
+                return
+            # Drop points of the previous version that the new chunks didn't overwrite
+            new_ids = set(state["point_ids"])
+            stale_ids = [pid for pid in (manifest.get(key) or {}).get("point_ids", []) if pid not in new_ids]
+            if stale_ids:
+                client.delete(collection_name=COLLECTION_NAME, points_selector=models.PointIdsList(points=stale_ids))
+            sparse.set_source(key, state.pop("sparse"))
+            finished[key] = {**state["source"], "config": fingerprint, "point_ids": state["point_ids"]}
+            indexed_files.append(key)
+            print(f"Indexed {len(new_ids)} chunks from {key}")
+
+        def on_batch_done(batch, error):
+            for chunk in batch:
+                state = files[chunk.source]
+                state["remaining"] -= 1
+                if error is not None:
+                    state["failed"] = True
+                if state["remaining"] == 0:
+                    finalize(chunk.source)
+            if time.monotonic() - last_flush >= MANIFEST_FLUSH_S:
+                flush_manifest()
+
+        async def run():
+            try:
+                await ingest(
+                    iter_chunks(pending, text_splitter, files, finalize),
+                    client,
+                    COLLECTION_NAME,
+                    stats,
+                    on_batch_done=on_batch_done,
+                )
+            finally:
+                sparse.save()
+                flush_manifest()
+                await llm_client.close_client()
+
+        stats = IngestStats()
+        asyncio.run(run())
+
+        print(f"Successfully indexed {len(indexed_files)}/{len(pending)} files: {stats.summary()}")
     except Exception as e:
         print(f"Error connecting to Qdrant or indexing: {e}")
 
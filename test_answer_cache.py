@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.answer_cache import AnswerCache, facets
+
+
+def test_facets():
+    assert facets("What was AAPL's Q3 2023 revenue?") == facets("AAPL revenue for 3Q 2023")
+    assert facets("台積電 2023 年第三季營收") == facets("台積電 2023 Q3 營收")
+    assert facets("Revenue in 2023") != facets("Revenue in 2022")
+    assert facets("Net income of 1,234.5 million") == "1234.5"
+
+
+def test_semantic_hit_requires_matching_facets():
+    cache = AnswerCache(similarity=0.9)
+    embedding = np.ones(4, dtype=np.float32) / 2
+    cache.put("rag", "What was revenue in 2023?", "v1", "2023 answer", ["a.txt"], 1.0, embedding)
+
+    assert cache.get_semantic("rag", "Revenue for 2023", "v1", embedding)[0] == "2023 answer"
+    assert cache.get_semantic("rag", "What was revenue in 2022?", "v1", embedding) is None
+
+
+def test_new_index_version_drops_old_entries():
+    cache = AnswerCache()
+    cache.put("rag", "q1", "v1", "old", ["a.txt"], 1.0)
+    cache.put("find_document", "q1", "v1", "other tool", ["b.pdf"], 1.0)
+
+    assert cache.get("rag", "q2", "v2") is None
+    assert cache.counters["invalidations"] == 1
+    assert cache.stats()["entries"] == 1
+    assert cache.get("find_document", "q1", "v1")[0] == "other tool"
+
+
+if __name__ == "__main__":
+    test_facets()
+    test_semantic_hit_requires_matching_facets()
+    test_new_index_version_drops_old_entries()
+    print("answer cache: ok")
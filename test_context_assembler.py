@@ -0,0 +1,75 @@
+import os
+import sys
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.context_assembler import assemble, merge_ranges
+from app.services.tokens import count_tokens
+
+
+def node(title: str, start: int, end: int):
+    return {"title": title, "start_index": start, "end_index": end}
+
+
+def pages(texts):
+    """PageLoader over ``{doc_name: [page 1 text, page 2 text, ...]}``."""
+    def load(doc_name, start, end):
+        return texts[doc_name][start - 1:end]
+    return load
+
+
+def test_merge_ranges():
+    merged = merge_ranges([node("B", 5, 6), node("A", 1, 3), node("C", 4, 4), node("D", 10, 9),
+                           {"title": "no pages"}])
+    assert [(m["start"], m["end"]) for m in merged] == [(1, 6), (9, 10)]
+    assert merged[0]["titles"] == ["A", "C", "B"]
+    assert merged[0]["rank"] == 0
+    assert merged[1]["titles"] == ["D"] and merged[1]["rank"] == 3
+
+
+def test_each_page_is_loaded_once():
+    calls = []
+
+    def load(doc_name, start, end):
+        calls.append((start, end))
+        return [f"page {p}" for p in range(start, end + 1)]
+
+    report = assemble("page", [("doc", [node("A", 1, 3), node("B", 2, 4)])], load)
+    assert calls == [(1, 4)]
+    assert report["pages_total"] == report["pages_used"] == 4
+
+
+def test_budget_keeps_the_most_relevant_pages():
+    texts = {"doc": ["revenue grew to 100 million " * 5, "unrelated text about offices " * 5,
+                     "revenue by region " * 5]}
+    page_tokens = max(count_tokens(t) for t in texts["doc"])
+    report = assemble("revenue", [("doc", [node("All", 1, 3)])], pages(texts), budget=2 * page_tokens)
+
+    assert report["tokens_used"] <= report["budget"]
+    assert report["pages_used"] == 2
+    assert "offices" not in report["text"]
+    assert report["tokens_dropped"] == report["tokens_total"] - report["tokens_used"]
+
+
+def test_every_document_gets_its_best_chunk():
+    texts = {"dense": ["revenue revenue revenue " * 10] * 3, "sparse": ["one mention of revenue"]}
+    budget = count_tokens(texts["dense"][0]) + count_tokens(texts["sparse"][0])
+    report = assemble("revenue", [("dense", [node("A", 1, 3)]), ("sparse", [node("B", 1, 1)])],
+                      pages(texts), budget=budget)
+    assert report["sources"] == ["dense.pdf", "sparse.pdf"]
+
+
+def test_oversized_chunk_is_truncated():
+    report = assemble("x", [("doc", [node("A", 1, 1)])], pages({"doc": ["x " * 400]}), budget=10)
+    assert report["chunks_used"] == 1
+    assert 0 < report["tokens_used"] <= 10
+
+
+if __name__ == "__main__":
+    test_merge_ranges()
+    test_each_page_is_loaded_once()
+    test_budget_keeps_the_most_relevant_pages()
+    test_every_document_gets_its_best_chunk()
+    test_oversized_chunk_is_truncated()
+    print("context assembler: ok")
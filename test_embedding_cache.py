@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.embedding_cache import EmbeddingStore, text_digest
+
+
+def vector(seed: int, dim: int = 8) -> np.ndarray:
+    return np.random.default_rng(seed).random(dim, dtype=np.float32)
+
+
+def test_torn_index_tail():
+    """A digest cut short by a crash must not misalign the digests appended after it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(tmp, "model")
+        store.append([text_digest("a")], [vector(1)], max_bytes=1e9)
+        # Simulate a crash in the middle of writing the next digest
+        with open(store.index_path, "ab") as f:
+            f.write(text_digest("torn")[:10])
+
+        writer = EmbeddingStore(tmp, "model")
+        assert writer.append([text_digest("b")], [vector(2)], max_bytes=1e9) == (1, 0)
+
+        reader = EmbeddingStore(tmp, "model")
+        found = reader.get([text_digest("a"), text_digest("b"), text_digest("torn")])
+        assert np.array_equal(found[0], vector(1))
+        assert np.array_equal(found[1], vector(2))
+        assert found[2] is None
+        assert len(reader) == 2
+
+
+def test_torn_vector_tail():
+    """Vector rows written without their digests are overwritten by the next append."""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EmbeddingStore(tmp, "model")
+        store.append([text_digest("a")], [vector(1)], max_bytes=1e9)
+        with open(store.data_path, "ab") as f:
+            f.write(vector(99).tobytes()[:13])
+
+        store.append([text_digest("b")], [vector(2)], max_bytes=1e9)
+        found = EmbeddingStore(tmp, "model").get([text_digest("a"), text_digest("b")])
+        assert np.array_equal(found[0], vector(1))
+        assert np.array_equal(found[1], vector(2))
+
+
+if __name__ == "__main__":
+    test_torn_index_tail()
+    test_torn_vector_tail()
+    print("embedding cache: ok")
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.hybrid_search import dedup_chunks, rrf_fuse
+from app.services.sparse_index import SparseIndex, tokenize
+
+
+def corpus() -> SparseIndex:
+    return SparseIndex("unused.json", {
+        "tsmc.txt": [
+            {"id": "t0", "index": 0, "text": "台積電 2023 年營收為 2,161.7 億元"},
+            {"id": "t1", "index": 1, "text": "台積電的先進製程包含 N3E"},
+        ],
+        "notes.txt": [
+            {"id": "n0", "index": 0, "text": "Revenue grew in 2022 across all segments"},
+        ],
+    })
+
+
+def test_tokenize():
+    assert tokenize("Revenue 1,234.5 N3E") == ["revenue", "1234.5", "n3e"]
+    assert tokenize("營收成長") == ["營收", "收成", "成長"]
+
+
+def test_bm25_search_matches_exact_terms():
+    index = corpus()
+    hits = index.search("N3E 製程", 10)
+    assert [chunk["id"] for chunk, _ in hits] == ["t1"]
+    assert [chunk["id"] for chunk, _ in index.search("2023 營收", 1)] == ["t0"]
+    assert index.search("nothing matches", 5) == []
+
+    scores = index.score_ids("revenue 2022", ["n0", "t0", "missing"])
+    assert scores["n0"] > 0 and scores["t0"] == 0 and scores["missing"] == 0
+
+
+def test_sparse_index_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = corpus()
+        index.path = os.path.join(tmp, "sparse_index.json")
+        index.remove_source("notes.txt")
+        index.save()
+        loaded = SparseIndex.load(index.path)
+        assert len(loaded) == 2
+        assert loaded.search("N3E", 5)[0][0]["source"] == "tsmc.txt"
+
+
+def test_rrf_fuse():
+    fused = rrf_fuse([["a", "b", "c"], ["c", "a"]], k=60)
+    assert fused["a"] == 1 / 61 + 1 / 62
+    assert fused["b"] == 1 / 62
+    assert sorted(fused, key=lambda i: -fused[i]) == ["a", "c", "b"]
+
+
+def test_dedup_merges_overlapping_neighbours():
+    chunks = [
+        {"text": "alpha beta gamma", "source": "a.txt", "chunk_index": 0},
+        {"text": "gamma delta", "source": "a.txt", "chunk_index": 1},
+        {"text": "gamma delta", "source": "b.txt", "chunk_index": 5},
+    ]
+    merged = dedup_chunks(chunks, max_overlap=10)
+    assert len(merged) == 1
+    assert merged[0]["text"] == "alpha beta gamma delta"
+    assert merged[0]["chunks"] == [0, 1]
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_bm25_search_matches_exact_terms()
+    test_sparse_index_round_trip()
+    test_rrf_fuse()
+    test_dedup_merges_overlapping_neighbours()
+    print("hybrid search: ok")
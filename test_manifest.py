@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.manifest import Manifest
+
+
+def write(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_classify_new_changed_unchanged():
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, "a.txt")
+        write(source_path, "hello")
+        manifest = Manifest(os.path.join(tmp, "manifest.json"))
+
+        status, source, refreshed = manifest.classify("a.txt", source_path, "cfg")
+        assert (status, refreshed) == ("new", None)
+        manifest.set("a.txt", {**source, "config": "cfg"})
+
+        assert manifest.classify("a.txt", source_path, "cfg")[0] == "unchanged"
+        assert manifest.classify("a.txt", source_path, "other-cfg")[0] == "changed"
+
+        write(source_path, "hello, world")
+        assert manifest.classify("a.txt", source_path, "cfg")[0] == "changed"
+
+
+def test_classify_touched_file_is_not_persisted():
+    """A touched but identical file is reported unchanged; the refreshed entry is left to the caller."""
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, "a.txt")
+        manifest_path = os.path.join(tmp, "manifest.json")
+        write(source_path, "hello")
+        manifest = Manifest(manifest_path)
+        manifest.set("a.txt", {**manifest.classify("a.txt", source_path, "cfg")[1], "config": "cfg", "point_ids": [1]})
+
+        st = os.stat(source_path)
+        os.utime(source_path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        status, _, refreshed = manifest.classify("a.txt", source_path, "cfg")
+        assert status == "unchanged"
+        assert refreshed["mtime_ns"] == st.st_mtime_ns + 10**9
+        assert refreshed["point_ids"] == [1]
+        assert Manifest(manifest_path).get("a.txt")["mtime_ns"] == st.st_mtime_ns
+
+        manifest.update({"a.txt": refreshed})
+        assert manifest.classify("a.txt", source_path, "cfg")[2] is None
+
+
+def test_update_merges_with_other_writers():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "manifest.json")
+        first, second = Manifest(path), Manifest(path)
+        first.update({"a": {"content_hash": "1"}, "b": {"content_hash": "2"}})
+        second.update({"c": {"content_hash": "3"}})
+        assert sorted(Manifest(path).entries) == ["a", "b", "c"]
+
+        first.remove_many(["a", "c", "missing"])
+        assert sorted(Manifest(path).entries) == ["b"]
+        first.update({})
+        assert sorted(Manifest(path).entries) == ["b"]
+
+
+if __name__ == "__main__":
+    test_classify_new_changed_unchanged()
+    test_classify_touched_file_is_not_persisted()
+    test_update_merges_with_other_writers()
+    print("manifest: ok")
@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import tempfile
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from openai.types.chat import ChatCompletion
+
+from app.services.index_scheduler import CallJournal
+from app.services.rate_limiter import TokenBucket
+
+
+def levels(bucket: TokenBucket):
+    with bucket._state() as state:
+        return list(state)
+
+
+def completion(text: str) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+    })
+
+
+def test_acquire_and_settle():
+    with tempfile.TemporaryDirectory() as tmp:
+        bucket = TokenBucket(os.path.join(tmp, "bucket.state"), requests_per_min=60, tokens_per_min=1000)
+        assert bucket.acquire(300) == 0.0
+        requests, tokens = levels(bucket)[:2]
+        assert round(requests) == 59 and 699 <= tokens <= 701
+
+        # The response used less than estimated: the difference is given back
+        bucket.settle(300, 100)
+        assert 899 <= levels(bucket)[1] <= 901
+
+
+def test_oversized_request_is_charged_the_whole_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        bucket = TokenBucket(os.path.join(tmp, "bucket.state"), requests_per_min=60, tokens_per_min=1000)
+        assert bucket.acquire(5000) == 0.0
+        assert levels(bucket)[1] < 2
+        # Settled against the clamped charge, not the raw estimate
+        bucket.settle(5000, 1000)
+        assert levels(bucket)[1] < 2
+
+
+def test_pause_is_shared_through_the_state_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bucket.state")
+        TokenBucket(path, requests_per_min=6000, tokens_per_min=1000).pause(0.2)
+        other = TokenBucket(path, requests_per_min=6000, tokens_per_min=1000)
+        started = time.time()
+        other.acquire(10)
+        assert time.time() - started >= 0.15
+
+
+def test_call_journal_replays_in_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "doc.pdf.jsonl")
+        key = CallJournal.request_key({"model": "gpt-4o", "messages": [{"role": "user", "content": "toc?"}],
+                                       "timeout": 30})
+        assert key == CallJournal.request_key({"messages": [{"role": "user", "content": "toc?"}], "model": "gpt-4o"})
+
+        journal = CallJournal(path)
+        for text in ("first", "second"):
+            n, recorded = journal.lookup(key)
+            assert recorded is None
+            journal.record(key, n, completion(text))
+        # A crash in the middle of the next record
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "n": 2})[:20])
+
+        resumed = CallJournal(path)
+        assert len(resumed) == 2
+        assert resumed.lookup(key)[1].choices[0].message.content == "first"
+        assert resumed.lookup(key)[1].choices[0].message.content == "second"
+        assert resumed.lookup(key) == (2, None)
+        assert resumed.replayed == 2
+
+        resumed.discard()
+        assert not os.path.exists(path)
+
+
+if __name__ == "__main__":
+    test_acquire_and_settle()
+    test_oversized_request_is_charged_the_whole_budget()
+    test_pause_is_shared_through_the_state_file()
+    test_call_journal_replays_in_order()
+    print("rate limiter: ok")
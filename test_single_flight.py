@@ -0,0 +1,80 @@
+import os
+import sys
+import asyncio
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import events
+from app.services.single_flight import SingleFlight
+
+
+def pipeline(calls, release: asyncio.Event, fail: bool = False):
+    async def stream():
+        calls.append(1)
+        yield events.stage("retrieved", count=1)
+        await release.wait()
+        if fail:
+            raise RuntimeError("pipeline failed")
+        yield events.token("answer")
+        yield events.sources(["a.pdf"])
+    return stream
+
+
+async def drain(flights: SingleFlight, key, factory):
+    return [event async for event in flights.run(key, factory)]
+
+
+def test_concurrent_requests_share_one_run():
+    async def scenario():
+        flights, calls, release = SingleFlight(), [], asyncio.Event()
+        first = asyncio.create_task(drain(flights, "q", pipeline(calls, release)))
+        await asyncio.sleep(0)
+        # Joins after the first event was produced: it is replayed
+        second = asyncio.create_task(drain(flights, "q", pipeline(calls, release)))
+        await asyncio.sleep(0)
+        assert flights.stats()["in_flight"] == 1
+        release.set()
+        return calls, await first, await second, flights
+
+    calls, first, second, flights = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first == second
+    assert [e["event"] for e in first] == ["retrieved", "token", "sources"]
+    assert flights.stats()["coalesced"] == 1 and flights.stats()["in_flight"] == 0
+
+
+def test_errors_reach_every_subscriber():
+    async def scenario():
+        flights, calls, release = SingleFlight(), [], asyncio.Event()
+        factory = pipeline(calls, release, fail=True)
+        runs = [asyncio.create_task(drain(flights, "q", factory)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return calls, await asyncio.gather(*runs, return_exceptions=True)
+
+    calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_overflow_runs_on_its_own():
+    async def scenario():
+        flights, calls, release = SingleFlight(max_size=1), [], asyncio.Event()
+        release.set()
+        first = asyncio.create_task(drain(flights, "a", pipeline(calls, asyncio.Event())))
+        await asyncio.sleep(0)
+        second = await drain(flights, "b", pipeline(calls, release))
+        first.cancel()
+        return second, flights
+
+    second, flights = asyncio.run(scenario())
+    assert [e["event"] for e in second] == ["retrieved", "token", "sources"]
+    assert flights.stats()["overflow"] == 1
+
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_one_run()
+    test_errors_reach_every_subscriber()
+    test_overflow_runs_on_its_own()
+    print("single flight: ok")
@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import structure_store
+from app.services.structure_store import StructureFile
+
+DOCUMENT = {
+    "doc_name": "report.pdf",
+    "doc_description": "年度報告",
+    "structure": [
+        {"title": "Overview", "node_id": "0000", "start_index": 1, "end_index": 2, "nodes": []},
+        {"title": "Financials", "node_id": "0001", "start_index": 3, "end_index": 9, "summary": "營收與獲利",
+         "nodes": [
+             {"title": "Revenue", "node_id": "0002", "start_index": 3, "end_index": 5},
+             {"title": "Costs", "node_id": "0003", "start_index": 6, "end_index": 9, "nodes": [
+                 {"title": "R&D", "node_id": "0004", "start_index": 8, "end_index": 9},
+             ]},
+         ]},
+    ],
+}
+
+
+def round_trip(data):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = structure_store.write(os.path.join(tmp, "doc_structure.pidx"), data)
+        store = StructureFile(path)
+        try:
+            return store.to_json_data()
+        finally:
+            store.close()
+
+
+def test_round_trip_keeps_every_shape():
+    assert round_trip(DOCUMENT) == DOCUMENT
+    assert round_trip(DOCUMENT["structure"]) == DOCUMENT["structure"]
+    assert round_trip(DOCUMENT["structure"][1]) == DOCUMENT["structure"][1]
+    assert round_trip([]) == []
+
+
+def test_lazy_access_and_subtree():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = StructureFile(structure_store.write(os.path.join(tmp, "doc_structure.pidx"), DOCUMENT))
+        try:
+            assert store["doc_description"] == "年度報告"
+            roots = store.roots()
+            assert [r["title"] for r in roots] == ["Overview", "Financials"]
+            assert "nodes" not in roots[1] and roots[1].child_count == 2
+            assert [c["title"] for c in roots[1].children()] == ["Revenue", "Costs"]
+            assert roots[0].children() == []
+
+            assert store.subtree("0003") == DOCUMENT["structure"][1]["nodes"][1]
+            assert store.subtree("0004") == {"title": "R&D", "node_id": "0004", "start_index": 8, "end_index": 9}
+            assert store.subtree("9999") is None
+        finally:
+            store.close()
+
+
+def test_rejects_other_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "not_a_structure.pidx")
+        with open(path, "wb") as f:
+            f.write(b"{}" * 32)
+        try:
+            StructureFile(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("expected ValueError")
+
+
+if __name__ == "__main__":
+    test_round_trip_keeps_every_shape()
+    test_lazy_access_and_subtree()
+    test_rejects_other_files()
+    print("structure store: ok")
@@ -0,0 +1,98 @@
+import os
+import sys
+import asyncio
+import tempfile
+from contextlib import contextmanager
+
+# 確保能讀取到 app 目錄
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import uploads
+from app.services.uploads import UploadRejected
+
+BOUNDARY = "testboundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def body(filename: str, content: bytes, field: str = "file") -> bytes:
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n").encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@contextmanager
+def upload_store():
+    """Point the upload store at a temp directory for the duration of a test."""
+    saved = uploads.UPLOAD_STORE_DIR, uploads.UPLOAD_MAX_MB
+    with tempfile.TemporaryDirectory() as tmp:
+        uploads.UPLOAD_STORE_DIR = tmp
+        try:
+            yield tmp
+        finally:
+            uploads.UPLOAD_STORE_DIR, uploads.UPLOAD_MAX_MB = saved
+
+
+def rejected(data: bytes, content_type: str = CONTENT_TYPE, content_length=None) -> UploadRejected:
+    try:
+        asyncio.run(uploads.receive(chunks(data), content_type, content_length))
+    except UploadRejected as e:
+        return e
+    raise AssertionError("upload was accepted")
+
+
+def test_receive_streams_and_hashes():
+    with upload_store() as tmp:
+        upload = asyncio.run(uploads.receive(chunks(body("../../etc/report.pdf", b"%PDF-1.7 data")), CONTENT_TYPE))
+        assert upload.filename == "report.pdf"
+        assert upload.size == len(b"%PDF-1.7 data")
+        with open(upload.path, "rb") as f:
+            assert f.read() == b"%PDF-1.7 data"
+        upload.discard()
+        assert os.listdir(tmp) == []
+
+
+def test_rejection_paths_leave_nothing_behind():
+    with upload_store() as tmp:
+        assert rejected(body("notes.txt", b"hello")).status_code == 400
+        assert rejected(body(".hidden.pdf", b"%PDF-")).status_code == 400
+        assert rejected(body("a.pdf", b"%PDF-"), content_type="application/pdf").status_code == 400
+        assert rejected(body("a.pdf", b"%PDF-", field="other")).status_code == 400
+        assert rejected(body("a.pdf", b"%PDF-")[:-30]).status_code == 400
+
+        uploads.UPLOAD_MAX_MB = 0.001
+        assert rejected(body("big.pdf", b"x" * 2048)).status_code == 413
+        assert rejected(b"", content_length=str(10 ** 9)).status_code == 413
+        assert os.listdir(tmp) == []
+
+
+def test_validate_pdf_rejects_non_pdfs():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fake.pdf")
+        with open(path, "wb") as f:
+            f.write(b"just text")
+        try:
+            uploads.validate_pdf(path)
+        except UploadRejected as e:
+            assert e.status_code == 400 and "%PDF-" in str(e)
+        else:
+            raise AssertionError("expected UploadRejected")
+
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.7\nbroken")
+        try:
+            uploads.validate_pdf(path)
+        except UploadRejected as e:
+            assert e.status_code == 400
+        else:
+            raise AssertionError("expected UploadRejected")
+
+
+if __name__ == "__main__":
+    test_receive_streams_and_hashes()
+    test_rejection_paths_leave_nothing_behind()
+    test_validate_pdf_rejects_non_pdfs()
+    print("uploads: ok")